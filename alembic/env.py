@@ -20,9 +20,10 @@ from source.database.models import BaseDbModel
 from source.modules.user.models import Users
 from source.modules.PatientProfile.model import PatientProfile
 from source.modules.symptoms.model import SymptomEntry
-from source.modules.matching.model import TrialMatch
+from source.modules.matching.model import TrialMatch, TrialSnapshot, MatchFeedItem
 from source.modules.trails.model import Trial
 from source.modules.chatbot.model import ChatbotMessage, AIChatSession
+from source.coalesce.model import SearchFlight
 
 # ---------------------------------------------------------------------
 # Alembic configuration setup
@@ -0,0 +1,69 @@
+"""extend trials table for the ClinicalTrials.gov mirror
+
+Revision ID: 7a1c2e9b4d10
+Revises: 141da600c17e
+Create Date: 2026-10-16 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a1c2e9b4d10'
+down_revision: Union[str, Sequence[str], None] = '141da600c17e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('trials', sa.Column('brief_title', sa.Text(), nullable=True))
+    op.add_column('trials', sa.Column('summary', sa.Text(), nullable=True))
+    op.add_column('trials', sa.Column('conditions', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.add_column('trials', sa.Column('phase', sa.String(length=100), nullable=True))
+    op.add_column('trials', sa.Column('study_type', sa.String(length=50), nullable=True))
+    op.add_column('trials', sa.Column('sponsor', sa.String(length=255), nullable=True))
+    op.add_column('trials', sa.Column('city', sa.String(length=255), nullable=True))
+    op.add_column('trials', sa.Column('state', sa.String(length=255), nullable=True))
+    op.add_column('trials', sa.Column('country', sa.String(length=255), nullable=True))
+    op.add_column('trials', sa.Column('sites', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.add_column('trials', sa.Column('last_update_date', sa.Date(), nullable=True))
+    op.add_column(
+        'trials',
+        sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                "to_tsvector('english', coalesce(title, '') || ' ' || coalesce(summary, '') "
+                "|| ' ' || coalesce(conditions::text, ''))",
+                persisted=True,
+            ),
+            nullable=True,
+        ),
+    )
+    op.create_index('ix_trials_search_vector', 'trials', ['search_vector'], unique=False, postgresql_using='gin')
+
+    # The 50 dummy rows seeded by 64370c984b91 (NCT100001..NCT100050) would
+    # otherwise be served as real search results from the mirror.
+    op.execute("DELETE FROM trials WHERE nct_id ~ '^NCT1000[0-5][0-9]$' AND summary IS NULL")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_trials_search_vector', table_name='trials')
+    op.drop_column('trials', 'search_vector')
+    op.drop_column('trials', 'last_update_date')
+    op.drop_column('trials', 'sites')
+    op.drop_column('trials', 'country')
+    op.drop_column('trials', 'state')
+    op.drop_column('trials', 'city')
+    op.drop_column('trials', 'sponsor')
+    op.drop_column('trials', 'study_type')
+    op.drop_column('trials', 'phase')
+    op.drop_column('trials', 'conditions')
+    op.drop_column('trials', 'summary')
+    op.drop_column('trials', 'brief_title')
@@ -0,0 +1,38 @@
+"""add trials.content_hash and trial_sync_state
+
+Revision ID: b3f81d0c6a52
+Revises: 7a1c2e9b4d10
+Create Date: 2026-10-16 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f81d0c6a52'
+down_revision: Union[str, Sequence[str], None] = '7a1c2e9b4d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('trials', sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+    op.create_table(
+        'trial_sync_state',
+        sa.Column('name', sa.String(length=64), nullable=False, primary_key=True),
+        sa.Column('watermark', sa.Date(), nullable=True),
+        sa.Column('last_run_at', sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('last_report', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('trial_sync_state')
+    op.drop_column('trials', 'content_hash')
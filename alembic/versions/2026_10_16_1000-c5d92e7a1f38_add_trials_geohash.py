@@ -0,0 +1,77 @@
+"""add trials.geohash with a B-tree index
+
+Revision ID: c5d92e7a1f38
+Revises: b3f81d0c6a52
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+import math
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d92e7a1f38'
+down_revision: Union[str, Sequence[str], None] = 'b3f81d0c6a52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+# Frozen copy of the geohash encoder at this revision (trails/geo.py may change)
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+
+
+def _cell_index(value: float, lo: float, span: float, bits: int) -> int:
+    n = 1 << bits
+    return min(max(int(math.floor((value - lo) / span * n)), 0), n - 1)
+
+
+def geohash_encode(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    """
+    Standard geohash of a point: grid indexes interleaved, longitude first.
+    """
+    total = 5 * precision
+    lat_bits, lng_bits = total // 2, (total + 1) // 2
+    lat_idx = _cell_index(lat, -90.0, 180.0, lat_bits)
+    lng_idx = _cell_index(lng, -180.0, 360.0, lng_bits)
+    value = 0
+    for b in range(total):
+        if b % 2 == 0:
+            bit = (lng_idx >> (lng_bits - 1 - b // 2)) & 1
+        else:
+            bit = (lat_idx >> (lat_bits - 1 - b // 2)) & 1
+        value = (value << 1) | bit
+    return "".join(
+        GEOHASH_BASE32[(value >> (5 * (precision - 1 - c))) & 31] for c in range(precision)
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('trials', sa.Column('geohash', sa.String(length=12, collation='C'), nullable=True))
+
+    # Backfill existing geocoded rows before building the index
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        "SELECT id, latitude, longitude FROM trials "
+        "WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+    )).fetchall()
+    update = sa.text("UPDATE trials SET geohash = :geohash WHERE id = :id")
+    for start in range(0, len(rows), BACKFILL_BATCH_SIZE):
+        batch = rows[start:start + BACKFILL_BATCH_SIZE]
+        bind.execute(update, [
+            {"id": row_id, "geohash": geohash_encode(lat, lng)}
+            for row_id, lat, lng in batch
+        ])
+
+    op.create_index('ix_trials_geohash', 'trials', ['geohash'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_trials_geohash', table_name='trials')
+    op.drop_column('trials', 'geohash')
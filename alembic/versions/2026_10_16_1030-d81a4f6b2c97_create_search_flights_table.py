@@ -0,0 +1,38 @@
+"""create search_flights table
+
+Revision ID: d81a4f6b2c97
+Revises: c5d92e7a1f38
+Create Date: 2026-10-16 10:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd81a4f6b2c97'
+down_revision: Union[str, Sequence[str], None] = 'c5d92e7a1f38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'search_flights',
+        sa.Column('key', sa.String(length=64), nullable=False, primary_key=True),
+        sa.Column('owner', sa.String(length=128), nullable=False),
+        sa.Column('state', sa.String(length=16), nullable=False),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.Column('started_at', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('expires_at', sa.TIMESTAMP(timezone=True), nullable=False),
+    )
+    op.create_index('ix_search_flights_expires_at', 'search_flights', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_search_flights_expires_at', table_name='search_flights')
+    op.drop_table('search_flights')
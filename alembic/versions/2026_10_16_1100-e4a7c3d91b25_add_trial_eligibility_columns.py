@@ -0,0 +1,42 @@
+"""add structured eligibility columns to trials
+
+Existing rows stay NULL (= no limit) until their studies are ingested
+again, e.g. `python -m source.modules.trails.ingest --api`.
+
+Revision ID: e4a7c3d91b25
+Revises: d81a4f6b2c97
+Create Date: 2026-10-16 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a7c3d91b25'
+down_revision: Union[str, Sequence[str], None] = 'd81a4f6b2c97'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('trials', sa.Column('min_age_years', sa.Float(), nullable=True))
+    op.add_column('trials', sa.Column('max_age_years', sa.Float(), nullable=True))
+    op.add_column('trials', sa.Column('sex', sa.String(length=8), nullable=True))
+    op.add_column('trials', sa.Column('healthy_volunteers', sa.Boolean(), nullable=True))
+    op.add_column('trials', sa.Column('inclusion_keywords', postgresql.ARRAY(sa.Text()), nullable=True))
+    op.add_column('trials', sa.Column('exclusion_keywords', postgresql.ARRAY(sa.Text()), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('trials', 'exclusion_keywords')
+    op.drop_column('trials', 'inclusion_keywords')
+    op.drop_column('trials', 'healthy_volunteers')
+    op.drop_column('trials', 'sex')
+    op.drop_column('trials', 'max_age_years')
+    op.drop_column('trials', 'min_age_years')
@@ -0,0 +1,34 @@
+"""add patient_profiles.feature_vector
+
+Existing profiles get their vector on their next save or search.
+
+Revision ID: f19b6d2e8a40
+Revises: e4a7c3d91b25
+Create Date: 2026-10-16 11:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f19b6d2e8a40'
+down_revision: Union[str, Sequence[str], None] = 'e4a7c3d91b25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'patient_profiles',
+        sa.Column('feature_vector', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('patient_profiles', 'feature_vector')
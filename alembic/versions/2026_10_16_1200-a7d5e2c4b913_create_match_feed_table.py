@@ -0,0 +1,50 @@
+"""create match_feed table
+
+New-matches feed written by the nightly re-matching job, plus an index
+on trials.modified_at for its delta query.
+
+Revision ID: a7d5e2c4b913
+Revises: f19b6d2e8a40
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d5e2c4b913'
+down_revision: Union[str, Sequence[str], None] = 'f19b6d2e8a40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'match_feed',
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('user_id', sa.UUID(), nullable=False),
+        sa.Column('nct_id', sa.String(length=20), nullable=False),
+        sa.Column('matched_query', sa.Text(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('title', sa.Text(), nullable=True),
+        sa.Column('status', sa.String(length=50), nullable=True),
+        sa.Column('location', sa.String(length=255), nullable=True),
+        sa.Column('url', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'nct_id', name='uq_match_feed_user_trial'),
+    )
+    op.create_index('ix_match_feed_user_created', 'match_feed', ['user_id', 'created_at'], unique=False)
+    op.create_index('ix_trials_modified_at', 'trials', ['modified_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_trials_modified_at', table_name='trials')
+    op.drop_index('ix_match_feed_user_created', table_name='match_feed')
+    op.drop_table('match_feed')
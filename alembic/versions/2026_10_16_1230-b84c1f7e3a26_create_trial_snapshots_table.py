@@ -0,0 +1,173 @@
+"""create trial_snapshots table and move matched_trials to references
+
+Existing trial_matches rows are rewritten from full trial dicts to
+snapshot references (downgrade expands them again).
+
+Revision ID: b84c1f7e3a26
+Revises: a7d5e2c4b913
+Create Date: 2026-10-16 12:30:00.000000
+
+"""
+import hashlib
+import json
+from typing import Any, Dict, List, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b84c1f7e3a26'
+down_revision: Union[str, Sequence[str], None] = 'a7d5e2c4b913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 500
+
+# Frozen copy of the snapshot layout at this revision (matching/snapshots.py may change)
+SNAPSHOT_FIELDS = (
+    "nct_id", "title", "status", "phase", "conditions", "sponsor", "location", "city",
+    "state", "country", "google_maps_url", "lat", "lng", "summary", "url", "ai_generated",
+)
+MATCH_FIELDS = ("confidence_score", "score_breakdown", "distance_km", "nearest_site")
+
+
+def _snapshot_hash(payload: Dict[str, Any]) -> str:
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _is_reference(item: Any) -> bool:
+    return isinstance(item, dict) and "snapshot" in item
+
+
+def _score_explanation(query: str, trial: Dict[str, Any]) -> str:
+    title = trial.get("title") or "this trial"
+    loc = trial.get("location") or "various locations"
+    confidence = trial.get("confidence_score") or 0.0
+    return (
+        f"This match, '{title}', appears relevant to your search '{query}'. "
+        f"It is located at {loc}. The match confidence score is "
+        f"{int(confidence * 100)}%, based on similarity between your search "
+        f"and the trial details (title, summary, and conditions)."
+    )
+
+
+def _rewrite_matches(bind, convert) -> None:
+    """
+    Keyset-paginate trial_matches by id and rewrite matched_trials with
+    convert(list of (query_text, matched_trials)) -> new lists.
+    """
+    select_batch = sa.text(
+        "SELECT id, query_text, matched_trials FROM trial_matches "
+        "WHERE matched_trials IS NOT NULL AND (CAST(:after AS uuid) IS NULL OR id > CAST(:after AS uuid)) "
+        "ORDER BY id LIMIT :limit"
+    )
+    update = sa.text(
+        "UPDATE trial_matches SET matched_trials = CAST(:matched_trials AS jsonb) WHERE id = :id"
+    )
+    after = None
+    while True:
+        rows = bind.execute(select_batch, {"after": after, "limit": BACKFILL_BATCH_SIZE}).fetchall()
+        if not rows:
+            return
+        converted = convert(bind, [(query, items) for _, query, items in rows])
+        bind.execute(update, [
+            {"id": row_id, "matched_trials": json.dumps(items, default=str)}
+            for (row_id, _, _), items in zip(rows, converted)
+        ])
+        after = str(rows[-1][0])
+
+
+def _to_references(bind, matches) -> List[List[Dict[str, Any]]]:
+    """
+    Full trial dicts -> references, storing each distinct payload once;
+    lists already holding references are kept as they are.
+    """
+    payloads: Dict[str, Dict[str, Any]] = {}
+    converted = []
+    for _, items in matches:
+        if any(_is_reference(t) for t in items):
+            converted.append(items)
+            continue
+        refs = []
+        for trial in items:
+            payload = {k: trial.get(k) for k in SNAPSHOT_FIELDS}
+            digest = _snapshot_hash(payload)
+            payloads.setdefault(digest, payload)
+            ref = {"snapshot": digest, "nct_id": trial.get("nct_id")}
+            ref.update({k: trial.get(k) for k in MATCH_FIELDS if trial.get(k) is not None})
+            refs.append(ref)
+        converted.append(refs)
+
+    if payloads:
+        bind.execute(
+            sa.text(
+                "INSERT INTO trial_snapshots (content_hash, nct_id, payload, created_at) "
+                "VALUES (:content_hash, :nct_id, CAST(:payload AS jsonb), now()) "
+                "ON CONFLICT (content_hash) DO NOTHING"
+            ),
+            [
+                {
+                    "content_hash": digest,
+                    "nct_id": payload.get("nct_id"),
+                    "payload": json.dumps(payload, default=str),
+                }
+                for digest, payload in payloads.items()
+            ],
+        )
+    return converted
+
+
+def _to_full_trials(bind, matches) -> List[List[Dict[str, Any]]]:
+    """
+    References -> full trial dicts. The explanation is rebuilt from the
+    stored score; a reference whose snapshot is missing is dropped.
+    """
+    hashes = sorted({t["snapshot"] for _, items in matches for t in items if _is_reference(t)})
+    snapshots: Dict[str, Dict[str, Any]] = {}
+    if hashes:
+        stmt = sa.text(
+            "SELECT content_hash, payload FROM trial_snapshots WHERE content_hash = ANY(:hashes)"
+        ).bindparams(sa.bindparam("hashes", type_=postgresql.ARRAY(sa.String)))
+        snapshots = {digest: payload for digest, payload in bind.execute(stmt, {"hashes": hashes})}
+
+    converted = []
+    for query, items in matches:
+        trials = []
+        for item in items:
+            if not _is_reference(item):
+                trials.append(item)
+                continue
+            payload = snapshots.get(item["snapshot"])
+            if payload is None:
+                continue
+            trial = {**payload, **{k: v for k, v in item.items() if k != "snapshot"}}
+            trial["explanation"] = _score_explanation(query, trial)
+            trials.append(trial)
+        converted.append(trials)
+    return converted
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'trial_snapshots',
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('nct_id', sa.String(length=20), nullable=True),
+        sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('content_hash'),
+    )
+    op.create_index('ix_trial_snapshots_nct_id', 'trial_snapshots', ['nct_id'], unique=False)
+
+    _rewrite_matches(op.get_bind(), _to_references)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _rewrite_matches(op.get_bind(), _to_full_trials)
+
+    op.drop_index('ix_trial_snapshots_nct_id', table_name='trial_snapshots')
+    op.drop_table('trial_snapshots')
@@ -0,0 +1,32 @@
+"""add covering (user_id, created_at, id) index on trial_matches
+
+Revision ID: c2e96a8d4f17
+Revises: b84c1f7e3a26
+Create Date: 2026-10-16 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2e96a8d4f17'
+down_revision: Union[str, Sequence[str], None] = 'b84c1f7e3a26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_trial_matches_user_created',
+        'trial_matches',
+        ['user_id', 'created_at', 'id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_trial_matches_user_created', table_name='trial_matches')
@@ -12,10 +12,22 @@ from source.modules.symptoms.router import router as symptom_router
 from source.modules.matching.router import router as matching_router
 from source.modules.chatbot.router import router as chatbot_router
 from source.modules.getprofile.router import router as getprofile_router
+from source.modules.trails.router import router as trials_router
 
 # Database config
 from source.database.config import db_config
 
+# Shared outbound HTTP clients
+from source.httpclient.service import aclose_http_clients
+
+# Metrics
+from source.metrics import service as metrics_service
+
+# Ranking model and search index (loaded once per worker)
+from source.modules.matching.bm25_index import get_bm25_index
+from source.modules.matching.embeddings import get_embedding_encoder, get_embedding_index
+from source.modules.matching.tfidf_model import get_tfidf_model
+
 # Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("clinical-trial-backend")
@@ -43,6 +55,7 @@ app.include_router(symptom_router)
 app.include_router(matching_router)
 app.include_router(chatbot_router)
 app.include_router(getprofile_router)
+app.include_router(trials_router)
 
 # Custom OpenAPI with JWT authorization
 def custom_openapi():
@@ -79,6 +92,14 @@ def on_startup():
     else:
         logger.warning("APP_DB_URL not set. Configure it in the Render dashboard or local .env")
     logger.info(f"CORS_ORIGINS: {origins}")
+    get_tfidf_model()
+    get_bm25_index()
+    get_embedding_encoder()
+    get_embedding_index()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await aclose_http_clients()
 
 # Render health checks
 @app.get("/", include_in_schema=False)
@@ -90,6 +111,11 @@ def root_health():
 def health_check():
     return {"database_url_set": bool(db_config.APP_DB_URL)}
 
+# Per-worker counters (response cache hits/misses, ...)
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_service.snapshot()
+
 # Main server entry
 if __name__ == "__main__":
     uvicorn.run(
@@ -100,10 +100,18 @@ class PaginatedListData(AppBaseModel, Generic[ListItemsT]):
     """
 
     list_items: List[ListItemsT] = Field(..., description="List items")
-    total_records: int = Field(..., description="Total records")
+    total_records: int | None = Field(
+        default=None, description="Total records (None when not counted)"
+    )
     page_number: int = Field(..., description="Current page number")
     page_size: int = Field(..., description="Page size")
-    total_pages: int = Field(..., description="Total pages")
+    total_pages: int | None = Field(
+        default=None, description="Total pages (None when not counted)"
+    )
+    next_cursor: str | None = Field(
+        default=None,
+        description="Opaque cursor of the next page (keyset pagination); None on the last page",
+    )
 
 
 class IdResponseData(AppBaseModel):
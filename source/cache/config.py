@@ -0,0 +1,31 @@
+"""
+Response cache configuration
+"""
+
+from pydantic_settings import BaseSettings
+
+
+class ResponseCacheConfig(BaseSettings):
+    """
+    On-disk response cache for external trial sources
+    """
+
+    RESPONSE_CACHE_ENABLED: bool = True
+    """Enable the persistent response cache"""
+
+    RESPONSE_CACHE_PATH: str = ".cache/responses.sqlite3"
+    """SQLite file shared by all workers on this host"""
+
+    RESPONSE_CACHE_TTL_SECONDS: int = 60 * 60
+    """Age after which an entry is stale (served, but refreshed in the background)"""
+
+    RESPONSE_CACHE_STALE_SECONDS: int = 24 * 60 * 60
+    """How long past the TTL a stale entry may still be served"""
+
+    RESPONSE_CACHE_MAX_ENTRIES: int = 5000
+    """LRU size cap; least recently used entries are evicted beyond this"""
+
+    class Config:
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        extra = "ignore"
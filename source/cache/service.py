@@ -0,0 +1,331 @@
+"""
+Persistent response cache with stale-while-revalidate
+
+Responses from external trial sources are stored in a local SQLite file
+(WAL mode), so every uvicorn worker on the host shares the same entries
+and they survive restarts.
+
+- Fresh entries (younger than the TTL) are returned directly.
+- Stale entries (within the stale window) are returned immediately and
+  refreshed in the background.
+- The number of entries is capped; least recently used entries are evicted.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+import httpx
+
+from source.cache.config import ResponseCacheConfig
+from source.logger import service as logger_service
+from source.metrics import service as metrics
+
+log = logger_service.get_logger(__name__)
+
+cache_settings = ResponseCacheConfig()
+
+LAST_ACCESS_RESOLUTION_SECONDS = 60
+"""Only rewrite last_access when it is older than this (keeps hits read-only)"""
+
+_WS_RE = re.compile(r"\s+")
+
+
+def is_free_text_param(name: str) -> bool:
+    """
+    Free-text search params ("query", CT.gov "query.term" / "query.cond" ...)
+    """
+    return name == "query" or name.startswith("query.")
+
+
+def normalize_param(name: str, value: Any) -> Any:
+    """
+    Normalize a free-text search param so near-identical searches share a
+    key (case, surrounding whitespace and repeated inner whitespace are
+    ignored). Everything else (page tokens, IDs, filters) is passed through
+    unchanged, since those values are case-sensitive.
+    """
+    if isinstance(value, str) and is_free_text_param(name):
+        return _WS_RE.sub(" ", value).strip().lower()
+    return value
+
+
+def make_cache_key(source: str, url: str, params: Optional[Dict[str, Any]]) -> str:
+    """
+    Build a stable cache key from the source, URL and normalized params
+
+    Args:
+        source (str): Source name, e.g. "ctgov"
+        url (str): Request URL
+        params (dict): Query parameters
+
+    Returns:
+        str: Hex sha256 key
+    """
+    norm = sorted((k, normalize_param(k, v)) for k, v in (params or {}).items())
+    raw = json.dumps([source, url, norm], separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed LRU cache of raw response bodies
+    """
+
+    def __init__(self, path: str, ttl: int, stale: int, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.stale = stale
+        self.max_entries = max_entries
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " source TEXT NOT NULL,"
+                " body BLOB NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_responses_last_access"
+                " ON responses (last_access)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        """
+        Look up an entry
+
+        Returns:
+            tuple: (body, age_seconds) or None if missing / past the stale window
+        """
+        row = self._conn().execute(
+            "SELECT body, created_at, last_access FROM responses WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        body, created_at, last_access = row
+        now = time.time()
+        age = now - created_at
+        if age > self.ttl + self.stale:
+            return None
+
+        if now - last_access > LAST_ACCESS_RESOLUTION_SECONDS:
+            self._conn().execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (now, key)
+            )
+        return body, age
+
+    def put(self, key: str, source: str, body: bytes):
+        """
+        Store an entry and evict least recently used entries beyond the cap
+        """
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, source, body, created_at, last_access)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (key, source, body, now, now),
+        )
+        (count,) = conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+            metrics.increment("response_cache.evicted", overflow)
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+_refreshing: Set[str] = set()
+_refreshing_lock = threading.Lock()
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    Get the process-wide response cache (None if disabled or unusable)
+    """
+    global _cache
+    if not cache_settings.RESPONSE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    _cache = ResponseCache(
+                        cache_settings.RESPONSE_CACHE_PATH,
+                        ttl=cache_settings.RESPONSE_CACHE_TTL_SECONDS,
+                        stale=cache_settings.RESPONSE_CACHE_STALE_SECONDS,
+                        max_entries=cache_settings.RESPONSE_CACHE_MAX_ENTRIES,
+                    )
+                except (OSError, sqlite3.Error) as e:
+                    log.error(f"get_response_cache: cache disabled - {e}")
+                    cache_settings.RESPONSE_CACHE_ENABLED = False
+                    return None
+    return _cache
+
+
+def _safe_get(cache: ResponseCache, key: str) -> Optional[Tuple[bytes, float]]:
+    try:
+        return cache.get(key)
+    except sqlite3.Error as e:
+        log.warning(f"response cache read failed - {e}")
+        return None
+
+
+def _safe_put(cache: ResponseCache, key: str, source: str, body: bytes):
+    try:
+        cache.put(key, source, body)
+    except sqlite3.Error as e:
+        log.warning(f"response cache write failed - {e}")
+
+
+def _claim_refresh(key: str) -> bool:
+    with _refreshing_lock:
+        if key in _refreshing:
+            return False
+        _refreshing.add(key)
+        return True
+
+
+def _release_refresh(key: str):
+    with _refreshing_lock:
+        _refreshing.discard(key)
+
+
+def _refresh(cache: ResponseCache, key: str, source: str, fetch: Callable[[], httpx.Response]):
+    try:
+        resp = fetch()
+        if resp.status_code == 200:
+            _safe_put(cache, key, source, resp.content)
+            metrics.increment("response_cache.refreshed", source=source)
+    except Exception as e:
+        log.warning(f"response cache refresh failed for {source} - {e}")
+    finally:
+        _release_refresh(key)
+
+
+async def _arefresh(
+    cache: ResponseCache,
+    key: str,
+    source: str,
+    fetch: Callable[[], Awaitable[httpx.Response]],
+):
+    try:
+        resp = await fetch()
+        if resp.status_code == 200:
+            await asyncio.to_thread(_safe_put, cache, key, source, resp.content)
+            metrics.increment("response_cache.refreshed", source=source)
+    except Exception as e:
+        log.warning(f"response cache refresh failed for {source} - {e}")
+    finally:
+        _release_refresh(key)
+
+
+def cached_get(
+    source: str,
+    url: str,
+    params: Optional[Dict[str, Any]],
+    fetch: Callable[[], httpx.Response],
+) -> Optional[bytes]:
+    """
+    Return the response body for a GET, going through the response cache
+
+    Args:
+        source (str): Source name (used for the key and the counters)
+        url (str): Request URL
+        params (dict): Query parameters
+        fetch (callable): Performs the actual request
+
+    Returns:
+        bytes: Response body, or None if the upstream did not answer 200
+    """
+    cache = get_response_cache()
+    if cache is None:
+        resp = fetch()
+        return resp.content if resp.status_code == 200 else None
+
+    key = make_cache_key(source, url, params)
+    found = _safe_get(cache, key)
+    if found is not None:
+        body, age = found
+        if age <= cache.ttl:
+            metrics.increment("response_cache.hit", source=source)
+            return body
+
+        metrics.increment("response_cache.stale_hit", source=source)
+        if _claim_refresh(key):
+            _refresh_executor.submit(_refresh, cache, key, source, fetch)
+        return body
+
+    metrics.increment("response_cache.miss", source=source)
+    resp = fetch()
+    if resp.status_code != 200:
+        return None
+    _safe_put(cache, key, source, resp.content)
+    return resp.content
+
+
+async def acached_get(
+    source: str,
+    url: str,
+    params: Optional[Dict[str, Any]],
+    fetch: Callable[[], Awaitable[httpx.Response]],
+) -> Optional[bytes]:
+    """
+    Async variant of cached_get (SQLite access runs in a worker thread,
+    stale entries are refreshed by a background task on the event loop)
+    """
+    cache = get_response_cache()
+    if cache is None:
+        resp = await fetch()
+        return resp.content if resp.status_code == 200 else None
+
+    key = make_cache_key(source, url, params)
+    found = await asyncio.to_thread(_safe_get, cache, key)
+    if found is not None:
+        body, age = found
+        if age <= cache.ttl:
+            metrics.increment("response_cache.hit", source=source)
+            return body
+
+        metrics.increment("response_cache.stale_hit", source=source)
+        if _claim_refresh(key):
+            task = asyncio.create_task(_arefresh(cache, key, source, fetch))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+        return body
+
+    metrics.increment("response_cache.miss", source=source)
+    resp = await fetch()
+    if resp.status_code != 200:
+        return None
+    await asyncio.to_thread(_safe_put, cache, key, source, resp.content)
+    return resp.content
@@ -0,0 +1,34 @@
+"""
+Request coalescing configuration
+"""
+
+from pydantic_settings import BaseSettings
+
+
+class CoalesceConfig(BaseSettings):
+    """
+    Single-flight coalescing of identical concurrent trial searches
+    """
+
+    COALESCE_ENABLED: bool = True
+    """Share one in-flight fetch + scoring pass between identical searches"""
+
+    COALESCE_CROSS_WORKER: bool = True
+    """Also coalesce across workers through the search_flights table"""
+
+    COALESCE_WAIT_TIMEOUT_SECONDS: float = 15.0
+    """Longest a follower waits for the leader before computing on its own"""
+
+    COALESCE_LEASE_SECONDS: float = 30.0
+    """Claim lifetime; a flight whose leader died can be taken over after this"""
+
+    COALESCE_RESULT_TTL_SECONDS: float = 5.0
+    """How long a finished result is handed to identical searches that arrive late"""
+
+    COALESCE_POLL_INTERVAL_SECONDS: float = 0.05
+    """How often a worker checks the table for another worker's result"""
+
+    class Config:
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        extra = "ignore"
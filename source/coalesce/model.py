@@ -0,0 +1,32 @@
+"""
+Search flight table (cross-worker single-flight claims and results)
+"""
+
+from datetime import datetime
+
+from sqlalchemy import TIMESTAMP, Index, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from source.database.models import BaseDbModel
+
+
+class SearchFlight(BaseDbModel):
+    """
+    One row per coalescing key: claimed by the worker computing it
+    ("running"), then holding its serialized result for a short while ("done").
+    """
+    __tablename__ = "search_flights"
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    owner: Mapped[str] = mapped_column(String(128), nullable=False)
+    state: Mapped[str] = mapped_column(String(16), nullable=False)  # "running" | "done"
+    result: Mapped[str | None] = mapped_column(Text, nullable=True)  # JSON
+    started_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_search_flights_expires_at", "expires_at"),
+    )
+
+    def __repr__(self):
+        return f"<SearchFlight key={self.key} state={self.state}>"
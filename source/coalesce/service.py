@@ -0,0 +1,385 @@
+"""
+Single-flight request coalescing
+
+Identical searches that run at the same time share one computation:
+
+- Within a worker, the first caller for a key becomes the leader and the
+  others wait on its future.
+- Across workers, the leader claims the key in the `search_flights` table
+  (INSERT ... ON CONFLICT with a lease). A worker that finds a running
+  claim polls for its result instead of computing, and a result finished
+  moments ago is handed to searches that arrive just after it.
+
+Results are passed around as JSON, so every caller gets its own copy to
+mutate. If the table cannot be used (missing, database down), the search
+is simply computed locally.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from source.coalesce.config import CoalesceConfig
+from source.database.service import SessionLocal
+from source.logger import service as logger_service
+from source.metrics import service as metrics
+
+log = logger_service.get_logger(__name__)
+
+coalesce_settings = CoalesceConfig()
+
+PURGE_GRACE_SECONDS = 60
+"""Expired rows older than this are deleted when a flight completes"""
+
+_CLAIM_SQL = text(
+    "INSERT INTO search_flights (key, owner, state, result, started_at, expires_at)"
+    " VALUES (:key, :owner, 'running', NULL, now(), now() + make_interval(secs => :lease))"
+    " ON CONFLICT (key) DO UPDATE SET owner = EXCLUDED.owner, state = 'running',"
+    " result = NULL, started_at = EXCLUDED.started_at, expires_at = EXCLUDED.expires_at"
+    " WHERE search_flights.expires_at < now()"
+    " RETURNING owner"
+)
+_READ_SQL = text(
+    "SELECT state, result, expires_at < now() AS expired FROM search_flights WHERE key = :key"
+)
+_COMPLETE_SQL = text(
+    "UPDATE search_flights SET state = 'done', result = :result,"
+    " expires_at = now() + make_interval(secs => :ttl)"
+    " WHERE key = :key AND owner = :owner"
+)
+_RELEASE_SQL = text("DELETE FROM search_flights WHERE key = :key AND owner = :owner")
+_PURGE_SQL = text(
+    "DELETE FROM search_flights WHERE expires_at < now() - make_interval(secs => :grace)"
+)
+
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+class _LeaderAbandoned(Exception):
+    """
+    The leader was cancelled before finishing; followers compute themselves
+    """
+
+
+# -------------------------
+# In-process flights
+# -------------------------
+def _join_or_lead(key: str) -> Tuple[Future, bool]:
+    """
+    Returns:
+        tuple: (future of the flight, True if the caller is its leader)
+    """
+    with _inflight_lock:
+        fut = _inflight.get(key)
+        if fut is not None:
+            return fut, False
+        fut = Future()
+        _inflight[key] = fut
+        return fut, True
+
+
+def _finish(
+    key: str,
+    fut: Future,
+    payload: Optional[str] = None,
+    error: Optional[BaseException] = None,
+):
+    with _inflight_lock:
+        if _inflight.get(key) is fut:
+            del _inflight[key]
+    if error is not None:
+        fut.set_exception(error if isinstance(error, Exception) else _LeaderAbandoned())
+    else:
+        fut.set_result(payload)
+
+
+def _dumps(result: Any) -> str:
+    return json.dumps(result, separators=(",", ":"), default=str)
+
+
+# -------------------------
+# Cross-worker flights (search_flights table)
+# -------------------------
+def _new_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"[:128]
+
+
+def _execute(*statements: Tuple[Any, Dict[str, Any]]):
+    """
+    Run statements in one short transaction; returns the first row of the
+    first statement (None if it returns no rows).
+    """
+    db = SessionLocal()
+    try:
+        first = None
+        for i, (sql, params) in enumerate(statements):
+            result = db.execute(sql, params)
+            if i == 0 and result.returns_rows:
+                first = result.first()
+        db.commit()
+        return first
+    finally:
+        db.close()
+
+
+def _claim(key: str, owner: str) -> Tuple[str, Optional[str]]:
+    """
+    Returns:
+        tuple: ("lead", None) when the claim was taken, ("done", payload)
+        for a fresh result of another worker, ("running", None) otherwise
+    """
+    row = _execute((_CLAIM_SQL, {
+        "key": key,
+        "owner": owner,
+        "lease": coalesce_settings.COALESCE_LEASE_SECONDS,
+    }))
+    if row is not None:
+        return "lead", None
+
+    row = _execute((_READ_SQL, {"key": key}))
+    if row is not None and row.state == "done" and not row.expired:
+        return "done", row.result
+    return "running", None
+
+
+def _poll(key: str) -> Tuple[bool, Optional[str]]:
+    """
+    Returns:
+        tuple: (keep waiting, payload once the other worker is done)
+    """
+    row = _execute((_READ_SQL, {"key": key}))
+    if row is None or row.expired:
+        return False, None  # leader failed or its lease ran out
+    if row.state == "done":
+        return False, row.result
+    return True, None
+
+
+def _wait_timeout(wait_timeout: Optional[float]) -> float:
+    if wait_timeout is None:
+        return coalesce_settings.COALESCE_WAIT_TIMEOUT_SECONDS
+    return min(wait_timeout, coalesce_settings.COALESCE_WAIT_TIMEOUT_SECONDS)
+
+
+def _wait_for_result(key: str, wait_timeout: Optional[float]) -> Optional[str]:
+    deadline = time.monotonic() + _wait_timeout(wait_timeout)
+    while time.monotonic() < deadline:
+        time.sleep(coalesce_settings.COALESCE_POLL_INTERVAL_SECONDS)
+        waiting, payload = _poll(key)
+        if not waiting:
+            return payload
+    return None
+
+
+async def _await_result(key: str, wait_timeout: Optional[float]) -> Optional[str]:
+    deadline = time.monotonic() + _wait_timeout(wait_timeout)
+    while time.monotonic() < deadline:
+        await asyncio.sleep(coalesce_settings.COALESCE_POLL_INTERVAL_SECONDS)
+        waiting, payload = await asyncio.to_thread(_poll, key)
+        if not waiting:
+            return payload
+    return None
+
+
+def _complete(key: str, owner: str, payload: str):
+    try:
+        _execute(
+            (_COMPLETE_SQL, {
+                "key": key,
+                "owner": owner,
+                "result": payload,
+                "ttl": coalesce_settings.COALESCE_RESULT_TTL_SECONDS,
+            }),
+            (_PURGE_SQL, {"grace": PURGE_GRACE_SECONDS}),
+        )
+    except SQLAlchemyError as e:
+        log.warning(f"coalesce: could not store result - {e}")
+        metrics.increment("coalesce.store_error")
+
+
+def _release(key: str, owner: str):
+    try:
+        _execute((_RELEASE_SQL, {"key": key, "owner": owner}))
+    except SQLAlchemyError as e:
+        log.warning(f"coalesce: could not release claim - {e}")
+        metrics.increment("coalesce.store_error")
+
+
+def _safe_claim(key: str, owner: str) -> Tuple[str, Optional[str]]:
+    if not coalesce_settings.COALESCE_CROSS_WORKER:
+        return "local", None
+    try:
+        return _claim(key, owner)
+    except SQLAlchemyError as e:
+        log.warning(f"coalesce: claim failed, computing locally - {e}")
+        metrics.increment("coalesce.store_error")
+        return "local", None
+
+
+def _safe_wait(key: str, wait_timeout: Optional[float]) -> Optional[str]:
+    try:
+        return _wait_for_result(key, wait_timeout)
+    except SQLAlchemyError as e:
+        log.warning(f"coalesce: polling failed - {e}")
+        metrics.increment("coalesce.store_error")
+        return None
+
+
+async def _asafe_wait(key: str, wait_timeout: Optional[float]) -> Optional[str]:
+    try:
+        return await _await_result(key, wait_timeout)
+    except SQLAlchemyError as e:
+        log.warning(f"coalesce: polling failed - {e}")
+        metrics.increment("coalesce.store_error")
+        return None
+
+
+def _compute_across_workers(
+    key: str,
+    compute: Callable[[], Any],
+    wait_timeout: Optional[float],
+) -> Tuple[Any, str]:
+    owner = _new_owner()
+    state, payload = _safe_claim(key, owner)
+
+    if state == "done":
+        metrics.increment("coalesce.joined", scope="worker")
+        return json.loads(payload), payload
+
+    if state == "running":
+        payload = _safe_wait(key, wait_timeout)
+        if payload is not None:
+            metrics.increment("coalesce.joined", scope="worker")
+            return json.loads(payload), payload
+        metrics.increment("coalesce.wait_timeout", scope="worker")
+
+    try:
+        result = compute()
+    except BaseException:
+        if state == "lead":
+            _release(key, owner)
+        raise
+
+    payload = _dumps(result)
+    if state == "lead":
+        _complete(key, owner, payload)
+    return result, payload
+
+
+async def _acompute_across_workers(
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    wait_timeout: Optional[float],
+) -> Tuple[Any, str]:
+    owner = _new_owner()
+    state, payload = await asyncio.to_thread(_safe_claim, key, owner)
+
+    if state == "done":
+        metrics.increment("coalesce.joined", scope="worker")
+        return json.loads(payload), payload
+
+    if state == "running":
+        payload = await _asafe_wait(key, wait_timeout)
+        if payload is not None:
+            metrics.increment("coalesce.joined", scope="worker")
+            return json.loads(payload), payload
+        metrics.increment("coalesce.wait_timeout", scope="worker")
+
+    try:
+        result = await compute()
+    except BaseException:
+        if state == "lead":
+            await asyncio.to_thread(_release, key, owner)
+        raise
+
+    payload = _dumps(result)
+    if state == "lead":
+        await asyncio.to_thread(_complete, key, owner, payload)
+    return result, payload
+
+
+# -------------------------
+# Public API
+# -------------------------
+def single_flight(
+    key: str,
+    compute: Callable[[], Any],
+    wait_timeout: Optional[float] = None,
+) -> Any:
+    """
+    Run `compute` once for all concurrent callers with the same key
+
+    Args:
+        key (str): Coalescing key (e.g. a hash of the normalized search)
+        compute (callable): Produces a JSON-serializable result
+        wait_timeout (float): Longest this caller waits for another
+            caller's flight (capped by COALESCE_WAIT_TIMEOUT_SECONDS)
+
+    Returns:
+        Any: The result (a private copy for every caller but the leader)
+    """
+    if not coalesce_settings.COALESCE_ENABLED:
+        return compute()
+
+    fut, leader = _join_or_lead(key)
+    if not leader:
+        metrics.increment("coalesce.joined", scope="process")
+        try:
+            return json.loads(fut.result(timeout=_wait_timeout(wait_timeout)))
+        except (FutureTimeoutError, _LeaderAbandoned):
+            metrics.increment("coalesce.wait_timeout", scope="process")
+            return compute()
+
+    metrics.increment("coalesce.leader")
+    try:
+        result, payload = _compute_across_workers(key, compute, wait_timeout)
+    except BaseException as e:
+        _finish(key, fut, error=e)
+        raise
+    _finish(key, fut, payload=payload)
+    return result
+
+
+async def asingle_flight(
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    wait_timeout: Optional[float] = None,
+) -> Any:
+    """
+    Async variant of single_flight; sync and async callers of the same key
+    join the same flight.
+    """
+    if not coalesce_settings.COALESCE_ENABLED:
+        return await compute()
+
+    fut, leader = _join_or_lead(key)
+    if not leader:
+        metrics.increment("coalesce.joined", scope="process")
+        try:
+            payload = await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(fut)),
+                timeout=_wait_timeout(wait_timeout),
+            )
+            return json.loads(payload)
+        except (asyncio.TimeoutError, _LeaderAbandoned):
+            metrics.increment("coalesce.wait_timeout", scope="process")
+            return await compute()
+
+    metrics.increment("coalesce.leader")
+    try:
+        result, payload = await _acompute_across_workers(key, compute, wait_timeout)
+    except BaseException as e:
+        _finish(key, fut, error=e)
+        raise
+    _finish(key, fut, payload=payload)
+    return result
@@ -0,0 +1,80 @@
+"""
+Outbound HTTP client configuration
+"""
+
+from pydantic_settings import BaseSettings
+
+
+class HttpClientConfig(BaseSettings):
+    """
+    Outbound HTTP client configuration (shared by all external trial sources)
+    """
+
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    """Seconds allowed to establish a TCP/TLS connection"""
+
+    HTTP_READ_TIMEOUT: float = 10.0
+    """Seconds allowed between bytes of a response"""
+
+    HTTP_POOL_TIMEOUT: float = 5.0
+    """Seconds to wait for a free connection from the pool"""
+
+    HTTP_MAX_CONNECTIONS: int = 100
+    """Maximum number of open connections across all hosts"""
+
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    """Maximum number of idle keep-alive connections kept in the pool"""
+
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    """Seconds an idle keep-alive connection is kept before being closed"""
+
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 20
+    """Maximum number of concurrent requests to a single host"""
+
+    HTTP_ENABLE_HTTP2: bool = False
+    """Negotiate HTTP/2 (off by default; needs 'h2', installed via httpx[http2])"""
+
+    # Resilience (source/httpclient/resilience.py)
+    HTTP_BREAKER_WINDOW: int = 50
+    """Recent calls per source used to compute error / slow-call rates"""
+
+    HTTP_BREAKER_MIN_CALLS: int = 10
+    """Calls in the window before the breaker may open"""
+
+    HTTP_BREAKER_ERROR_RATE: float = 0.5
+    """Error rate (exceptions, 429, 5xx) that opens the breaker"""
+
+    HTTP_BREAKER_SLOW_CALL_SECONDS: float = 3.0
+    """Calls slower than this count as slow"""
+
+    HTTP_BREAKER_SLOW_CALL_RATE: float = 0.8
+    """Slow-call rate that opens the breaker"""
+
+    HTTP_BREAKER_OPEN_SECONDS: float = 30.0
+    """How long an open breaker rejects calls before letting a probe through"""
+
+    HTTP_HEDGE_ENABLED: bool = True
+    """Send a second request when the first is slower than the source's p95"""
+
+    HTTP_HEDGE_MIN_SAMPLES: int = 20
+    """Successful calls needed before the p95 (and so hedging) is trusted"""
+
+    HTTP_HEDGE_MIN_DELAY: float = 0.05
+    """Lower bound on the hedge delay (seconds)"""
+
+    HTTP_HEDGE_MAX_DELAY: float = 2.0
+    """Upper bound on the hedge delay (seconds)"""
+
+    HTTP_RETRY_BUDGET_RATIO: float = 0.1
+    """Hedges + retries allowed per request, averaged (shared by all sources)"""
+
+    HTTP_RETRY_BUDGET_MIN_PER_SECOND: float = 1.0
+    """Budget refilled per second regardless of traffic"""
+
+    HTTP_RETRY_BUDGET_MAX: float = 20.0
+    """Cap on saved-up hedges / retries"""
+
+    class Config:
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        extra = "ignore"
@@ -0,0 +1,406 @@
+"""
+Resilience layer for external trial sources
+
+Every outbound source call goes through:
+
+- a per-source circuit breaker: it opens when the recent error rate
+  (exceptions, 429, 5xx) or slow-call rate crosses a threshold. While
+  open, calls fail immediately with CircuitOpenError. After a cool-down a
+  single probe is let through (half-open), and its outcome closes or
+  re-opens the breaker.
+- hedging (async path): if the first attempt is still running after the
+  source's observed p95 latency, a second identical request is sent and
+  whichever answers first wins.
+- a global retry budget: hedges and retries of failed attempts both spend
+  from one token bucket (a fraction of recent requests plus a small
+  per-second allowance), so a struggling upstream is never hit with a
+  multiple of the normal traffic.
+
+All decisions are counted in source.metrics (http.* names).
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import httpx
+
+from source.httpclient.service import ahttp_get, http_get, http_settings
+from source.logger import service as logger_service
+from source.metrics import service as metrics
+
+log = logger_service.get_logger(__name__)
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+_STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+LATENCY_WINDOW = 200
+"""Successful call latencies kept per source for the p95"""
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a source whose breaker is open
+    """
+
+    def __init__(self, source: str):
+        super().__init__(f"circuit open for {source}")
+        self.source = source
+
+
+def _is_failure(resp: httpx.Response) -> bool:
+    return resp.status_code == 429 or resp.status_code >= 500
+
+
+# -------------------------
+# Building blocks
+# -------------------------
+class LatencyWindow:
+    """
+    Latencies of the most recent successful calls of one source
+    """
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._values: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._values.append(seconds)
+
+    def quantile(self, q: float, min_samples: int) -> Optional[float]:
+        """
+        Returns:
+            float: The q-quantile in seconds, None with too few samples
+        """
+        with self._lock:
+            if len(self._values) < min_samples:
+                return None
+            ordered = sorted(self._values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """
+    Count-based sliding-window breaker for one source
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.state = CLOSED
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=http_settings.HTTP_BREAKER_WINDOW)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str, reason: str):
+        self.state = state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        metrics.increment("http.breaker.transition", source=self.source, to=state, reason=reason)
+        metrics.set_gauge("http.breaker.state", _STATE_GAUGE[state], source=self.source)
+        if state == OPEN:
+            log.warning(f"circuit breaker for {self.source} opened ({reason})")
+        else:
+            log.info(f"circuit breaker for {self.source} -> {state} ({reason})")
+
+    def allow(self) -> bool:
+        """
+        Whether a call may go out now (takes the probe slot when half-open)
+        """
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < http_settings.HTTP_BREAKER_OPEN_SECONDS:
+                    return False
+                self._transition(HALF_OPEN, "cool_down")
+            if self.state == HALF_OPEN:
+                if self._probes >= 1:
+                    return False
+                self._probes += 1
+            return True
+
+    @property
+    def closed(self) -> bool:
+        return self.state == CLOSED
+
+    def record(self, failed: bool, seconds: float):
+        """
+        Outcome of a finished call
+        """
+        slow = seconds >= http_settings.HTTP_BREAKER_SLOW_CALL_SECONDS
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if failed or slow:
+                    self._transition(OPEN, "probe_failed" if failed else "probe_slow")
+                else:
+                    self._transition(CLOSED, "probe_ok")
+                return
+            if self.state == OPEN:
+                return  # answer to a call sent before the breaker opened
+
+            self._outcomes.append((failed, slow))
+            n = len(self._outcomes)
+            if n < http_settings.HTTP_BREAKER_MIN_CALLS:
+                return
+            errors = sum(1 for f, _ in self._outcomes if f)
+            slows = sum(1 for _, s in self._outcomes if s)
+            if errors / n >= http_settings.HTTP_BREAKER_ERROR_RATE:
+                self._transition(OPEN, "error_rate")
+            elif slows / n >= http_settings.HTTP_BREAKER_SLOW_CALL_RATE:
+                self._transition(OPEN, "latency")
+
+    def abandon(self):
+        """
+        A call was cancelled (e.g. the losing side of a hedge): no outcome,
+        but a half-open probe slot is given back
+        """
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+
+
+class RetryBudget:
+    """
+    Token bucket shared by hedges and retries of all sources
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, cap: float):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.cap = cap
+        self._balance = cap
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._balance = min(self.cap, self._balance + (now - self._last) * self.min_per_second)
+        self._last = now
+
+    def on_request(self):
+        """
+        Every first attempt earns `ratio` of a hedge / retry
+        """
+        with self._lock:
+            self._refill()
+            self._balance = min(self.cap, self._balance + self.ratio)
+
+    def try_spend(self, source: str, kind: str) -> bool:
+        with self._lock:
+            self._refill()
+            if self._balance < 1.0:
+                allowed = False
+            else:
+                self._balance -= 1.0
+                allowed = True
+            balance = self._balance
+        metrics.set_gauge("http.retry_budget.balance", round(balance, 2))
+        if not allowed:
+            metrics.increment("http.retry_budget.exhausted", source=source, kind=kind)
+        return allowed
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, LatencyWindow] = {}
+_registry_lock = threading.Lock()
+
+retry_budget = RetryBudget(
+    ratio=http_settings.HTTP_RETRY_BUDGET_RATIO,
+    min_per_second=http_settings.HTTP_RETRY_BUDGET_MIN_PER_SECOND,
+    cap=http_settings.HTTP_RETRY_BUDGET_MAX,
+)
+
+
+def get_breaker(source: str) -> CircuitBreaker:
+    breaker = _breakers.get(source)
+    if breaker is None:
+        with _registry_lock:
+            breaker = _breakers.setdefault(source, CircuitBreaker(source))
+    return breaker
+
+
+def _latency_window(source: str) -> LatencyWindow:
+    window = _latencies.get(source)
+    if window is None:
+        with _registry_lock:
+            window = _latencies.setdefault(source, LatencyWindow())
+    return window
+
+
+def hedge_delay(source: str) -> Optional[float]:
+    """
+    Seconds to wait before hedging: the source's p95, clamped; None while
+    hedging is disabled or there are too few samples.
+    """
+    if not http_settings.HTTP_HEDGE_ENABLED:
+        return None
+    p95 = _latency_window(source).quantile(0.95, http_settings.HTTP_HEDGE_MIN_SAMPLES)
+    if p95 is None:
+        return None
+    metrics.set_gauge("http.latency_p95_ms", round(p95 * 1000, 1), source=source)
+    return min(max(p95, http_settings.HTTP_HEDGE_MIN_DELAY), http_settings.HTTP_HEDGE_MAX_DELAY)
+
+
+def _admit(source: str) -> CircuitBreaker:
+    breaker = get_breaker(source)
+    if not breaker.allow():
+        metrics.increment("http.breaker.rejected", source=source)
+        raise CircuitOpenError(source)
+    retry_budget.on_request()
+    return breaker
+
+
+def _record(source: str, breaker: CircuitBreaker, failed: bool, seconds: float):
+    breaker.record(failed, seconds)
+    if not failed:
+        _latency_window(source).add(seconds)
+    metrics.increment("http.requests", source=source, outcome="error" if failed else "ok")
+
+
+# -------------------------
+# Sync path
+# -------------------------
+def _attempt(
+    source: str,
+    breaker: CircuitBreaker,
+    url: str,
+    params: Optional[Dict[str, Any]],
+    timeout: Optional[float],
+):
+    start = time.monotonic()
+    try:
+        resp = http_get(url, params=params, timeout=timeout)
+    except httpx.HTTPError:
+        _record(source, breaker, True, time.monotonic() - start)
+        raise
+    except Exception:
+        breaker.abandon()
+        raise
+    _record(source, breaker, _is_failure(resp), time.monotonic() - start)
+    return resp
+
+
+def resilient_get(
+    source: str,
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None,
+) -> httpx.Response:
+    """
+    GET through the source's circuit breaker, with one budgeted retry of a
+    failed attempt (hedging needs the event loop, see aresilient_get)
+
+    Args:
+        source (str): Source name, e.g. "ctgov"
+        url (str): Request URL
+        params (dict): Query parameters
+        timeout (float): Optional per-attempt timeout (e.g. the time left
+            until the request deadline)
+
+    Returns:
+        httpx.Response: The response (possibly a 429 / 5xx after retrying)
+
+    Raises:
+        CircuitOpenError: The source's breaker is open
+        httpx.HTTPError: Transport errors of the last attempt
+    """
+    breaker = _admit(source)
+    try:
+        resp = _attempt(source, breaker, url, params, timeout)
+        if not _is_failure(resp):
+            return resp
+    except httpx.HTTPError:
+        if not (breaker.closed and retry_budget.try_spend(source, "retry")):
+            raise
+        metrics.increment("http.retry.sent", source=source)
+        return _attempt(source, breaker, url, params, timeout)
+
+    if breaker.closed and retry_budget.try_spend(source, "retry"):
+        metrics.increment("http.retry.sent", source=source)
+        return _attempt(source, breaker, url, params, timeout)
+    return resp
+
+
+# -------------------------
+# Async path
+# -------------------------
+async def _aattempt(
+    source: str,
+    breaker: CircuitBreaker,
+    url: str,
+    params: Optional[Dict[str, Any]],
+    timeout: Optional[float],
+) -> httpx.Response:
+    start = time.monotonic()
+    try:
+        resp = await ahttp_get(url, params=params, timeout=timeout)
+    except httpx.HTTPError:
+        _record(source, breaker, True, time.monotonic() - start)
+        raise
+    except BaseException:  # cancelled (lost hedge) or not an HTTP failure
+        breaker.abandon()
+        raise
+    _record(source, breaker, _is_failure(resp), time.monotonic() - start)
+    return resp
+
+
+async def aresilient_get(
+    source: str,
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None,
+) -> httpx.Response:
+    """
+    Async GET through the source's circuit breaker, hedged after the
+    source's p95 latency; a failed first attempt is retried once when no
+    hedge was sent. Hedges and retries spend from the global retry budget.
+
+    Returns / raises like resilient_get.
+    """
+    breaker = _admit(source)
+
+    primary = asyncio.create_task(_aattempt(source, breaker, url, params, timeout))
+    attempts = {primary}
+    hedged = False
+
+    delay = hedge_delay(source)
+    if delay is not None:
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        if not done and breaker.closed and retry_budget.try_spend(source, "hedge"):
+            metrics.increment("http.hedge.sent", source=source)
+            attempts.add(asyncio.create_task(_aattempt(source, breaker, url, params, timeout)))
+            hedged = True
+
+    pending = set(attempts)
+    last: Optional[asyncio.Task] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                last = task
+                if task.exception() is None and not _is_failure(task.result()):
+                    if task is not primary:
+                        metrics.increment("http.hedge.won", source=source)
+                    return task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    error = last.exception()
+    retryable = error is None or isinstance(error, httpx.HTTPError)
+    if retryable and not hedged and breaker.closed and retry_budget.try_spend(source, "retry"):
+        metrics.increment("http.retry.sent", source=source)
+        return await _aattempt(source, breaker, url, params, timeout)
+
+    if error is not None:
+        raise error
+    return last.result()
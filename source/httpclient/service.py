@@ -0,0 +1,220 @@
+"""
+Process-wide outbound HTTP clients
+
+One pooled httpx.Client (for sync code paths) and one httpx.AsyncClient
+(for the event loop) are shared by every external trial source, so TCP
+and TLS connections are reused across searches instead of being set up
+for each request.
+"""
+
+import asyncio
+import importlib.util
+import threading
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from source.httpclient.config import HttpClientConfig
+from source.logger import service as logger_service
+
+log = logger_service.get_logger(__name__)
+
+http_settings = HttpClientConfig()
+
+_lock = threading.Lock()
+_sync_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+_host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_async_host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+def _http2_enabled() -> bool:
+    """
+    HTTP/2 is off unless HTTP_ENABLE_HTTP2 is set; it needs the 'h2'
+    package (httpx[http2] in requirements.txt)
+    """
+    if not http_settings.HTTP_ENABLE_HTTP2:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        log.warning("HTTP_ENABLE_HTTP2 is set but 'h2' is not installed, using HTTP/1.1")
+        return False
+    return True
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        connect=http_settings.HTTP_CONNECT_TIMEOUT,
+        read=http_settings.HTTP_READ_TIMEOUT,
+        write=http_settings.HTTP_READ_TIMEOUT,
+        pool=http_settings.HTTP_POOL_TIMEOUT,
+    )
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=http_settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=http_settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=http_settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Get the shared (pooled, keep-alive) sync HTTP client
+
+    Returns:
+        httpx.Client: The process-wide client
+    """
+    global _sync_client
+    if _sync_client is None:
+        with _lock:
+            if _sync_client is None:
+                _sync_client = httpx.Client(
+                    timeout=_timeout(),
+                    limits=_limits(),
+                    http2=_http2_enabled(),
+                )
+    return _sync_client
+
+
+def _retire_async_client(client: httpx.AsyncClient, loop: Optional[asyncio.AbstractEventLoop]):
+    """
+    Close a client created on another event loop, on that loop (its
+    connections belong to it).
+    """
+    try:
+        if loop is None or loop.is_closed():
+            # The loop's transports are gone with it; nothing can be awaited
+            # any more, dropping the client releases its sockets
+            log.warning("get_async_http_client: previous event loop closed before its HTTP client")
+        elif loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        else:
+            # this thread is running the new loop, so drive the old one from another
+            closer = threading.Thread(target=loop.run_until_complete, args=(client.aclose(),))
+            closer.start()
+            closer.join(timeout=http_settings.HTTP_POOL_TIMEOUT)
+    except Exception as e:
+        log.warning(f"get_async_http_client: closing the previous client failed - {e}")
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Get the shared (pooled, keep-alive) async HTTP client
+
+    The client is bound to the running event loop; if called from a
+    different loop (e.g. a one-off asyncio.run in a script) a new client
+    is created for that loop and the previous one is closed on its own
+    loop. Scripts should await aclose_http_clients() before their loop
+    ends, so the pool is closed while it still can be.
+
+    Returns:
+        httpx.AsyncClient: The client for the running loop
+    """
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        if _async_client is not None:
+            _retire_async_client(_async_client, _async_client_loop)
+        _async_client = httpx.AsyncClient(
+            timeout=_timeout(),
+            limits=_limits(),
+            http2=_http2_enabled(),
+        )
+        _async_client_loop = loop
+        _async_host_semaphores.clear()
+    return _async_client
+
+
+def _host_of(url: str) -> str:
+    return urlsplit(url).netloc.lower()
+
+
+def _host_semaphore(host: str) -> threading.BoundedSemaphore:
+    sem = _host_semaphores.get(host)
+    if sem is None:
+        with _lock:
+            sem = _host_semaphores.setdefault(
+                host, threading.BoundedSemaphore(http_settings.HTTP_MAX_CONNECTIONS_PER_HOST)
+            )
+    return sem
+
+
+def _async_host_semaphore(host: str) -> asyncio.Semaphore:
+    sem = _async_host_semaphores.get(host)
+    if sem is None:
+        sem = asyncio.Semaphore(http_settings.HTTP_MAX_CONNECTIONS_PER_HOST)
+        _async_host_semaphores[host] = sem
+    return sem
+
+
+def http_get(
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None,
+) -> httpx.Response:
+    """
+    GET through the shared sync client, honouring the per-host limit
+
+    Args:
+        url (str): Absolute URL
+        params (dict): Query parameters
+        timeout (float): Optional overall timeout overriding the configured one
+
+    Returns:
+        httpx.Response: The response
+    """
+    client = get_http_client()
+    with _host_semaphore(_host_of(url)):
+        if timeout is None:
+            return client.get(url, params=params)
+        return client.get(url, params=params, timeout=timeout)
+
+
+async def ahttp_get(
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None,
+) -> httpx.Response:
+    """
+    GET through the shared async client, honouring the per-host limit
+
+    Args:
+        url (str): Absolute URL
+        params (dict): Query parameters
+        timeout (float): Optional overall timeout overriding the configured one
+
+    Returns:
+        httpx.Response: The response
+    """
+    client = get_async_http_client()
+    async with _async_host_semaphore(_host_of(url)):
+        if timeout is None:
+            return await client.get(url, params=params)
+        return await client.get(url, params=params, timeout=timeout)
+
+
+def close_http_clients():
+    """
+    Close the shared sync client (call on application shutdown)
+    """
+    global _sync_client
+    with _lock:
+        if _sync_client is not None:
+            _sync_client.close()
+            _sync_client = None
+
+
+async def aclose_http_clients():
+    """
+    Close both shared clients (call on application shutdown)
+    """
+    global _async_client, _async_client_loop
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+        _async_client_loop = None
+    close_http_clients()
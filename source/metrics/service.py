@@ -0,0 +1,74 @@
+"""
+In-process metrics registry
+
+Lightweight counters and latency summaries for subsystems that need to
+report what they are doing (response cache, outbound sources, sync jobs).
+Values are per worker process; GET /metrics returns the current snapshot.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict, Tuple
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = defaultdict(float)
+_gauges: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+
+def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def increment(name: str, value: float = 1, **labels):
+    """
+    Increment a counter
+
+    Args:
+        name (str): Metric name, e.g. "response_cache.hit"
+        value (float): Amount to add
+        labels: Optional labels, e.g. source="ctgov"
+    """
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def set_gauge(name: str, value: float, **labels):
+    """
+    Set a gauge to an absolute value
+
+    Args:
+        name (str): Metric name
+        value (float): Current value
+        labels: Optional labels
+    """
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def get_counter(name: str, **labels) -> float:
+    """
+    Read a single counter value (0 if never incremented)
+    """
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def _format(key: Tuple[str, Tuple[Tuple[str, str], ...]]) -> str:
+    name, labels = key
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+
+def snapshot() -> Dict[str, Dict[str, float]]:
+    """
+    Snapshot of all metrics of this worker process
+
+    Returns:
+        dict: {"counters": {...}, "gauges": {...}}
+    """
+    with _lock:
+        return {
+            "counters": {_format(k): v for k, v in sorted(_counters.items())},
+            "gauges": {_format(k): v for k, v in sorted(_gauges.items())},
+        }
@@ -5,6 +5,7 @@ import uuid
 from datetime import datetime, timezone
 
 from source.modules.PatientProfile.model import PatientProfile
+from source.modules.matching.profile_features import refresh_feature_vector
 from source.modules.user.models import Users
 from .schemas import (
     PatientProfileRequest,
@@ -51,6 +52,8 @@ def add_patient_profile(db: Session, user_id: str, request: PatientProfileReques
         modified_by=SYSTEM_UUID
     )
 
+    refresh_feature_vector(db, new_profile)
+
     db.add(new_profile)
     db.commit()
     db.refresh(new_profile)
@@ -97,6 +100,9 @@ def update_patient_profile(db: Session, user_id: str, request: PatientProfileUpd
     profile.modified_at = datetime.now(timezone.utc)
     profile.modified_by = uuid.UUID(user_id)
 
+    # Ranking features are cached on the profile, not rebuilt per search
+    refresh_feature_vector(db, profile)
+
     db.commit()
     db.refresh(profile)
 
@@ -56,6 +56,9 @@ class PatientProfile(BaseDbModel, TimeStampMixin, CreatorModifierMixin, SoftDele
     primary_provider_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), nullable=True)
     prescreening: Mapped[dict | None] = mapped_column(JSON, nullable=True)
 
+    # Cached ranking features (matching/profile_features.py), rebuilt on every save
+    feature_vector: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+
     # Preferences
     consent_to_share: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
     contact_preference: Mapped[str | None] = mapped_column(String(32), nullable=True)
@@ -7,6 +7,7 @@ import re
 
 from sqlalchemy.orm import Session
 
+from source.modules.matching.explain import explain_matches
 from source.modules.matching.service import fetch_trials_with_fallbacks
 from .model import AIChatSession
 from .classifier_model import classify_text
@@ -397,10 +398,11 @@ def extract_keywords_for_trials(question: str) -> str:
 
 def find_trials_for_chatbot(question: str) -> List[Dict[str, Any]]:
     """
-    Uses the same multi-source matching engine as the Search page.
+    Uses the same multi-source matching engine as the Search page, so the
+    outbound calls go through the shared pooled HTTP client as well.
     """
     query = extract_keywords_for_trials(question)
-    trials = fetch_trials_with_fallbacks(query, desired_limit=5)
+    trials = explain_matches(query, fetch_trials_with_fallbacks(query, desired_limit=5))
 
     results: List[Dict[str, Any]] = []
     for t in trials:
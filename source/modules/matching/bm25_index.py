@@ -0,0 +1,437 @@
+"""
+In-process BM25 inverted index over trial title, summary and conditions.
+
+Used as the candidate generator for the local mirror: the query is scored
+against the whole corpus here, and only the top-k NCT ids are loaded from
+the `trials` table.
+
+Postings layout (per term, sorted by doc id):
+  - first doc id stored separately (uint32)
+  - remaining doc ids delta-encoded and packed with the smallest width that
+    fits the largest gap of that term (uint8 / uint16 / uint32)
+  - term frequencies clipped to 255 and stored as uint8 (BM25 saturates
+    long before that)
+  - terms found in at least DENSE_TERM_FRACTION of the documents are kept
+    as a dense uint8 tf column instead (one byte per document, which is
+    smaller than their postings and can be gathered for any doc directly)
+
+The index is published as a memory-mapped snapshot (source/snapshot), so
+every worker shares the same pages.
+
+Build:
+    python -m source.modules.matching.bm25_index
+"""
+
+import argparse
+import heapq
+import re
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from source.logger import service as logger_service
+from source.modules.trails.model import Trial
+from source.snapshot.service import (
+    Snapshot,
+    SnapshotHandle,
+    StringLookup,
+    string_lookup_arrays,
+    write_snapshot,
+)
+
+log = logger_service.get_logger(__name__)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+BUILD_CHUNK_SIZE = 2000
+
+SNAPSHOT_KIND = "bm25"
+SNAPSHOT_SCHEMA_VERSION = 1
+
+# Terms in at least this share of documents are stored as dense tf columns
+DENSE_TERM_FRACTION = 0.125
+
+# Above this many candidates, pre-select with argpartition before the heap
+HEAP_PRESELECT_FACTOR = 8
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_WIDTH_DTYPES = {1: np.uint8, 2: np.uint16, 4: np.uint32}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase alphanumeric tokens, minus English stop words and 1-char tokens.
+    """
+    return [
+        tok for tok in _TOKEN_RE.findall((text or "").lower())
+        if len(tok) > 1 and tok not in ENGLISH_STOP_WORDS
+    ]
+
+
+def bm25_document_text(title: Optional[str], summary: Optional[str], conditions: Optional[List[str]]) -> str:
+    return " ".join([title or "", summary or "", " ".join(conditions or [])])
+
+
+class BM25Index:
+    """
+    Read-only BM25 index (see module docstring for the postings layout).
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], k1: float = BM25_K1, b: float = BM25_B):
+        self.terms = StringLookup(arrays["terms"], arrays["terms__order"])
+        self.nct_ids = StringLookup(arrays["nct_ids"], arrays["nct_ids__order"])
+        self.term_first = arrays["term_first"]
+        self.term_count = arrays["term_count"]
+        self.term_width = arrays["term_width"]
+        self.term_doc_offset = arrays["term_doc_offset"]
+        self.term_post_offset = arrays["term_post_offset"]
+        self.term_dense_row = arrays["term_dense_row"]
+        self.doc_blob = arrays["doc_blob"]
+        self.tf_blob = arrays["tf_blob"]
+        self.dense_tf = arrays["dense_tf"]
+        # Per-document length normalisation and per-term idf / upper bound
+        # are computed at build time, so loading is zero-copy
+        self.doc_norm = arrays["doc_norm"]
+        self.idf = arrays["idf"]
+        self.term_upper = arrays["term_upper"]
+        self.n_docs = len(self.nct_ids)
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Snapshot) -> "BM25Index":
+        return cls(snapshot.arrays, k1=snapshot.meta["k1"], b=snapshot.meta["b"])
+
+    def _term_ids(self, query: str) -> List[int]:
+        tokens = list(dict.fromkeys(tokenize(query)))
+        return sorted({int(t) for t in self.terms.get_many(tokens) if t >= 0})
+
+    def postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Decode the postings of one term.
+
+        Returns:
+            tuple: (doc ids as int64, term frequencies as float32)
+        """
+        row = int(self.term_dense_row[term_id])
+        if row >= 0:
+            docs = np.flatnonzero(self.dense_tf[row])
+            return docs, self.dense_tf[row][docs].astype(np.float32)
+
+        n = int(self.term_count[term_id])
+        width = int(self.term_width[term_id])
+        offset = int(self.term_doc_offset[term_id])
+
+        docs = np.empty(n, dtype=np.int64)
+        docs[0] = self.term_first[term_id]
+        if n > 1:
+            deltas = self.doc_blob[offset: offset + (n - 1) * width].view(_WIDTH_DTYPES[width])
+            np.cumsum(deltas, dtype=np.int64, out=docs[1:])
+            docs[1:] += docs[0]
+
+        start = int(self.term_post_offset[term_id])
+        tfs = self.tf_blob[start: start + n].astype(np.float32)
+        return docs, tfs
+
+    def _weights(self, term_id: int, docs: Optional[np.ndarray], tfs: np.ndarray) -> np.ndarray:
+        norm = self.doc_norm if docs is None else self.doc_norm[docs]
+        return self.idf[term_id] * (self.k1 + 1.0) * tfs / (tfs + norm)
+
+    def _add_term(self, scores: np.ndarray, term_id: int) -> Optional[np.ndarray]:
+        """
+        Add a term's contribution to every document containing it.
+
+        Returns:
+            ndarray: The doc ids touched, or None for a dense term (any doc)
+        """
+        row = int(self.term_dense_row[term_id])
+        if row >= 0:
+            scores += self._weights(term_id, None, self.dense_tf[row].astype(np.float32))
+            return None
+        docs, tfs = self.postings(term_id)
+        scores[docs] += self._weights(term_id, docs, tfs)
+        return docs
+
+    def _add_term_to(self, scores: np.ndarray, term_id: int, candidates: np.ndarray):
+        """
+        Add a term's contribution to the given (sorted) candidates only.
+        """
+        row = int(self.term_dense_row[term_id])
+        if row >= 0:
+            tfs = self.dense_tf[row][candidates].astype(np.float32)
+            scores[candidates] += self._weights(term_id, candidates, tfs)
+            return
+        docs, tfs = self.postings(term_id)
+        pos = np.searchsorted(docs, candidates)
+        pos[pos >= len(docs)] = 0
+        hit = docs[pos] == candidates
+        hit_docs = candidates[hit]
+        scores[hit_docs] += self._weights(term_id, hit_docs, tfs[pos[hit]])
+
+    @staticmethod
+    def _kth_score(values: np.ndarray, k: int, floor: float = 0.0) -> float:
+        """
+        k-th largest value (0 if there are fewer than k).
+
+        `floor` must be a known lower bound of the answer; only values at or
+        above it are partitioned.
+        """
+        if floor > 0.0:
+            values = values[values >= floor]
+        if len(values) < k:
+            return floor
+        return float(np.partition(values, len(values) - k)[len(values) - k])
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """
+        Top-k trials for a query (exact BM25 ranking).
+
+        Terms are processed rarest first (MaxScore). As soon as the summed
+        upper bounds of the remaining, more common terms cannot lift a
+        document that matched none of the terms so far above the current
+        k-th score, those terms are only applied to the existing candidates
+        that can still reach the top-k.
+
+        Returns:
+            list: [(nct_id, bm25_score)] best first
+        """
+        term_ids = self._term_ids(query)
+        if not term_ids or k <= 0:
+            return []
+
+        ordered = sorted(term_ids, key=lambda t: -self.idf[t])
+        remaining_upper = np.cumsum([self.term_upper[t] for t in ordered][::-1])[::-1]
+
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        threshold = 0.0
+        # docs hit so far, while only sparse terms were applied
+        seen: Optional[np.ndarray] = np.zeros(self.n_docs, dtype=bool)
+        touched: List[np.ndarray] = []
+
+        # 1) essential terms: every posting may still enter the top-k
+        i = 0
+        while i < len(ordered) and (threshold == 0.0 or remaining_upper[i] >= threshold):
+            docs = self._add_term(scores, ordered[i])
+            if docs is None or seen is None:
+                seen = None
+                threshold = self._kth_score(scores, k, threshold)
+            else:
+                touched.append(docs[~seen[docs]])
+                seen[docs] = True
+                threshold = self._kth_score(scores[np.concatenate(touched)], k, threshold)
+            i += 1
+
+        if seen is not None:
+            candidates = np.flatnonzero(seen)
+        elif i < len(ordered):
+            candidates = np.flatnonzero(scores + remaining_upper[i] >= threshold)
+        else:
+            candidates = np.flatnonzero(scores >= threshold)
+
+        # 2) non-essential terms: only candidates that can still make it
+        for j in range(i, len(ordered)):
+            candidates = candidates[scores[candidates] + remaining_upper[j] >= threshold]
+            self._add_term_to(scores, ordered[j], candidates)
+            threshold = self._kth_score(scores[candidates], k, threshold)
+
+        if len(candidates) > k * HEAP_PRESELECT_FACTOR:
+            cut = len(candidates) - k * HEAP_PRESELECT_FACTOR
+            candidates = candidates[np.argpartition(scores[candidates], cut)[cut:]]
+
+        top = heapq.nlargest(k, zip(scores[candidates].tolist(), candidates.tolist()))
+        return [(self.nct_ids[doc], round(score, 4)) for score, doc in top if score > 0]
+
+
+def _doc_norm(doc_len: np.ndarray, k1: float, b: float) -> np.ndarray:
+    """
+    Per-document length normalisation (k1 * (1 - b + b * len / avgdl)).
+    """
+    avgdl = float(doc_len.mean()) if len(doc_len) else 1.0
+    return (k1 * (1.0 - b + b * doc_len / max(avgdl, 1e-9))).astype(np.float32)
+
+
+def build_bm25_arrays(
+    docs: Iterable[Tuple[str, str]],
+    k1: float = BM25_K1,
+    b: float = BM25_B,
+) -> Dict[str, Any]:
+    """
+    Build the index arrays from (nct_id, text) pairs.
+    """
+    vocab: Dict[str, int] = {}
+    post_terms = array("I")
+    post_docs = array("I")
+    post_tfs = array("B")
+    doc_len_buf = array("I")
+    nct_ids: List[str] = []
+
+    for doc_id, (nct_id, text) in enumerate(docs):
+        tokens = tokenize(text)
+        nct_ids.append(nct_id)
+        doc_len_buf.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            term_id = vocab.setdefault(term, len(vocab))
+            post_terms.append(term_id)
+            post_docs.append(doc_id)
+            post_tfs.append(min(tf, 255))
+
+    n_docs = len(nct_ids)
+    n_terms = len(vocab)
+    doc_len = np.frombuffer(doc_len_buf, dtype=np.uint32).astype(np.float32)
+
+    terms_arr = np.frombuffer(post_terms, dtype=np.uint32)
+    docs_arr = np.frombuffer(post_docs, dtype=np.uint32)
+    tfs_arr = np.frombuffer(post_tfs, dtype=np.uint8)
+
+    order = np.lexsort((docs_arr, terms_arr))
+    terms_arr, docs_arr, tfs_arr = terms_arr[order], docs_arr[order], tfs_arr[order]
+
+    term_count = np.bincount(terms_arr, minlength=n_terms).astype(np.uint32)
+    term_start = np.zeros(n_terms, dtype=np.int64)
+    if n_terms:
+        term_start[1:] = np.cumsum(term_count, dtype=np.int64)[:-1]
+
+    # Per-term max of tf * (k1 + 1) / (tf + norm), the MaxScore upper bound
+    tfs_f = tfs_arr.astype(np.float32)
+    weights = tfs_f * (k1 + 1.0) / (tfs_f + _doc_norm(doc_len, k1, b)[docs_arr])
+    term_max_weight = (
+        np.maximum.reduceat(weights, term_start).astype(np.float32)
+        if n_terms else np.zeros(0, dtype=np.float32)
+    )
+    del tfs_f, weights
+
+    dense_min_df = max(1, int(np.ceil(n_docs * DENSE_TERM_FRACTION)))
+    dense_terms = np.flatnonzero(term_count >= dense_min_df)
+    term_dense_row = np.full(n_terms, -1, dtype=np.int32)
+    term_dense_row[dense_terms] = np.arange(len(dense_terms), dtype=np.int32)
+    dense_tf = np.zeros((len(dense_terms), n_docs), dtype=np.uint8)
+
+    term_first = np.zeros(n_terms, dtype=np.uint32)
+    term_width = np.ones(n_terms, dtype=np.uint8)
+    term_doc_offset = np.zeros(n_terms, dtype=np.uint64)
+    term_post_offset = np.zeros(n_terms, dtype=np.uint64)
+    doc_chunks: List[bytes] = []
+    tf_chunks: List[np.ndarray] = []
+    doc_blob_size = 0
+    tf_blob_size = 0
+    for term_id in range(n_terms):
+        start = int(term_start[term_id])
+        end = start + int(term_count[term_id])
+        postings = docs_arr[start:end]
+
+        row = int(term_dense_row[term_id])
+        if row >= 0:
+            dense_tf[row, postings] = tfs_arr[start:end]
+            continue
+
+        term_first[term_id] = postings[0]
+        deltas = np.diff(postings)
+        biggest = int(deltas.max()) if len(deltas) else 0
+        width = 1 if biggest < 1 << 8 else 2 if biggest < 1 << 16 else 4
+        # keep every block aligned to its own width
+        pad = (-doc_blob_size) % width
+        if pad:
+            doc_chunks.append(b"\0" * pad)
+            doc_blob_size += pad
+        packed = deltas.astype(_WIDTH_DTYPES[width]).tobytes()
+        term_width[term_id] = width
+        term_doc_offset[term_id] = doc_blob_size
+        doc_chunks.append(packed)
+        doc_blob_size += len(packed)
+
+        term_post_offset[term_id] = tf_blob_size
+        tf_chunks.append(tfs_arr[start:end])
+        tf_blob_size += end - start
+
+    terms = [""] * n_terms
+    for term, term_id in vocab.items():
+        terms[term_id] = term
+
+    doc_norm = _doc_norm(doc_len, k1, b)
+    df = term_count.astype(np.float64)
+    idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    return {
+        **string_lookup_arrays("terms", terms),
+        **string_lookup_arrays("nct_ids", nct_ids),
+        "term_first": term_first,
+        "term_count": term_count,
+        "term_width": term_width,
+        "term_doc_offset": term_doc_offset,
+        "term_post_offset": term_post_offset,
+        "term_dense_row": term_dense_row,
+        "doc_blob": np.frombuffer(b"".join(doc_chunks), dtype=np.uint8),
+        "tf_blob": np.concatenate(tf_chunks) if tf_chunks else np.zeros(0, dtype=np.uint8),
+        "dense_tf": dense_tf,
+        "doc_norm": doc_norm,
+        "idf": idf,
+        # Largest score a term can add to any single document
+        "term_upper": (idf * term_max_weight).astype(np.float64),
+    }
+
+
+_handle: SnapshotHandle[BM25Index] = SnapshotHandle(
+    SNAPSHOT_KIND, SNAPSHOT_SCHEMA_VERSION, BM25Index.from_snapshot
+)
+
+
+def get_bm25_index() -> Optional[BM25Index]:
+    """
+    Memory-mapped index of the current snapshot generation (None if it was
+    never built).
+    """
+    return _handle.get()
+
+
+def _iter_mirror_documents(db: Session) -> Iterable[Tuple[str, str]]:
+    stmt = (
+        select(Trial.nct_id, Trial.title, Trial.summary, Trial.conditions)
+        .order_by(Trial.nct_id)
+        .execution_options(yield_per=BUILD_CHUNK_SIZE)
+    )
+    for nct_id, title, summary, conditions in db.execute(stmt):
+        yield nct_id, bm25_document_text(title, summary, conditions)
+
+
+def build_bm25_index(db: Session) -> int:
+    """
+    Build the index from the trials mirror and publish it as a new
+    snapshot generation.
+
+    Returns:
+        int: Number of indexed trials
+    """
+    arrays = build_bm25_arrays(_iter_mirror_documents(db))
+    snapshot = write_snapshot(
+        SNAPSHOT_KIND, SNAPSHOT_SCHEMA_VERSION, arrays, meta={"k1": BM25_K1, "b": BM25_B}
+    )
+
+    n_docs = len(arrays["nct_ids"])
+    log.info(
+        f"build_bm25_index: {n_docs} trials, {len(arrays['terms'])} terms, "
+        f"{len(arrays['dense_tf'])} dense terms -> {snapshot.path}"
+    )
+    return n_docs
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Build the BM25 index over the trials mirror")
+    parser.parse_args(argv)
+
+    from source.database.service import SessionLocal
+
+    db = SessionLocal()
+    try:
+        build_bm25_index(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Matching configuration
+"""
+
+from pydantic_settings import BaseSettings
+
+
+class MatchingConfig(BaseSettings):
+    """
+    Matching / ranking configuration
+    """
+
+    EMBEDDING_MODEL_NAME: str = "sentence-transformers/all-MiniLM-L6-v2"
+    """Hugging Face sentence-embedding model exported by `embeddings export`"""
+
+    EMBEDDING_MODEL_DIR: str = ".cache/models/minilm-onnx-int8"
+    """Directory with the int8 ONNX model + tokenizer"""
+
+    EMBEDDING_MAX_LENGTH: int = 256
+    """Tokens per text (longer trial texts are truncated)"""
+
+    EMBEDDING_BATCH_SIZE: int = 32
+    """Texts per ONNX Runtime call"""
+
+    EMBEDDING_THREADS: int = 1
+    """intra-op threads per worker for query-time inference"""
+
+    EMBEDDING_NPROBE: int = 32
+    """IVF lists scanned per query (recall vs latency)"""
+
+    EMBEDDING_MAX_ENCODES: int = 32
+    """Non-indexed trials (CT.gov / paper results) embedded per request; the rest get no dense score"""
+
+    EMBEDDING_SIMILARITY_FLOOR: float = 0.2
+    """Cosine similarity of unrelated texts for the model; dense scores are rescaled from it to 1"""
+
+    HYBRID_DENSE_WEIGHT: float = 0.4
+    """Weight of the rescaled dense similarity in the confidence score (the lexical one gets the rest)"""
+
+    HYBRID_RRF_K: int = 60
+    """Reciprocal rank fusion constant for merging BM25 and dense results"""
+
+    DISTANCE_CANDIDATE_FACTOR: int = 5
+    """Candidates fetched per requested result when ranking / filtering by distance"""
+
+    DISTANCE_MAX_CANDIDATES: int = 200
+    """Upper bound on candidates fetched for distance ranking"""
+
+    FILTER_OVERFETCH_ROUNDS: int = 3
+    """Mirror fetch rounds when filters leave fewer trials than requested"""
+
+    FILTER_OVERFETCH_SLACK: float = 1.5
+    """Extra margin on the candidates estimated from the filter pass rate"""
+
+    FILTER_MAX_CANDIDATES: int = 1000
+    """Upper bound on mirror candidates ranked for a filtered search"""
+
+    CTGOV_PAGE_SIZE: int = 200
+    """Studies per CT.gov page (at least the requested limit, at most 1000)"""
+
+    CTGOV_MAX_PAGES: int = 5
+    """Upper bound on CT.gov pages read for one search"""
+
+    CTGOV_REFINE_PAGES: int = 1
+    """Pages read after the CT.gov top-k is full, while they still change it"""
+
+    RERANK_WEIGHT_TEXT: float = 1.0
+    """Weight of the text relevance (TF-IDF / embedding similarity) in the profile re-ranking"""
+
+    RERANK_WEIGHT_DIAGNOSES: float = 0.15
+    """Bonus weight of profile diagnoses matching the trial title / conditions / summary"""
+
+    RERANK_WEIGHT_MEDICATIONS: float = 0.05
+    """Bonus weight of profile medications mentioned by the trial"""
+
+    RERANK_WEIGHT_AGE: float = 0.05
+    """Bonus weight of the patient's age sitting mid-range of the trial's age limits"""
+
+    RERANK_WEIGHT_SMOKING: float = 0.05
+    """Bonus weight of smoking-related trials for current / former smokers"""
+
+    RERANK_WEIGHT_LOCATION: float = 0.10
+    """Bonus weight of proximity to the nearest trial site"""
+
+    RERANK_DISTANCE_SCALE_KM: float = 100.0
+    """Distance at which the proximity feature has decayed to 1/e"""
+
+    REMATCH_WORKERS: int = 2
+    """Processes scoring patient chunks in the nightly re-matching job (1 = inline)"""
+
+    REMATCH_CHUNK_SIZE: int = 200
+    """Patients per re-matching task"""
+
+    REMATCH_MIN_SCORE: float = 0.2
+    """Lowest score of a changed trial that still goes into a patient's feed"""
+
+    REMATCH_MAX_PER_PATIENT: int = 20
+    """Feed entries written per patient and run (best scores first)"""
+
+    REMATCH_MAX_QUERIES_PER_PATIENT: int = 20
+    """Most recent distinct saved searches re-run per patient"""
+
+    REMATCH_INITIAL_LOOKBACK_HOURS: int = 24
+    """Delta window of the very first run (later runs start at the previous one)"""
+
+    REMATCH_FEED_RETENTION_DAYS: int = 30
+    """Feed entries older than this are deleted at the end of a run"""
+
+    SEARCH_DEADLINE_MS: int = 8000
+    """Default end-to-end budget of a search (TrialMatchRequest.deadline_ms overrides it)"""
+
+    SEARCH_PERSIST_MIN_MS: int = 500
+    """Statement timeout floor for storing the match, even past the deadline"""
+
+    class Config:
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        extra = "ignore"
+
+
+matching_settings = MatchingConfig()
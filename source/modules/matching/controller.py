@@ -1,15 +1,59 @@
 # source/modules/matching/controller.py
 
+import base64
+import heapq
+import json
 import uuid
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, AsyncIterator, List, Tuple
 
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, insert, select, tuple_
 from sqlalchemy.orm import Session
 
+from source.base.schemas import PaginatedListData
+from source.database.service import SessionLocal
+from source.logger import service as logger_service
 from source.modules.PatientProfile.model import PatientProfile
-from .model import TrialMatch
-from .schemas import TrialMatchRequest, TrialMatchResponse, TrialInfo
-from .service import fetch_trials_with_fallbacks
+from source.modules.trails.geo import annotate_distances, resolve_location
+from .config import matching_settings
+from .deadline import Deadline, has_time
+from .eligibility import PatientEligibility
+from .explain import explain_matches, full_explanation
+from .filters import SearchFilters
+from .model import MatchFeedItem, TrialMatch
+from .profile_features import (
+    cached_feature_vector,
+    refresh_feature_vector,
+    rerank_with_profile,
+    vector_origin,
+)
+from .schemas import (
+    MatchFeedItemInfo,
+    MatchFeedResponse,
+    TrialExplanationResponse,
+    TrialInfo,
+    TrialMatchBatchRequest,
+    TrialMatchHistoryItem,
+    TrialMatchBatchResponse,
+    TrialMatchRequest,
+    TrialMatchResponse,
+)
+from .service import (
+    SOURCE_EMBEDDINGS,
+    afetch_trials_batch,
+    afetch_trials_coalesced,
+    aiter_source_results,
+    complete_with_fallbacks,
+    compute_confidence_scores,
+    fetch_trials_coalesced,
+    trial_key,
+)
+from .snapshots import rehydrate_matches, snapshot_matches
+from .tfidf_model import get_tfidf_model
+
+log = logger_service.get_logger(__name__)
 
 
 def _get_patient_profile_data(db: Session, user_id: str) -> Optional[Dict[str, Any]]:
@@ -25,81 +69,200 @@ def _get_patient_profile_data(db: Session, user_id: str) -> Optional[Dict[str, A
     if isinstance(profile.diagnoses, dict):
         conditions = list(profile.diagnoses.keys())
 
+    feature_vector = cached_feature_vector(profile)
+    if feature_vector is None:
+        # Profile saved before feature vectors existed (or an older layout):
+        # build it once and keep it
+        refresh_feature_vector(db, profile)
+        db.commit()
+        feature_vector = cached_feature_vector(profile)
+
     return {
         "age": getattr(profile, "age", None),
         "gender": getattr(profile, "gender", None),
         "conditions": conditions,
         "location": getattr(profile, "location", None),
+        "feature_vector": feature_vector,
     }
 
 
-def create_trial_match_entry(
+def _resolve_patient_origin(
+    db: Session,
+    request: TrialMatchRequest,
+    profile_data: Optional[Dict[str, Any]]
+) -> Optional[Tuple[float, float]]:
+    """
+    Patient coordinates: explicit lat/lng on the request, otherwise the
+    profile location (resolved when the profile was saved, or against the
+    mirror now; None if unknown).
+    """
+    if request.patient_lat is not None and request.patient_lng is not None:
+        return request.patient_lat, request.patient_lng
+
+    cached = vector_origin((profile_data or {}).get("feature_vector"))
+    if cached is not None:
+        return cached
+
+    location = (profile_data or {}).get("location")
+    if not location:
+        return None
+    try:
+        return resolve_location(db, location)
+    except Exception as e:
+        log.warning(f"_resolve_patient_origin: could not resolve '{location}' - {e}")
+        return None
+
+
+def _load_patient_context(
     db: Session,
     user_id: str,
     request: TrialMatchRequest
-) -> TrialMatchResponse:
+) -> Tuple[Optional[PatientEligibility], Optional[Tuple[float, float]], Optional[Dict[str, Any]]]:
     """
-    Main matching pipeline:
-      1) Optionally read patient profile (future personalization hook)
-      2) Fetch trials from external sources with fallbacks
-      3) Apply simple filters (status, location substring)
-      4) Sort (confidence | title | status)
-      5) Store JSONB in trial_matches
-      6) Return detailed trial objects with confidence & explanation
+    Returns:
+        tuple: (eligibility prefilter from the profile, patient coordinates,
+        cached profile feature vector for re-ranking)
     """
-    # 1) (Optional) Patient profile – currently unused, but available
-    _ = _get_patient_profile_data(db, user_id=user_id)
+    profile_data = _get_patient_profile_data(db, user_id=user_id)
+    return (
+        PatientEligibility.from_profile_data(profile_data),
+        _resolve_patient_origin(db, request, profile_data),
+        (profile_data or {}).get("feature_vector"),
+    )
 
-    # 2) Fetch with fallbacks (guaranteed non-empty)
-    desired_limit = request.limit or 10
-    all_trials = fetch_trials_with_fallbacks(
-        request.query_text,
-        desired_limit=desired_limit,
+
+def _uses_distance(request: TrialMatchRequest) -> bool:
+    return (request.sort_by or "").lower() == "distance" or request.max_distance_km is not None
+
+
+def _candidate_limit(request: TrialMatchRequest, desired_limit: int) -> int:
+    """
+    Distance ranking needs a wider candidate pool than the page it returns.
+    """
+    if not _uses_distance(request):
+        return desired_limit
+    return max(
+        desired_limit,
+        min(
+            desired_limit * matching_settings.DISTANCE_CANDIDATE_FACTOR,
+            matching_settings.DISTANCE_MAX_CANDIDATES,
+        ),
     )
 
-    # 3) Apply filters (status, location substring)
+
+_RANKING_ONLY_KEYS = ("sites", "inclusion_keywords", "exclusion_keywords")
+
+
+def _filter_and_sort(
+    all_trials: List[Dict[str, Any]],
+    request: TrialMatchRequest,
+    desired_limit: int,
+    origin: Optional[Tuple[float, float]] = None,
+    profile_vector: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Apply filters (status / location are pushed down to the sources and
+    re-checked here; max distance), re-rank with the patient profile and
+    select the top desired_limit with a bounded heap (no full sort). With a
+    patient origin, every trial gets the distance to its nearest site.
+    Trials that fail a filter are never returned, even if nothing is left.
+    Explanations and snippets are only built for the returned trials.
+    """
+    if origin is not None:
+        annotate_distances(origin[0], origin[1], all_trials)
+
+    filters = SearchFilters.from_request(request)
+
     filtered: List[Dict[str, Any]] = []
     for t in all_trials:
-        ok = True
-
-        if request.filter_status:
-            status = (t.get("status") or "").lower()
-            if request.filter_status.lower() not in status:
-                ok = False
+        ok = filters.matches(t)
 
-        if ok and request.filter_location_contains:
-            loc = (t.get("location") or "").lower()
-            if request.filter_location_contains.lower() not in loc:
+        if ok and origin is not None and request.max_distance_km is not None:
+            distance = t.get("distance_km")
+            if distance is None or distance > request.max_distance_km:
                 ok = False
 
         if ok:
             filtered.append(t)
 
-    if not filtered:
-        # If filters remove everything, fall back to unfiltered list
-        filtered = all_trials
+    # Profile-aware re-ranking: one batched scoring pass over the survivors
+    rerank_with_profile(filtered, profile_vector)
 
-    # 4) Sort
     sort_by = (request.sort_by or "confidence").lower()
 
+    # heapq.nsmallest / nlargest keep ties in input order, like a stable sort
     if sort_by == "title":
-        filtered.sort(key=lambda x: (x.get("title") or "").lower())
+        result = heapq.nsmallest(desired_limit, filtered, key=lambda x: (x.get("title") or "").lower())
     elif sort_by == "status":
-        filtered.sort(key=lambda x: (x.get("status") or "").lower())
+        result = heapq.nsmallest(desired_limit, filtered, key=lambda x: (x.get("status") or "").lower())
+    elif sort_by == "distance" and origin is not None:
+        # nearest first; trials without coordinates last, by confidence
+        result = heapq.nsmallest(desired_limit, filtered, key=lambda x: (
+            x.get("distance_km") is None,
+            x.get("distance_km") or 0.0,
+            -x.get("confidence_score", 0.0),
+        ))
     else:
-        # default: confidence (the frontend maps "distance" -> "confidence"
-        # and does distance sorting on the client using lat/lng)
-        filtered.sort(key=lambda x: x.get("confidence_score", 0.0), reverse=True)
+        # default: confidence (also "distance" when the patient location is unknown)
+        result = heapq.nlargest(desired_limit, filtered, key=lambda x: x.get("confidence_score", 0.0))
+
+    # per-site data and criteria keywords are only needed for ranking /
+    # prefiltering
+    for t in result:
+        for key in _RANKING_ONLY_KEYS:
+            t.pop(key, None)
+    return explain_matches(request.query_text, result)
+
 
-    # Truncate to requested limit
-    filtered = filtered[:desired_limit]
+def _request_deadline(request: TrialMatchRequest) -> Deadline:
+    return Deadline.from_ms(request.deadline_ms or matching_settings.SEARCH_DEADLINE_MS)
+
+
+def _set_statement_timeout(db: Session, deadline: Deadline):
+    timeout_ms = max(int(deadline.remaining() * 1000), matching_settings.SEARCH_PERSIST_MIN_MS)
+    db.execute(select(func.set_config("statement_timeout", str(timeout_ms), True)))
+
+
+def _build_response(
+    entry_id: uuid.UUID,
+    user_id: str,
+    request: TrialMatchRequest,
+    trials: List[Dict[str, Any]],
+    deadline: Optional[Deadline]
+) -> TrialMatchResponse:
+    return TrialMatchResponse(
+        match_id=str(entry_id),
+        user_id=user_id,
+        query_text=request.query_text,
+        matched_trials=[TrialInfo(**t) for t in trials],
+        partial=deadline.partial if deadline is not None else False,
+        skipped_sources=list(deadline.skipped_sources) if deadline is not None else [],
+    )
+
+
+def _persist_and_build_response(
+    db: Session,
+    user_id: str,
+    request: TrialMatchRequest,
+    trials: List[Dict[str, Any]],
+    deadline: Optional[Deadline] = None
+) -> TrialMatchResponse:
+    """
+    Store the ranked trials in trial_matches (as references into
+    trial_snapshots) and build the response. The inserts run under a
+    statement timeout of the time left until the deadline (at least
+    SEARCH_PERSIST_MIN_MS, so a late search is still stored and gets its
+    match_id).
+    """
+    if deadline is not None:
+        _set_statement_timeout(db, deadline)
 
-    # 5) Persist in DB as JSONB
+    [refs] = snapshot_matches(db, [trials])
     entry = TrialMatch(
         id=uuid.uuid4(),
         user_id=uuid.UUID(user_id),
         query_text=request.query_text,
-        matched_trials=filtered,
+        matched_trials=refs,
         created_at=datetime.utcnow(),
         modified_at=datetime.utcnow(),
     )
@@ -108,13 +271,494 @@ def create_trial_match_entry(
     db.commit()
     db.refresh(entry)
 
-    # 6) Build response
-    trial_infos = [TrialInfo(**t) for t in filtered]
+    return _build_response(entry.id, str(entry.user_id), request, trials, deadline)
+
+
+def _persist_batch_and_build_responses(
+    db: Session,
+    user_id: str,
+    requests: List[TrialMatchRequest],
+    results: List[List[Dict[str, Any]]],
+    deadline: Deadline
+) -> List[TrialMatchResponse]:
+    """
+    Store all matches of a batch with one multi-row INSERT (plus one for
+    the snapshots they reference) and one commit.
+    """
+    _set_statement_timeout(db, deadline)
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            "id": uuid.uuid4(),
+            "user_id": uuid.UUID(user_id),
+            "query_text": request.query_text,
+            "matched_trials": refs,
+            "created_at": now,
+            "modified_at": now,
+        }
+        for request, refs in zip(requests, snapshot_matches(db, results))
+    ]
+    db.execute(insert(TrialMatch), rows)
+    db.commit()
+
+    return [
+        _build_response(row["id"], user_id, request, trials, deadline)
+        for row, request, trials in zip(rows, requests, results)
+    ]
+
+
+def create_trial_match_entry(
+    db: Session,
+    user_id: str,
+    request: TrialMatchRequest
+) -> TrialMatchResponse:
+    """
+    Main matching pipeline:
+      1) Read patient profile (age / sex / conditions for the eligibility
+         prefilter); resolve the patient location for distances
+      2) Fetch trials from external sources with fallbacks; status and
+         location filters are pushed down into the source queries,
+         ineligible trials are masked out before scoring, and identical
+         concurrent searches share one fetch (single-flight)
+      3) Apply filters (status, location substring, max distance) and
+         re-rank with the patient feature vector (diagnoses, medications,
+         age, smoking, proximity)
+      4) Sort (confidence | title | status | distance)
+      5) Store JSONB in trial_matches
+      6) Return detailed trial objects with confidence & explanation
+
+    Every stage runs against one request deadline; what it cut off is
+    reported as partial / skipped_sources on the response.
+    """
+    deadline = _request_deadline(request)
+
+    # 1) Patient eligibility, coordinates (explicit on the request or from
+    #    the profile) and the cached profile feature vector
+    patient, origin, profile_vector = _load_patient_context(db, user_id, request)
+
+    # 2) Fetch with fallbacks (non-empty unless a filter matches nothing)
+    desired_limit = request.limit or 10
+    all_trials = fetch_trials_coalesced(
+        request.query_text,
+        desired_limit=_candidate_limit(request, desired_limit),
+        filters=SearchFilters.from_request(request, patient),
+        deadline=deadline,
+    )
+
+    # 3) + 4) Filter, re-rank with the profile, sort, truncate
+    filtered = _filter_and_sort(all_trials, request, desired_limit, origin, profile_vector)
+
+    # 5) + 6) Persist and respond
+    return _persist_and_build_response(db, user_id, request, filtered, deadline)
+
+
+async def acreate_trial_match_entry(
+    db: Session,
+    user_id: str,
+    request: TrialMatchRequest
+) -> TrialMatchResponse:
+    """
+    Async matching pipeline used by POST /api/matching/search.
+
+    Same steps as create_trial_match_entry, but the external sources are
+    fetched concurrently on the event loop. The (sync) SQLAlchemy session is
+    only touched from the threadpool, so no worker thread is held while we
+    wait on CT.gov / Semantic Scholar.
+    """
+    deadline = _request_deadline(request)
+
+    patient, origin, profile_vector = await run_in_threadpool(
+        _load_patient_context, db, user_id, request
+    )
+
+    desired_limit = request.limit or 10
+    all_trials = await afetch_trials_coalesced(
+        request.query_text,
+        desired_limit=_candidate_limit(request, desired_limit),
+        filters=SearchFilters.from_request(request, patient),
+        deadline=deadline,
+    )
+
+    # re-ranking, distances and explanations are CPU work: keep them off the loop
+    filtered = await run_in_threadpool(
+        _filter_and_sort, all_trials, request, desired_limit, origin, profile_vector
+    )
+
+    return await run_in_threadpool(
+        _persist_and_build_response, db, user_id, request, filtered, deadline
+    )
+
+
+# -------------------------
+# Streaming search (NDJSON / SSE)
+# -------------------------
+def encode_stream_event(event: Dict[str, Any], fmt: str = "ndjson") -> str:
+    data = json.dumps(event, default=str, separators=(",", ":"))
+    if fmt == "sse":
+        return f"event: {event['event']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+class _IncrementalRanking:
+    """
+    Ranking state of one streamed search: every candidate is scored once,
+    when its source lands, and the top k is re-selected over all scored
+    candidates after each source.
+
+    Scores of separate batches are only comparable with the corpus TF-IDF
+    model (fixed vocabulary and idf). Without it every batch would be
+    scored by a vectorizer fitted on that batch alone, so the whole pool
+    is rescored together instead each time a source lands.
+    """
+
+    def __init__(
+        self,
+        request: TrialMatchRequest,
+        desired_limit: int,
+        deadline: Deadline,
+        origin: Optional[Tuple[float, float]],
+        profile_vector: Optional[Dict[str, Any]]
+    ):
+        self.request = request
+        self.desired_limit = desired_limit
+        self.deadline = deadline
+        self.origin = origin
+        self.profile_vector = profile_vector
+        self.scored: Dict[Any, Dict[str, Any]] = {}
+
+    def rank(self, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if get_tfidf_model() is None:
+            self.scored = {}
+        new = [dict(t) for t in candidates if trial_key(t) not in self.scored]
+        dense = has_time(self.deadline, SOURCE_EMBEDDINGS)
+        for trial in compute_confidence_scores(
+            self.request.query_text, new, dense=dense, deadline=self.deadline
+        ):
+            self.scored[trial_key(trial)] = trial
+        # copies: filtering / re-ranking rewrite scores and drop keys
+        pool = [dict(self.scored[trial_key(t)]) for t in candidates]
+        return _filter_and_sort(
+            pool, self.request, self.desired_limit, self.origin, self.profile_vector
+        )
+
+
+def _persist_in_own_session(
+    user_id: str,
+    request: TrialMatchRequest,
+    trials: List[Dict[str, Any]],
+    deadline: Deadline
+) -> TrialMatchResponse:
+    # the request-scoped session is closed once the streaming response starts
+    db = SessionLocal()
+    try:
+        return _persist_and_build_response(db, user_id, request, trials, deadline)
+    finally:
+        db.close()
+
+
+async def _stream_events(
+    user_id: str,
+    request: TrialMatchRequest,
+    deadline: Deadline,
+    patient: Optional[PatientEligibility],
+    origin: Optional[Tuple[float, float]],
+    profile_vector: Optional[Dict[str, Any]]
+) -> AsyncIterator[Dict[str, Any]]:
+    desired_limit = request.limit or 10
+    candidate_limit = _candidate_limit(request, desired_limit)
+    filters = SearchFilters.from_request(request, patient)
+    ranking = _IncrementalRanking(request, desired_limit, deadline, origin, profile_vector)
+
+    try:
+        # 1) ranked top k after each source
+        collected: List[Dict[str, Any]] = []
+        async for source, collected in aiter_source_results(
+            request.query_text, candidate_limit, filters, deadline
+        ):
+            ranked = await run_in_threadpool(ranking.rank, collected)
+            yield {
+                "event": "trials",
+                "source": source,
+                "matched_trials": [TrialInfo(**t).model_dump() for t in ranked],
+            }
+
+        # 2) fallback top-up, final ranking, persist; the last event carries match_id
+        completed = await run_in_threadpool(
+            complete_with_fallbacks,
+            request.query_text, collected, candidate_limit, filters, deadline, False,
+        )
+        ranked = await run_in_threadpool(ranking.rank, completed)
+        response = await run_in_threadpool(
+            _persist_in_own_session, user_id, request, ranked, deadline
+        )
+        yield {"event": "done", **response.model_dump()}
+    except Exception as e:
+        # the status line is already sent; report the failure in-band
+        log.exception(f"_stream_events: {type(e).__name__} - {e}")
+        yield {"event": "error", "detail": "Search failed"}
+
+
+async def astream_trial_match_entry(
+    db: Session,
+    user_id: str,
+    request: TrialMatchRequest
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Streaming matching pipeline used by POST /api/matching/search/stream.
+
+    The patient context is read up front with the request session. The
+    returned iterator then yields a "trials" event with the ranked top k as
+    soon as the first source answers and again after every later source
+    (new candidates are scored once, the top k is re-selected over all of
+    them), and closes with a "done" event carrying the stored match
+    (match_id, final trials, partial / skipped_sources). Identical searches
+    are not coalesced here, since every stream reports its own progress.
+    """
+    deadline = _request_deadline(request)
+    patient, origin, profile_vector = await run_in_threadpool(
+        _load_patient_context, db, user_id, request
+    )
+    return _stream_events(user_id, request, deadline, patient, origin, profile_vector)
+
+
+def _load_batch_context(
+    db: Session,
+    user_id: str,
+    requests: List[TrialMatchRequest]
+) -> Tuple[Optional[PatientEligibility], List[Optional[Tuple[float, float]]], Optional[Dict[str, Any]]]:
+    """
+    Patient context of a batch: the profile is read once, coordinates are
+    resolved per search (each may carry its own lat/lng).
+    """
+    profile_data = _get_patient_profile_data(db, user_id=user_id)
+    return (
+        PatientEligibility.from_profile_data(profile_data),
+        [_resolve_patient_origin(db, r, profile_data) for r in requests],
+        (profile_data or {}).get("feature_vector"),
+    )
+
+
+def _filter_and_sort_batch(
+    results: List[List[Dict[str, Any]]],
+    requests: List[TrialMatchRequest],
+    desired_limits: List[int],
+    origins: List[Optional[Tuple[float, float]]],
+    profile_vector: Optional[Dict[str, Any]] = None
+) -> List[List[Dict[str, Any]]]:
+    """
+    _filter_and_sort for every search of a batch, in one threadpool call.
+    """
+    return [
+        _filter_and_sort(trials, r, limit, origin, profile_vector)
+        for trials, r, limit, origin in zip(results, requests, desired_limits, origins)
+    ]
+
+
+async def acreate_trial_match_batch(
+    db: Session,
+    user_id: str,
+    batch: TrialMatchBatchRequest
+) -> TrialMatchBatchResponse:
+    """
+    Batch matching pipeline used by POST /api/matching/search/batch.
+
+    Same steps as acreate_trial_match_entry for every search, but:
+      - the patient profile is read once for the whole batch
+      - identical upstream fetches are made once (afetch_trials_batch)
+      - all queries are scored against the union of candidates in one
+        sparse matrix product
+      - every TrialMatch row is stored with a single bulk INSERT / commit
+    """
+    deadline = Deadline.from_ms(batch.deadline_ms or matching_settings.SEARCH_DEADLINE_MS)
+    requests = batch.searches
+
+    patient, origins, profile_vector = await run_in_threadpool(
+        _load_batch_context, db, user_id, requests
+    )
+
+    desired_limits = [r.limit or 10 for r in requests]
+    results = await afetch_trials_batch(
+        [
+            (r.query_text, _candidate_limit(r, limit), SearchFilters.from_request(r, patient))
+            for r, limit in zip(requests, desired_limits)
+        ],
+        deadline=deadline,
+    )
+
+    filtered = await run_in_threadpool(
+        _filter_and_sort_batch, results, requests, desired_limits, origins, profile_vector
+    )
+
+    responses = await run_in_threadpool(
+        _persist_batch_and_build_responses, db, user_id, requests, filtered, deadline
+    )
+    return TrialMatchBatchResponse(results=responses)
+
+
+def get_match_feed(db: Session, user_id: str, limit: int = 20) -> MatchFeedResponse:
+    """
+    New matches of the patient, as written by the nightly re-matching job
+    (matching/rematch.py). A plain indexed read, nothing is scored here.
+    """
+    rows = db.execute(
+        select(MatchFeedItem)
+        .where(MatchFeedItem.user_id == uuid.UUID(user_id))
+        .order_by(MatchFeedItem.created_at.desc(), MatchFeedItem.score.desc())
+        .limit(limit)
+    ).scalars()
+    return MatchFeedResponse(
+        user_id=user_id,
+        items=[
+            MatchFeedItemInfo(
+                nct_id=row.nct_id,
+                title=row.title,
+                status=row.status,
+                location=row.location,
+                url=row.url,
+                matched_query=row.matched_query,
+                score=row.score,
+                created_at=row.created_at,
+            )
+            for row in rows
+        ],
+    )
+
+
+# -------------------------
+# Search history (keyset pagination)
+# -------------------------
+def _encode_history_cursor(created_at: datetime, match_id: uuid.UUID, page_number: int) -> str:
+    raw = json.dumps([created_at.isoformat(), str(match_id), page_number], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_history_cursor(cursor: str) -> Tuple[datetime, uuid.UUID, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, match_id, page_number = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), uuid.UUID(match_id), int(page_number)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+
+
+def get_match_history(
+    db: Session,
+    user_id: str,
+    page_size: int = 20,
+    cursor: Optional[str] = None,
+    include_trials: bool = False,
+    include_total: bool = False,
+) -> PaginatedListData[TrialMatchHistoryItem]:
+    """
+    A user's past searches, newest first, one keyset page at a time.
+
+    The page after `cursor` is found by seeking to (created_at, id) on
+    ix_trial_matches_user_created, so every page costs O(page_size) however
+    deep it is (no OFFSET). matched_trials is only read (and its snapshots
+    rehydrated in one query) when include_trials is set; the total is
+    only counted when include_total is set.
+    """
+    owner = uuid.UUID(user_id)
+    page_number = 1
+
+    columns = [TrialMatch.id, TrialMatch.query_text, TrialMatch.created_at]
+    if include_trials:
+        columns.append(TrialMatch.matched_trials)
+
+    stmt = select(*columns).where(TrialMatch.user_id == owner)
+    if cursor:
+        after_created, after_id, page_number = _decode_history_cursor(cursor)
+        stmt = stmt.where(
+            tuple_(TrialMatch.created_at, TrialMatch.id) < tuple_(after_created, after_id)
+        )
+    # one extra row tells whether there is a next page
+    rows = db.execute(
+        stmt.order_by(TrialMatch.created_at.desc(), TrialMatch.id.desc()).limit(page_size + 1)
+    ).all()
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    trials: List[Optional[List[Dict[str, Any]]]] = [None] * len(rows)
+    if include_trials:
+        trials = rehydrate_matches(db, [(row.query_text, row.matched_trials) for row in rows])
+
+    total_records = total_pages = None
+    if include_total:
+        total_records = db.execute(
+            select(func.count()).select_from(TrialMatch).where(TrialMatch.user_id == owner)
+        ).scalar_one()
+        total_pages = -(-total_records // page_size)
+
+    last = rows[-1] if rows else None
+    return PaginatedListData[TrialMatchHistoryItem](
+        list_items=[
+            TrialMatchHistoryItem(
+                match_id=str(row.id),
+                query_text=row.query_text,
+                created_at=row.created_at,
+                matched_trials=(
+                    [TrialInfo(**t) for t in row_trials] if row_trials is not None else None
+                ),
+            )
+            for row, row_trials in zip(rows, trials)
+        ],
+        total_records=total_records,
+        page_number=page_number,
+        page_size=page_size,
+        total_pages=total_pages,
+        next_cursor=(
+            _encode_history_cursor(last.created_at, last.id, page_number + 1)
+            if has_more and last is not None
+            else None
+        ),
+    )
+
+
+def get_match_explanation(
+    db: Session,
+    user_id: str,
+    match_id: str,
+    nct_id: str
+) -> TrialExplanationResponse:
+    """
+    Full explanation of one trial of a stored match, built on demand (search
+    responses only carry the short one).
+    """
+    try:
+        entry_id = uuid.UUID(match_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Match not found")
+
+    entry = db.execute(
+        select(TrialMatch.query_text, TrialMatch.matched_trials)
+        .where(TrialMatch.id == entry_id, TrialMatch.user_id == uuid.UUID(user_id))
+    ).first()
+    if entry is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Match not found")
+
+    item = next(
+        (t for t in entry.matched_trials or [] if isinstance(t, dict) and t.get("nct_id") == nct_id),
+        None,
+    )
+    trials = rehydrate_matches(db, [(entry.query_text, [item])]) if item is not None else [[]]
+    if not trials[0]:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trial not found in this match")
+    trial = trials[0][0]
 
-    resp = TrialMatchResponse(
-        match_id=str(entry.id),
-        user_id=str(entry.user_id),
+    return TrialExplanationResponse(
+        match_id=match_id,
+        nct_id=nct_id,
         query_text=entry.query_text,
-        matched_trials=trial_infos,
+        title=trial.get("title"),
+        confidence_score=trial.get("confidence_score") or 0.0,
+        explanation=full_explanation(entry.query_text, trial),
+        snippet=trial.get("snippet"),
+        score_breakdown=trial.get("score_breakdown"),
+        distance_km=trial.get("distance_km"),
+        nearest_site=trial.get("nearest_site"),
     )
-    return resp
@@ -0,0 +1,67 @@
+# source/modules/matching/deadline.py
+"""
+Per-request search deadline.
+
+One Deadline is created when a search starts and passed through every
+stage (mirror, CT.gov, Semantic Scholar, scoring, persistence). A stage
+that has no time left is skipped, or cut off, and recorded, so the
+response can say it is partial and which sources are missing.
+"""
+
+import threading
+import time
+from typing import List, Optional
+
+from source.metrics import service as metrics
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self._expires_at = time.monotonic() + seconds
+        self._lock = threading.Lock()
+        self.skipped_sources: List[str] = []
+
+    @classmethod
+    def from_ms(cls, ms: float) -> "Deadline":
+        return cls(ms / 1000.0)
+
+    def remaining(self) -> float:
+        """
+        Seconds left (0 once expired).
+        """
+        return max(0.0, self._expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self._expires_at
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.skipped_sources)
+
+    def skip(self, source: str):
+        """
+        Record a source / stage that was skipped or cut off by the deadline.
+        """
+        with self._lock:
+            if source in self.skipped_sources:
+                return
+            self.skipped_sources.append(source)
+        metrics.increment("search.deadline_skipped", source=source)
+
+
+def time_left(deadline: Optional[Deadline]) -> Optional[float]:
+    """
+    Seconds left, or None without a deadline (usable as a timeout).
+    """
+    return deadline.remaining() if deadline is not None else None
+
+
+def has_time(deadline: Optional[Deadline], source: str) -> bool:
+    """
+    Whether `source` may still run; records it as skipped otherwise.
+    """
+    if deadline is None or not deadline.expired:
+        return True
+    deadline.skip(source)
+    return False
@@ -0,0 +1,143 @@
+# source/modules/matching/eligibility.py
+"""
+Eligibility prefilter against the patient profile.
+
+Trials carry the structured eligibility extracted at ingest
+(trails/eligibility.py): age limits in years, sex, and inclusion /
+exclusion keywords. A candidate batch is checked with numpy masks
+before anything is scored, so ineligible trials are never ranked,
+serialized or stored. Unknown values never exclude: a trial without
+age limits, or a patient without a date of birth, passes the age check.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import Text, and_, cast, not_, or_
+from sqlalchemy.dialects.postgresql import ARRAY, array
+from sqlalchemy.sql.elements import ColumnElement
+
+from source.modules.trails.eligibility import criteria_keywords
+from source.modules.trails.model import Trial
+
+
+def _profile_sex(gender: Optional[str]) -> Optional[str]:
+    """
+    Free-text profile gender -> FEMALE / MALE (None when it does not say)
+    """
+    value = (gender or "").strip().lower()
+    if value in ("f", "female", "woman", "girl"):
+        return "FEMALE"
+    if value in ("m", "male", "man", "boy"):
+        return "MALE"
+    return None
+
+
+def _condition_terms(condition: str) -> Tuple[str, ...]:
+    # tokenized like the criteria keywords, so the sets are comparable
+    return tuple(sorted(criteria_keywords(condition)))
+
+
+@dataclass(frozen=True)
+class PatientEligibility:
+    """
+    The parts of a patient profile that trial eligibility is checked against.
+
+    conditions: one tuple of keyword terms per diagnosis; a trial is
+        excluded when all terms of a condition are among its exclusion
+        keywords but not all among its inclusion keywords
+    """
+
+    age: Optional[float] = None
+    sex: Optional[str] = None
+    conditions: Tuple[Tuple[str, ...], ...] = ()
+
+    @classmethod
+    def from_profile_data(cls, profile_data: Optional[Dict[str, Any]]) -> Optional["PatientEligibility"]:
+        if not profile_data:
+            return None
+        conditions = tuple(sorted({
+            terms for terms in (_condition_terms(c) for c in profile_data.get("conditions") or [])
+            if terms
+        }))
+        patient = cls(
+            age=profile_data.get("age"),
+            sex=_profile_sex(profile_data.get("gender")),
+            conditions=conditions,
+        )
+        return patient if patient.active else None
+
+    @property
+    def active(self) -> bool:
+        return self.age is not None or self.sex is not None or bool(self.conditions)
+
+    def cache_key(self) -> List[Any]:
+        return [self.age, self.sex, [list(c) for c in self.conditions]]
+
+    def mirror_clauses(self) -> List[ColumnElement]:
+        """
+        Same checks as eligibility_mask, as WHERE clauses on the `trials` mirror.
+        """
+        clauses: List[ColumnElement] = []
+        if self.age is not None:
+            clauses.append(or_(Trial.min_age_years.is_(None), Trial.min_age_years <= self.age))
+            clauses.append(or_(Trial.max_age_years.is_(None), Trial.max_age_years >= self.age))
+        if self.sex is not None:
+            clauses.append(or_(Trial.sex.is_(None), Trial.sex.in_(["ALL", self.sex])))
+        for terms in self.conditions:
+            terms_array = cast(array(list(terms)), ARRAY(Text))
+            clauses.append(not_(and_(
+                Trial.exclusion_keywords.contains(terms_array),
+                not_(Trial.inclusion_keywords.contains(terms_array)),
+            ).is_(True)))
+        return clauses
+
+
+def _float_column(trials: List[Dict[str, Any]], key: str) -> np.ndarray:
+    # None -> NaN; comparisons against NaN are False, so unknown limits pass
+    return np.array([t.get(key) for t in trials], dtype=float)
+
+
+def _excluded_by_condition(trial: Dict[str, Any], patient: PatientEligibility) -> bool:
+    exclusion = trial.get("exclusion_keywords")
+    if not exclusion:
+        return False
+    exclusion = set(exclusion)
+    inclusion = set(trial.get("inclusion_keywords") or ())
+    return any(
+        exclusion.issuperset(terms) and not inclusion.issuperset(terms)
+        for terms in patient.conditions
+    )
+
+
+def eligibility_mask(trials: List[Dict[str, Any]], patient: PatientEligibility) -> np.ndarray:
+    """
+    Boolean mask of the trials the patient may be eligible for.
+    """
+    mask = np.ones(len(trials), dtype=bool)
+    if not trials:
+        return mask
+
+    if patient.age is not None:
+        mask &= ~(_float_column(trials, "min_age_years") > patient.age)
+        mask &= ~(_float_column(trials, "max_age_years") < patient.age)
+
+    if patient.sex is not None:
+        sexes = np.array([t.get("sex") or "ALL" for t in trials], dtype=object)
+        mask &= (sexes == "ALL") | (sexes == patient.sex)
+
+    if patient.conditions:
+        # keyword sets only for trials that passed the cheap checks
+        for i in np.flatnonzero(mask):
+            if _excluded_by_condition(trials[i], patient):
+                mask[i] = False
+
+    return mask
+
+
+def filter_eligible(trials: List[Dict[str, Any]], patient: Optional[PatientEligibility]) -> List[Dict[str, Any]]:
+    if patient is None or not trials:
+        return trials
+    mask = eligibility_mask(trials, patient)
+    return [t for t, ok in zip(trials, mask) if ok]
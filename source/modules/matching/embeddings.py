@@ -0,0 +1,625 @@
+# source/modules/matching/embeddings.py
+"""
+Dense (sentence-embedding) retrieval over the trials mirror.
+
+Lexical scoring (BM25 / TF-IDF) cannot connect a patient's "heart attack"
+with a trial about "myocardial infarction". Here a small sentence-embedding
+model, exported to ONNX and int8-quantized, runs on CPU with onnxruntime:
+
+  - offline: every mirror trial is embedded in batches and the vectors are
+    stored int8 (per-vector scale) in an IVF index (k-means coarse
+    quantizer + inverted lists), published as a memory-mapped snapshot
+  - query time: only the query is embedded; the nprobe closest lists are
+    scanned and the top-k NCT ids returned
+
+Build:
+    python -m source.modules.matching.embeddings export   # ONNX export + int8 quantization
+    python -m source.modules.matching.embeddings build    # embed the mirror + IVF index
+"""
+
+import argparse
+import heapq
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from source.logger import service as logger_service
+from source.modules.trails.model import Trial
+from source.snapshot.service import (
+    Snapshot,
+    SnapshotHandle,
+    StringLookup,
+    string_lookup_arrays,
+    write_snapshot,
+)
+from .config import matching_settings
+from .deadline import Deadline, has_time
+
+log = logger_service.get_logger(__name__)
+
+SOURCE_EMBEDDINGS = "embeddings"  # dense re-scoring stage, reported like a source when skipped
+
+BUILD_CHUNK_SIZE = 2000
+
+SNAPSHOT_KIND = "embeddings"
+SNAPSHOT_SCHEMA_VERSION = 1
+
+ONNX_MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model_quantized.onnx"
+
+# Query embeddings are reused by retrieval and by compute_confidence_scores
+QUERY_CACHE_SIZE = 256
+
+KMEANS_ITERATIONS = 12
+KMEANS_SAMPLE_PER_LIST = 64
+
+
+def embedding_document_text(
+    title: Optional[str],
+    conditions: Optional[List[str]],
+    summary: Optional[str],
+) -> str:
+    """
+    Text embedded for a trial. Conditions go first so they survive
+    truncation to EMBEDDING_MAX_LENGTH tokens.
+    """
+    return " ".join([title or "", "; ".join(conditions or []), summary or ""]).strip()
+
+
+# -------------------------
+# Encoder (ONNX Runtime, CPU)
+# -------------------------
+class EmbeddingEncoder:
+    """
+    Mean-pooled, L2-normalized sentence embeddings from an ONNX model.
+    """
+
+    def __init__(
+        self,
+        model_dir: str,
+        max_length: int = 256,
+        batch_size: int = 32,
+        threads: int = 1,
+    ):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = os.path.join(model_dir, QUANTIZED_MODEL_FILE)
+        if not os.path.exists(model_path):
+            model_path = os.path.join(model_dir, ONNX_MODEL_FILE)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.model_path = model_path
+
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_lock = threading.Lock()
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        tokens = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="np",
+        )
+        feed = {
+            name: tokens[name].astype(np.int64)
+            for name in ("input_ids", "attention_mask", "token_type_ids")
+            if name in self.input_names and name in tokens
+        }
+        if "token_type_ids" in self.input_names and "token_type_ids" not in feed:
+            feed["token_type_ids"] = np.zeros_like(feed["input_ids"])
+
+        hidden = self.session.run(None, feed)[0]  # (batch, seq, dim)
+
+        mask = feed["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return _l2_normalize(pooled.astype(np.float32))
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts in batches of similar length (less padding per batch).
+
+        Returns:
+            ndarray: (len(texts), dim) float32, rows L2-normalized
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        out: Optional[np.ndarray] = None
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start: start + self.batch_size]
+            vecs = self._encode_batch([texts[i] for i in idx])
+            if out is None:
+                out = np.empty((len(texts), vecs.shape[1]), dtype=np.float32)
+            out[idx] = vecs
+        return out
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """
+        Embedding of a single query (small LRU, the same query is usually
+        embedded for retrieval and again for scoring).
+        """
+        with self._query_lock:
+            cached = self._query_cache.get(query)
+            if cached is not None:
+                self._query_cache.move_to_end(query)
+                return cached
+
+        vec = self.encode([query])[0]
+
+        with self._query_lock:
+            self._query_cache[query] = vec
+            while len(self._query_cache) > QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+        return vec
+
+
+def _l2_normalize(vecs: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs / np.maximum(norms, 1e-12)
+
+
+def export_onnx_model(model_name: str, output_dir: str) -> str:
+    """
+    Export a Hugging Face sentence-embedding model to ONNX and apply
+    dynamic int8 quantization (optimum + onnxruntime). The export step also
+    needs torch, so run it on a build machine and ship the output dir.
+
+    Returns:
+        str: Path of the quantized model
+    """
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    tmp_dir = f"{output_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+    model.save_pretrained(tmp_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(tmp_dir)
+
+    quantizer = ORTQuantizer.from_pretrained(tmp_dir, file_name=ONNX_MODEL_FILE)
+    qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+    quantizer.quantize(save_dir=tmp_dir, quantization_config=qconfig)
+
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+
+    path = os.path.join(output_dir, QUANTIZED_MODEL_FILE)
+    log.info(f"export_onnx_model: {model_name} -> {path}")
+    return path
+
+
+# -------------------------
+# IVF index (int8 vectors)
+# -------------------------
+def quantize_int8(vecs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-vector int8 quantization: vec ~= codes * scale.
+    """
+    scales = np.abs(vecs).max(axis=1) / 127.0
+    scales = np.maximum(scales, 1e-12).astype(np.float32)
+    codes = np.rint(vecs / scales[:, None]).astype(np.int8)
+    return codes, scales
+
+
+class EmbeddingIndex:
+    """
+    IVF index: vectors are grouped by nearest centroid, so list `l` holds
+    rows list_offsets[l]:list_offsets[l + 1] of codes / scales / doc_ids.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.centroids = arrays["centroids"]
+        self.list_offsets = arrays["list_offsets"]
+        self.codes = arrays["codes"]
+        self.scales = arrays["scales"]
+        self.nct_ids = StringLookup(arrays["nct_ids"], arrays["nct_ids__order"])
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Snapshot) -> "EmbeddingIndex":
+        return cls(snapshot.arrays)
+
+    @property
+    def dim(self) -> int:
+        return int(self.centroids.shape[1])
+
+    def _score_rows(self, rows: np.ndarray, query_vec: np.ndarray) -> np.ndarray:
+        return (self.codes[rows].astype(np.float32) @ query_vec) * self.scales[rows]
+
+    def search(self, query_vec: np.ndarray, k: int = 10, nprobe: int = 16) -> List[Tuple[str, float]]:
+        """
+        Approximate top-k by cosine similarity (vectors are L2-normalized).
+
+        Returns:
+            list: [(nct_id, similarity)] best first
+        """
+        n_lists = len(self.centroids)
+        if k <= 0 or n_lists == 0:
+            return []
+
+        nprobe = min(nprobe, n_lists)
+        centroid_sims = self.centroids @ query_vec
+        probe = np.argpartition(centroid_sims, n_lists - nprobe)[n_lists - nprobe:]
+
+        rows = np.concatenate([
+            np.arange(self.list_offsets[l], self.list_offsets[l + 1]) for l in probe
+        ])
+        if len(rows) == 0:
+            return []
+
+        sims = self._score_rows(rows, query_vec)
+        if len(rows) > k:
+            keep = np.argpartition(sims, len(rows) - k)[len(rows) - k:]
+            rows, sims = rows[keep], sims[keep]
+
+        top = heapq.nlargest(k, zip(sims.tolist(), rows.tolist()))
+        return [(self.nct_ids[row], round(sim, 4)) for sim, row in top]
+
+    def similarities(self, nct_ids: List[Optional[str]], query_vec: np.ndarray) -> List[Optional[float]]:
+        """
+        Exact (dequantized) similarity for indexed trials, None for the rest.
+        """
+        rows = self.nct_ids.get_many([n or "" for n in nct_ids])
+        known = [i for i, r in enumerate(rows) if r >= 0]
+
+        sims: List[Optional[float]] = [None] * len(rows)
+        if known:
+            scored = self._score_rows(np.asarray([rows[i] for i in known]), query_vec)
+            for i, sim in zip(known, scored.tolist()):
+                sims[i] = sim
+        return sims
+
+    def vectors(self, nct_ids: List[Optional[str]]) -> Tuple[np.ndarray, List[int]]:
+        """
+        Dequantized vectors of the indexed trials.
+
+        Returns:
+            tuple: ((len(nct_ids), dim) array, zero rows for trials that are
+            not indexed; positions of the indexed ones)
+        """
+        rows = self.nct_ids.get_many([n or "" for n in nct_ids])
+        known = [i for i, r in enumerate(rows) if r >= 0]
+        out = np.zeros((len(rows), self.dim), dtype=np.float32)
+        if known:
+            idx = np.asarray([rows[i] for i in known])
+            out[known] = self.codes[idx].astype(np.float32) * self.scales[idx][:, None]
+        return out, known
+
+
+def train_ivf(
+    codes: np.ndarray,
+    scales: np.ndarray,
+    n_lists: int,
+    seed: int = 0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Spherical k-means on a sample, then assign every vector to its
+    nearest centroid.
+
+    Returns:
+        tuple: (centroids (n_lists, dim), assignment (n,))
+    """
+    rng = np.random.default_rng(seed)
+    n = len(codes)
+    n_lists = max(1, min(n_lists, n))
+
+    def dequantize(rows: np.ndarray) -> np.ndarray:
+        return codes[rows].astype(np.float32) * scales[rows, None]
+
+    sample_size = min(n, n_lists * KMEANS_SAMPLE_PER_LIST)
+    sample = dequantize(np.sort(rng.choice(n, size=sample_size, replace=False)))
+    centroids = sample[rng.choice(sample_size, size=n_lists, replace=False)].copy()
+
+    for _ in range(KMEANS_ITERATIONS):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        empty = np.bincount(assign, minlength=n_lists) == 0
+        # re-seed empty lists with random sample points
+        sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()))]
+        centroids = _l2_normalize(sums)
+
+    assignment = np.empty(n, dtype=np.int32)
+    for start in range(0, n, BUILD_CHUNK_SIZE * 10):
+        rows = np.arange(start, min(n, start + BUILD_CHUNK_SIZE * 10))
+        assignment[rows] = np.argmax(dequantize(rows) @ centroids.T, axis=1)
+
+    return centroids.astype(np.float32), assignment
+
+
+def build_embedding_arrays(
+    codes: np.ndarray,
+    scales: np.ndarray,
+    nct_ids: List[str],
+    n_lists: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Train the coarse quantizer and group vectors by list.
+    """
+    n = len(nct_ids)
+    if n_lists is None:
+        # ~4 * sqrt(n) lists is the usual IVF sizing
+        n_lists = max(1, int(4 * np.sqrt(n)))
+
+    centroids, assignment = train_ivf(codes, scales, n_lists)
+    order = np.argsort(assignment, kind="stable")
+    counts = np.bincount(assignment, minlength=len(centroids))
+    list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+    np.cumsum(counts, out=list_offsets[1:])
+
+    return {
+        "centroids": centroids,
+        "list_offsets": list_offsets,
+        "codes": codes[order],
+        "scales": scales[order],
+        **string_lookup_arrays("nct_ids", [nct_ids[i] for i in order]),
+    }
+
+
+# -------------------------
+# Per-worker singletons
+# -------------------------
+_encoder: Optional[EmbeddingEncoder] = None
+_encoder_loaded = False
+_encoder_lock = threading.Lock()
+
+_handle: SnapshotHandle[EmbeddingIndex] = SnapshotHandle(
+    SNAPSHOT_KIND, SNAPSHOT_SCHEMA_VERSION, EmbeddingIndex.from_snapshot
+)
+
+
+def get_embedding_encoder() -> Optional[EmbeddingEncoder]:
+    """
+    Load the ONNX encoder once per worker (None if onnxruntime / the
+    exported model is not available).
+    """
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        with _encoder_lock:
+            if not _encoder_loaded:
+                model_dir = matching_settings.EMBEDDING_MODEL_DIR
+                if os.path.isdir(model_dir):
+                    try:
+                        _encoder = EmbeddingEncoder(
+                            model_dir,
+                            max_length=matching_settings.EMBEDDING_MAX_LENGTH,
+                            batch_size=matching_settings.EMBEDDING_BATCH_SIZE,
+                            threads=matching_settings.EMBEDDING_THREADS,
+                        )
+                        log.info(f"get_embedding_encoder: loaded {_encoder.model_path}")
+                    except Exception as e:
+                        log.error(f"get_embedding_encoder: could not load {model_dir} - {e}")
+                else:
+                    log.info(f"get_embedding_encoder: {model_dir} not found, dense retrieval disabled")
+                _encoder_loaded = True
+    return _encoder
+
+
+def get_embedding_index() -> Optional[EmbeddingIndex]:
+    """
+    Memory-mapped IVF index of the current snapshot generation (None if it
+    was never built).
+    """
+    return _handle.get()
+
+
+def semantic_search(query: str, k: int = 10) -> List[Tuple[str, float]]:
+    """
+    Top-k mirror trials by embedding similarity ([] when dense retrieval
+    is not set up).
+    """
+    encoder = get_embedding_encoder()
+    index = get_embedding_index()
+    if encoder is None or index is None or not query or not query.strip():
+        return []
+    return index.search(encoder.encode_query(query), k=k, nprobe=matching_settings.EMBEDDING_NPROBE)
+
+
+def _encode_budget(n_missing: int, deadline: Optional[Deadline]) -> int:
+    """
+    How many non-indexed trials may be embedded for this request: at most
+    EMBEDDING_MAX_ENCODES, and none once the deadline has passed.
+    """
+    if not n_missing or not has_time(deadline, SOURCE_EMBEDDINGS):
+        return 0
+    return min(n_missing, matching_settings.EMBEDDING_MAX_ENCODES)
+
+
+def _trial_document_text(trial: Dict[str, Any]) -> str:
+    # same text as the indexed trials, so both get comparable vectors
+    return embedding_document_text(trial.get("title"), trial.get("conditions"), trial.get("summary"))
+
+
+def semantic_scores(
+    query: str,
+    trials: List[Dict[str, Any]],
+    deadline: Optional[Deadline] = None
+) -> Optional[np.ndarray]:
+    """
+    Cosine similarity between the query and each trial. Indexed trials use
+    their stored vectors; of the rest (CT.gov API results, papers) the first
+    EMBEDDING_MAX_ENCODES are embedded in one batch, while the deadline
+    allows. Trials left without a vector are NaN (no dense score). None
+    when the encoder is not available.
+    """
+    encoder = get_embedding_encoder()
+    if encoder is None or not trials:
+        return None
+
+    query_vec = encoder.encode_query(query)
+    index = get_embedding_index()
+    if index is not None and index.dim == len(query_vec):
+        sims = index.similarities([t.get("nct_id") for t in trials], query_vec)
+    else:
+        sims = [None] * len(trials)
+
+    missing = [i for i, s in enumerate(sims) if s is None]
+    missing = missing[:_encode_budget(len(missing), deadline)]
+    if missing:
+        vecs = encoder.encode([_trial_document_text(trials[i]) for i in missing])
+        for i, sim in zip(missing, (vecs @ query_vec).tolist()):
+            sims[i] = sim
+
+    sims = np.asarray([np.nan if s is None else s for s in sims], dtype=np.float32)
+    return np.clip(sims, 0.0, 1.0)
+
+
+def semantic_score_matrix(
+    queries: List[str],
+    trials: List[Dict[str, Any]],
+    deadline: Optional[Deadline] = None
+) -> Optional[np.ndarray]:
+    """
+    Batch variant of semantic_scores: (len(queries), len(trials)) cosine
+    similarities from one matrix product. Queries and the non-indexed
+    trials within the encode budget are each embedded in one batch; columns
+    of trials left without a vector are NaN.
+    """
+    encoder = get_embedding_encoder()
+    if encoder is None or not queries or not trials:
+        return None
+
+    query_vecs = encoder.encode(queries)
+    index = get_embedding_index()
+    if index is not None and index.dim == query_vecs.shape[1]:
+        trial_vecs, known = index.vectors([t.get("nct_id") for t in trials])
+    else:
+        trial_vecs, known = np.zeros((len(trials), query_vecs.shape[1]), dtype=np.float32), []
+
+    known_set = set(known)
+    missing = [i for i in range(len(trials)) if i not in known_set]
+    encoded = missing[:_encode_budget(len(missing), deadline)]
+    if encoded:
+        trial_vecs[encoded] = encoder.encode([_trial_document_text(trials[i]) for i in encoded])
+
+    sims = np.clip(query_vecs @ trial_vecs.T, 0.0, 1.0)
+    sims[:, missing[len(encoded):]] = np.nan
+    return sims
+
+
+# -------------------------
+# Offline build
+# -------------------------
+def _iter_mirror_documents(db: Session) -> Iterator[Tuple[str, str]]:
+    stmt = (
+        select(Trial.nct_id, Trial.title, Trial.conditions, Trial.summary)
+        .order_by(Trial.nct_id)
+        .execution_options(yield_per=BUILD_CHUNK_SIZE)
+    )
+    for nct_id, title, conditions, summary in db.execute(stmt):
+        yield nct_id, embedding_document_text(title, conditions, summary)
+
+
+def build_embedding_index(
+    db: Session,
+    encoder: EmbeddingEncoder,
+    n_lists: Optional[int] = None,
+) -> int:
+    """
+    Embed every mirror trial (batched, quantized chunk by chunk so the
+    float32 matrix is never held in full) and publish the IVF index as a
+    new snapshot generation.
+
+    Returns:
+        int: Number of indexed trials
+    """
+    total = db.execute(select(func.count()).select_from(Trial)).scalar() or 0
+
+    nct_ids: List[str] = []
+    code_blocks: List[np.ndarray] = []
+    scale_blocks: List[np.ndarray] = []
+
+    def flush(texts: List[str]):
+        codes, scales = quantize_int8(encoder.encode(texts))
+        code_blocks.append(codes)
+        scale_blocks.append(scales)
+        log.info(f"build_embedding_index: {len(nct_ids)}/{total} trials embedded")
+
+    chunk: List[str] = []
+    for nct_id, text in _iter_mirror_documents(db):
+        nct_ids.append(nct_id)
+        chunk.append(text)
+        if len(chunk) >= BUILD_CHUNK_SIZE:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+
+    if not nct_ids:
+        log.info("build_embedding_index: mirror is empty, nothing to index")
+        return 0
+
+    arrays = build_embedding_arrays(
+        np.concatenate(code_blocks), np.concatenate(scale_blocks), nct_ids, n_lists=n_lists
+    )
+
+    snapshot = write_snapshot(
+        SNAPSHOT_KIND,
+        SNAPSHOT_SCHEMA_VERSION,
+        arrays,
+        meta={"model": os.path.basename(encoder.model_path), "max_length": encoder.max_length},
+    )
+
+    log.info(
+        f"build_embedding_index: {len(nct_ids)} trials, dim={arrays['codes'].shape[1]}, "
+        f"{len(arrays['centroids'])} lists -> {snapshot.path}"
+    )
+    return len(nct_ids)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Dense retrieval model / index for the trials mirror")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Export the embedding model to int8 ONNX")
+    export.add_argument("--model", default=matching_settings.EMBEDDING_MODEL_NAME)
+    export.add_argument("--output", default=matching_settings.EMBEDDING_MODEL_DIR)
+
+    build = sub.add_parser("build", help="Embed the mirror and build the IVF index")
+    build.add_argument("--lists", type=int, default=None, help="IVF lists (default ~4*sqrt(n))")
+    build.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        export_onnx_model(args.model, args.output)
+        return
+
+    from source.database.service import SessionLocal
+
+    encoder = EmbeddingEncoder(
+        matching_settings.EMBEDDING_MODEL_DIR,
+        max_length=matching_settings.EMBEDDING_MAX_LENGTH,
+        batch_size=matching_settings.EMBEDDING_BATCH_SIZE,
+        threads=args.threads,
+    )
+    db = SessionLocal()
+    try:
+        build_embedding_index(db, encoder, n_lists=args.lists)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# source/modules/matching/explain.py
+"""
+Explanations and snippets of ranked matches.
+
+Scoring only sets confidence_score. The text shown with a match is built
+after ranking, and only for the top k trials that are returned:
+
+    explanation: one short sentence (score, and whether the profile helped)
+    snippet: the summary sentence that overlaps the search the most
+
+The full plain-language explanation (text similarity, profile features,
+distance) is built on demand by GET /api/matching/{match_id}/explain/{nct_id}.
+"""
+
+import re
+from typing import Any, Dict, List, Optional
+
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+from .config import matching_settings
+from .profile_features import profile_explanation
+
+SNIPPET_MAX_CHARS = 240
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _terms(text: str) -> set:
+    return {w for w in _WORD_RE.findall(text.lower()) if w not in ENGLISH_STOP_WORDS}
+
+
+def _profile_boosted(trial: Dict[str, Any]) -> bool:
+    breakdown = trial.get("score_breakdown") or {}
+    return any(v > 0.005 for name, v in breakdown.items() if name != "text")
+
+
+def short_explanation(trial: Dict[str, Any]) -> str:
+    confidence = trial.get("confidence_score") or 0.0
+    explanation = f"{int(confidence * 100)}% match on title, summary and conditions"
+    if _profile_boosted(trial):
+        explanation += ", raised by your profile"
+    return explanation + "."
+
+
+def trial_snippet(query: str, trial: Dict[str, Any], max_chars: int = SNIPPET_MAX_CHARS) -> Optional[str]:
+    """
+    Summary sentence sharing the most terms with the query (the first one
+    when none do), cut at a word boundary.
+    """
+    summary = (trial.get("summary") or "").strip()
+    if not summary:
+        return None
+    query_terms = _terms(query)
+    sentences = [s for s in _SENTENCE_RE.split(summary) if s.strip()]
+    best = max(sentences, key=lambda s: len(query_terms & _terms(s)))  # first on ties
+    if len(best) <= max_chars:
+        return best
+    return best[:max_chars].rsplit(" ", 1)[0] + "…"
+
+
+def explain_matches(query: str, trials: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Set the short explanation and the snippet on the trials being returned.
+    """
+    for trial in trials:
+        trial["explanation"] = short_explanation(trial)
+        trial["snippet"] = trial_snippet(query, trial)
+    return trials
+
+
+# -------------------------
+# Full explanation (on demand)
+# -------------------------
+def score_explanation(query: str, trial: Dict[str, Any], confidence: float) -> str:
+    """
+    Plain-language explanation of a text similarity score.
+    """
+    title = trial.get("title") or "this trial"
+    loc = trial.get("location") or "various locations"
+
+    return (
+        f"This match, '{title}', appears relevant to your search '{query}'. "
+        f"It is located at {loc}. The match confidence score is "
+        f"{int(confidence * 100)}%, based on similarity between your search "
+        f"and the trial details (title, summary, and conditions)."
+    )
+
+
+def full_explanation(query: str, trial: Dict[str, Any]) -> str:
+    breakdown: Optional[Dict[str, float]] = trial.get("score_breakdown")
+    confidence = trial.get("confidence_score") or 0.0
+    if breakdown and matching_settings.RERANK_WEIGHT_TEXT:
+        # the text score, before profile re-ranking
+        confidence = breakdown.get("text", 0.0) / matching_settings.RERANK_WEIGHT_TEXT
+
+    parts = [score_explanation(query, trial, confidence)]
+
+    note = profile_explanation(breakdown) if breakdown else None
+    if note:
+        parts.append(note)
+
+    distance = trial.get("distance_km")
+    if distance is not None:
+        site = trial.get("nearest_site")
+        where = f" ({site})" if site else ""
+        parts.append(f"The nearest site{where} is about {distance:.0f} km from you.")
+
+    return " ".join(parts)
@@ -0,0 +1,164 @@
+# source/modules/matching/filters.py
+"""
+Filter pushdown for trial searches.
+
+The request filters (filter_status, filter_location_contains) are turned
+into native ClinicalTrials.gov v2 parameters and local-mirror WHERE clauses,
+so sources only return trials that can be shown. `matches` is the exact
+check applied to everything that comes back (sources without native
+filtering, local fallbacks, and as a final guard).
+
+The patient's eligibility (age, sex, conditions from the profile) rides
+along: it becomes mirror WHERE clauses too, and `apply` masks every
+candidate batch with it before scoring.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import exists, false, func, or_, select
+from sqlalchemy.sql.elements import ColumnElement
+
+from source.modules.trails.model import Trial
+from .eligibility import PatientEligibility, filter_eligible
+from .schemas import TrialMatchRequest
+
+# ClinicalTrials.gov v2 overallStatus values
+CTGOV_STATUSES = [
+    "ACTIVE_NOT_RECRUITING",
+    "COMPLETED",
+    "ENROLLING_BY_INVITATION",
+    "NOT_YET_RECRUITING",
+    "RECRUITING",
+    "SUSPENDED",
+    "TERMINATED",
+    "WITHDRAWN",
+    "AVAILABLE",
+    "NO_LONGER_AVAILABLE",
+    "TEMPORARILY_NOT_AVAILABLE",
+    "APPROVED_FOR_MARKETING",
+    "WITHHELD",
+    "UNKNOWN",
+]
+
+_SITE_FIELDS = ("facility", "city", "state", "country", "zip")
+
+_NON_ALPHA_RE = re.compile(r"[^a-z]+")
+
+
+def _normalize_status(value: Optional[str]) -> str:
+    """
+    "Active, not recruiting" / "ACTIVE_NOT_RECRUITING" -> "active_not_recruiting"
+    """
+    return _NON_ALPHA_RE.sub("_", (value or "").lower()).strip("_")
+
+
+def _site_text(trial: Dict[str, Any]) -> str:
+    parts = [trial.get("location")]
+    for site in trial.get("sites") or []:
+        site = site or {}
+        parts.extend(site.get(k) for k in _SITE_FIELDS)
+    return " | ".join(p for p in parts if p).lower()
+
+
+@dataclass(frozen=True)
+class SearchFilters:
+    """
+    Filters of a TrialMatchRequest in a source-independent form.
+
+    status: case-insensitive substring of the overall status
+        ("recruiting" also matches NOT_YET_RECRUITING, as before)
+    location_contains: case-insensitive substring of any site's facility,
+        city, state, country or zip (not only the representative location)
+    patient: eligibility prefilter from the patient profile (not a request
+        filter: `active` ignores it, papers are still searched)
+    """
+
+    status: Optional[str] = None
+    location_contains: Optional[str] = None
+    patient: Optional[PatientEligibility] = None
+
+    @classmethod
+    def from_request(
+        cls,
+        request: TrialMatchRequest,
+        patient: Optional[PatientEligibility] = None
+    ) -> "SearchFilters":
+        return cls(
+            status=(request.filter_status or "").strip() or None,
+            location_contains=(request.filter_location_contains or "").strip() or None,
+            patient=patient,
+        )
+
+    @property
+    def active(self) -> bool:
+        return bool(self.status or self.location_contains)
+
+    def ctgov_statuses(self) -> Optional[List[str]]:
+        """
+        CT.gov status values matching the status filter (None = no filter,
+        [] = nothing can match).
+        """
+        if not self.status:
+            return None
+        needle = _normalize_status(self.status)
+        return [s for s in CTGOV_STATUSES if needle in s.lower()]
+
+    def can_match_ctgov(self) -> bool:
+        statuses = self.ctgov_statuses()
+        return statuses is None or bool(statuses)
+
+    def ctgov_params(self) -> Dict[str, Any]:
+        """
+        Native CT.gov v2 parameters (filter.overallStatus, query.locn).
+        """
+        params: Dict[str, Any] = {}
+        statuses = self.ctgov_statuses()
+        if statuses:
+            params["filter.overallStatus"] = ",".join(statuses)
+        if self.location_contains:
+            params["query.locn"] = self.location_contains
+        return params
+
+    def mirror_clauses(self) -> List[ColumnElement]:
+        """
+        WHERE clauses on the `trials` mirror.
+        """
+        clauses: List[ColumnElement] = []
+        statuses = self.ctgov_statuses()
+        if statuses is not None:
+            clauses.append(Trial.status.in_(statuses) if statuses else false())
+        if self.location_contains:
+            site = func.jsonb_array_elements(Trial.sites).table_valued("value").alias("site")
+            site_text = func.concat_ws(" | ", *(site.c.value.op("->>")(k) for k in _SITE_FIELDS))
+            clauses.append(
+                or_(
+                    Trial.location.icontains(self.location_contains, autoescape=True),
+                    exists(
+                        select(1).select_from(site).where(
+                            site_text.icontains(self.location_contains, autoescape=True)
+                        )
+                    ),
+                )
+            )
+        if self.patient is not None:
+            clauses.extend(self.patient.mirror_clauses())
+        return clauses
+
+    def matches(self, trial: Dict[str, Any]) -> bool:
+        if self.status:
+            if _normalize_status(self.status) not in _normalize_status(trial.get("status")):
+                return False
+        if self.location_contains:
+            if self.location_contains.lower() not in _site_text(trial):
+                return False
+        return True
+
+    def apply(self, trials: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Trials passing the request filters and the eligibility mask.
+        """
+        if self.active:
+            trials = [t for t in trials if self.matches(t)]
+        return filter_eligible(trials, self.patient)
@@ -4,7 +4,7 @@ from datetime import datetime
 from typing import Any
 from typing import TYPE_CHECKING
 
-from sqlalchemy import ForeignKey, Text, String, TIMESTAMP
+from sqlalchemy import ForeignKey, Text, String, TIMESTAMP, Float, Index, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -20,10 +20,68 @@ class TrialMatch(BaseDbModel, TimeStampMixin):
     user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     
     query_text: Mapped[str] = mapped_column(Text, nullable=False)
-    matched_trials: Mapped[Any] = mapped_column(JSONB, nullable=True)  # Store trial results as JSON
+    # Ranked references into trial_snapshots plus per-match scores
+    # (matching/snapshots.py); rehydrate_matches turns them back into trials
+    matched_trials: Mapped[Any] = mapped_column(JSONB, nullable=True)
 
     # Relationship
     user: Mapped["Users"] = relationship("Users", back_populates="trial_matches")
 
+    __table_args__ = (
+        # Search history: filter, order and keyset tiebreak all come from
+        # the index, so a page reads page_size index entries wherever it is
+        Index("ix_trial_matches_user_created", "user_id", "created_at", "id"),
+    )
+
     def __repr__(self):
         return f"<TrialMatch user_id={self.user_id} query='{self.query_text}'>"
+
+
+class TrialSnapshot(BaseDbModel):
+    """
+    One version of a trial as shown in a match, keyed by the sha256 of its
+    payload; written once and shared by every match that references it.
+    """
+    __tablename__ = "trial_snapshots"
+
+    content_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    nct_id: Mapped[str | None] = mapped_column(String(20), nullable=True, index=True)
+    payload: Mapped[Any] = mapped_column(JSONB, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False)
+
+    def __repr__(self):
+        return f"<TrialSnapshot nct_id={self.nct_id} hash={self.content_hash[:12]}>"
+
+
+class MatchFeedItem(BaseDbModel):
+    """
+    One entry of a patient's "new matches" feed, written by the nightly
+    delta re-matching job (matching/rematch.py) and served as-is by
+    GET /api/matching/feed. One row per (user, trial); a trial that changes
+    again is re-scored in place.
+    """
+    __tablename__ = "match_feed"
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    nct_id: Mapped[str] = mapped_column(String(20), nullable=False)
+
+    # What matched: a saved search or a profile condition
+    matched_query: Mapped[str] = mapped_column(Text, nullable=False)
+    score: Mapped[float] = mapped_column(Float, nullable=False)
+
+    # Denormalized so the feed needs no join
+    title: Mapped[str | None] = mapped_column(Text, nullable=True)
+    status: Mapped[str | None] = mapped_column(String(50), nullable=True)
+    location: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    url: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "nct_id", name="uq_match_feed_user_trial"),
+        Index("ix_match_feed_user_created", "user_id", "created_at"),
+    )
+
+    def __repr__(self):
+        return f"<MatchFeedItem user_id={self.user_id} nct_id={self.nct_id}>"
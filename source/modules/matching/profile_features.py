@@ -0,0 +1,268 @@
+# source/modules/matching/profile_features.py
+"""
+Profile-aware re-ranking.
+
+A patient feature vector is built from the PatientProfile when the
+profile is created or updated (PatientProfile controller) and cached on
+the row, so searches never rebuild it:
+
+    diagnoses / medications: hashed, l2-normalized term vectors
+    age: date of birth (age is taken on the day of the search)
+    smoking: 0 never / unknown, 0.5 former, 1 current
+    location: the profile location resolved to coordinates
+
+At search time the candidate set is scored in one batch: the trial texts
+are hashed into one sparse matrix, multiplied with the patient term
+vectors, and stacked with the age / smoking / proximity features into a
+(trials x features) matrix. The score is that matrix times the feature
+weights (text relevance at full weight, profile features as bonuses,
+capped at 1), and each weighted column is one feature's contribution.
+"""
+
+import re
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+from sqlalchemy.orm import Session
+
+from source.logger import service as logger_service
+from source.modules.trails.geo import resolve_location
+from .config import matching_settings
+
+log = logger_service.get_logger(__name__)
+
+FEATURE_VECTOR_VERSION = 1
+"""Bump when the vector layout changes; older cached vectors are rebuilt"""
+
+FEATURES = ("text", "diagnoses", "medications", "age", "smoking", "location")
+
+HASH_FEATURES = 2 ** 18
+
+_vectorizer = HashingVectorizer(
+    n_features=HASH_FEATURES,
+    alternate_sign=False,
+    norm="l2",
+    stop_words="english",
+)
+
+_SMOKING_RE = re.compile(r"\b(smok\w*|tobacco|cigar\w*|nicotine|vap(e|ing))\b", re.IGNORECASE)
+
+
+# -------------------------
+# Patient side (built on profile create / PATCH)
+# -------------------------
+def _term_vector(names: List[str]) -> Optional[Dict[str, List]]:
+    """
+    Sparse hashed term vector of names, as {"idx": [...], "val": [...]}.
+    """
+    text = " ".join(n for n in names if isinstance(n, str))
+    if not text.strip():
+        return None
+    row = _vectorizer.transform([text])
+    if row.nnz == 0:
+        return None
+    return {"idx": row.indices.tolist(), "val": [round(float(v), 6) for v in row.data]}
+
+
+def _smoking_level(status: Optional[str]) -> float:
+    value = (status or "").strip().lower()
+    if not value or "never" in value or "non" in value or value in ("no", "none"):
+        return 0.0
+    if "former" in value or "ex" in value.split() or "quit" in value or "past" in value:
+        return 0.5
+    if "smok" in value or "current" in value or value in ("yes", "daily", "occasional"):
+        return 1.0
+    return 0.0
+
+
+def build_feature_vector(db: Session, profile: Any) -> Dict[str, Any]:
+    """
+    Feature vector of a PatientProfile (JSON, stored in profile.feature_vector).
+    """
+    origin = None
+    location = getattr(profile, "location", None)
+    if location:
+        try:
+            origin = resolve_location(db, location)
+        except Exception as e:
+            log.warning(f"build_feature_vector: could not resolve '{location}' - {e}")
+
+    dob = profile.date_of_birth
+    return {
+        "version": FEATURE_VECTOR_VERSION,
+        "diagnoses": _term_vector(list((profile.diagnoses or {}).keys())),
+        "medications": _term_vector(list((profile.medications or {}).keys())),
+        "date_of_birth": dob.isoformat() if dob else None,
+        "smoking": _smoking_level(profile.smoking_status),
+        "lat": origin[0] if origin else None,
+        "lng": origin[1] if origin else None,
+    }
+
+
+def refresh_feature_vector(db: Session, profile: Any):
+    """
+    Rebuild and assign the cached vector (the caller commits).
+    """
+    try:
+        profile.feature_vector = build_feature_vector(db, profile)
+    except Exception as e:
+        # never block a profile save on ranking data
+        log.warning(f"refresh_feature_vector: {type(e).__name__} - {e}")
+        profile.feature_vector = None
+
+
+def cached_feature_vector(profile: Any) -> Optional[Dict[str, Any]]:
+    vector = getattr(profile, "feature_vector", None)
+    if not isinstance(vector, dict) or vector.get("version") != FEATURE_VECTOR_VERSION:
+        return None
+    return vector
+
+
+def vector_origin(vector: Optional[Dict[str, Any]]) -> Optional[tuple]:
+    if not vector or vector.get("lat") is None or vector.get("lng") is None:
+        return None
+    return vector["lat"], vector["lng"]
+
+
+def _age_years(vector: Dict[str, Any]) -> Optional[float]:
+    dob = vector.get("date_of_birth")
+    if not dob:
+        return None
+    return (date.today() - date.fromisoformat(dob)).days / 365.25
+
+
+def _column(terms: Optional[Dict[str, List]]) -> Optional[sp.csr_matrix]:
+    """
+    Stored term vector -> sparse (HASH_FEATURES x 1) column.
+    """
+    if not terms:
+        return None
+    idx = np.asarray(terms["idx"], dtype=np.int64)
+    val = np.asarray(terms["val"], dtype=np.float32)
+    return sp.csr_matrix((val, (idx, np.zeros_like(idx))), shape=(HASH_FEATURES, 1))
+
+
+# -------------------------
+# Trial side (batched per search)
+# -------------------------
+def _trial_profile_text(trial: Dict[str, Any]) -> str:
+    conditions = trial.get("conditions") or []
+    return " ".join([trial.get("title") or "", " ".join(conditions), trial.get("summary") or ""])
+
+
+def _age_fit(trials: List[Dict[str, Any]], age: Optional[float]) -> np.ndarray:
+    """
+    1 at the middle of the trial's age range, falling to 0 at its limits;
+    0.5 with a single limit, 0 without limits or patient age.
+    """
+    fit = np.zeros(len(trials), dtype=np.float32)
+    if age is None:
+        return fit
+    lo = np.array([t.get("min_age_years") for t in trials], dtype=float)
+    hi = np.array([t.get("max_age_years") for t in trials], dtype=float)
+    both = ~np.isnan(lo) & ~np.isnan(hi) & (hi > lo)
+    one = np.isnan(lo) ^ np.isnan(hi)
+    mid = (lo + hi) / 2.0
+    half = (hi - lo) / 2.0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ranged = np.clip(1.0 - np.abs(age - mid) / half, 0.0, 1.0)
+    fit[both] = ranged[both]
+    fit[one] = 0.5
+    return fit
+
+
+def _proximity(trials: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    exp(-distance / RERANK_DISTANCE_SCALE_KM) to the nearest site (0 unknown).
+    """
+    distance = np.array([t.get("distance_km") for t in trials], dtype=float)
+    prox = np.exp(-distance / matching_settings.RERANK_DISTANCE_SCALE_KM)
+    return np.nan_to_num(prox, nan=0.0).astype(np.float32)
+
+
+def feature_weights() -> np.ndarray:
+    s = matching_settings
+    return np.array([
+        s.RERANK_WEIGHT_TEXT,
+        s.RERANK_WEIGHT_DIAGNOSES,
+        s.RERANK_WEIGHT_MEDICATIONS,
+        s.RERANK_WEIGHT_AGE,
+        s.RERANK_WEIGHT_SMOKING,
+        s.RERANK_WEIGHT_LOCATION,
+    ], dtype=np.float32)
+
+
+def feature_matrix(trials: List[Dict[str, Any]], vector: Dict[str, Any]) -> np.ndarray:
+    """
+    (trials x FEATURES) matrix of raw feature values in [0, 1].
+    """
+    n = len(trials)
+    features = np.zeros((n, len(FEATURES)), dtype=np.float32)
+    features[:, 0] = [t.get("confidence_score", 0.0) for t in trials]
+
+    diagnoses = _column(vector.get("diagnoses"))
+    medications = _column(vector.get("medications"))
+    if diagnoses is not None or medications is not None:
+        texts = [_trial_profile_text(t) for t in trials]
+        trial_terms = _vectorizer.transform(texts)  # one sparse (n x HASH_FEATURES) batch
+        # cosine similarities (both sides are l2-normalized)
+        if diagnoses is not None:
+            features[:, 1] = (trial_terms @ diagnoses).toarray().ravel()
+        if medications is not None:
+            features[:, 2] = (trial_terms @ medications).toarray().ravel()
+
+    features[:, 3] = _age_fit(trials, _age_years(vector))
+
+    smoking = float(vector.get("smoking") or 0.0)
+    if smoking > 0:
+        mentions = np.array(
+            [bool(_SMOKING_RE.search(_trial_profile_text(t))) for t in trials],
+            dtype=np.float32,
+        )
+        features[:, 4] = smoking * mentions
+
+    features[:, 5] = _proximity(trials)
+    return features
+
+
+def profile_explanation(contributions: Dict[str, float]) -> Optional[str]:
+    """
+    Sentence naming the profile features that raised a score most.
+    """
+    top = sorted(
+        ((name, value) for name, value in contributions.items() if name != "text" and value > 0.005),
+        key=lambda item: -item[1],
+    )[:3]
+    if not top:
+        return None
+    parts = ", ".join(f"{name} +{int(round(value * 100))}%" for name, value in top)
+    return f"Your profile raised this match ({parts})."
+
+
+def rerank_with_profile(
+    trials: List[Dict[str, Any]],
+    vector: Optional[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Re-score trials with the patient feature vector, in one batch.
+
+    confidence_score becomes the weighted score and score_breakdown holds
+    the per-feature contributions (summing to it, before the cap; see
+    profile_explanation). Without a vector the trials are returned
+    unchanged.
+    """
+    if not trials or not vector:
+        return trials
+
+    features = feature_matrix(trials, vector)
+    contributions = features * feature_weights()  # (trials x features)
+    scores = np.minimum(contributions.sum(axis=1), 1.0)
+
+    for trial, score, row in zip(trials, scores, contributions):
+        breakdown = {name: round(float(v), 4) for name, v in zip(FEATURES, row)}
+        trial["confidence_score"] = round(float(score), 4)
+        trial["score_breakdown"] = breakdown
+    return trials
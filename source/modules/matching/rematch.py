@@ -0,0 +1,428 @@
+# source/modules/matching/rematch.py
+"""
+Nightly delta re-matching into the per-patient "new matches" feed.
+
+Only trials added or changed in the mirror since the previous run (by
+trials.modified_at) are scored, against every patient's recent saved
+searches (trial_matches.query_text) and profile conditions. Patients are
+scored in chunks on a process pool: each task vectorizes all queries of
+its chunk at once and multiplies them with the delta trials in one
+sparse product, so a run costs O(delta x queries), independent of the
+size of the mirror. Results land in `match_feed`, which
+GET /api/matching/feed reads without any scoring.
+
+Usage:
+    python -m source.modules.matching.rematch
+    python -m source.modules.matching.rematch --since 2026-10-01T00:00:00+00:00
+"""
+
+import argparse
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from source.logger import service as logger_service
+from source.metrics import service as metrics
+from source.modules.PatientProfile.model import PatientProfile
+from source.modules.trails.model import Trial, TrialSyncState
+from .config import matching_settings
+from .eligibility import PatientEligibility, eligibility_mask
+from .model import MatchFeedItem, TrialMatch
+from .service import score_queries
+
+log = logger_service.get_logger(__name__)
+
+REMATCH_JOB_NAME = "rematch_delta"
+
+# Arbitrary constant identifying the re-matching job in pg_advisory_lock
+# (next to SYNC_ADVISORY_LOCK_KEY of the mirror sync)
+REMATCH_ADVISORY_LOCK_KEY = 724_310_002
+
+# Only what scoring, the eligibility check and a feed row need
+_DELTA_COLUMNS = (
+    Trial.nct_id,
+    Trial.title,
+    Trial.summary,
+    Trial.status,
+    Trial.conditions,
+    Trial.location,
+    Trial.url,
+    Trial.min_age_years,
+    Trial.max_age_years,
+    Trial.sex,
+    Trial.inclusion_keywords,
+    Trial.exclusion_keywords,
+)
+
+
+@dataclass
+class RematchReport:
+    """
+    Outcome of one re-matching run.
+    """
+    delta_trials: int = 0
+    patients: int = 0
+    queries: int = 0
+    feed_rows: int = 0
+    pruned: int = 0
+    since: Optional[str] = None
+    until: Optional[str] = None
+    skipped_locked: bool = False
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass(frozen=True)
+class PatientQueries:
+    """
+    What one patient is re-matched with (picklable, sent to the workers).
+    """
+    user_id: str
+    queries: Tuple[str, ...]
+    eligibility: Optional[PatientEligibility] = None
+
+
+# -------------------------
+# Loading (main process)
+# -------------------------
+def _load_delta_trials(db: Session, since: datetime) -> List[Dict[str, Any]]:
+    rows = db.execute(
+        select(*_DELTA_COLUMNS)
+        .where(Trial.modified_at >= since)
+        .order_by(Trial.nct_id)
+    ).mappings()
+    trials = []
+    for row in rows:
+        trial = dict(row)
+        trial["summary"] = trial["summary"] or ""
+        trial["conditions"] = list(trial["conditions"] or [])
+        trial["inclusion_keywords"] = list(trial["inclusion_keywords"] or [])
+        trial["exclusion_keywords"] = list(trial["exclusion_keywords"] or [])
+        trial["url"] = trial["url"] or f"https://clinicaltrials.gov/study/{trial['nct_id']}"
+        trials.append(trial)
+    return trials
+
+
+def _load_saved_queries(db: Session) -> Dict[str, List[str]]:
+    """
+    Most recent distinct saved searches per user (REMATCH_MAX_QUERIES_PER_PATIENT).
+    """
+    latest = (
+        select(
+            TrialMatch.user_id,
+            TrialMatch.query_text,
+            func.row_number().over(
+                partition_by=TrialMatch.user_id,
+                order_by=func.max(TrialMatch.created_at).desc(),
+            ).label("rank"),
+        )
+        .group_by(TrialMatch.user_id, TrialMatch.query_text)
+        .subquery()
+    )
+    rows = db.execute(
+        select(latest.c.user_id, latest.c.query_text)
+        .where(latest.c.rank <= matching_settings.REMATCH_MAX_QUERIES_PER_PATIENT)
+        .order_by(latest.c.user_id, latest.c.rank)
+    )
+    saved: Dict[str, List[str]] = {}
+    for user_id, query_text in rows:
+        if query_text and query_text.strip():
+            saved.setdefault(str(user_id), []).append(query_text.strip())
+    return saved
+
+
+def load_patients(db: Session) -> List[PatientQueries]:
+    """
+    Every patient with a saved search or profile conditions.
+    """
+    saved = _load_saved_queries(db)
+
+    profiles: Dict[str, PatientProfile] = {
+        str(p.user_id): p
+        for p in db.execute(
+            select(PatientProfile).where(PatientProfile.is_deleted.is_not(True))
+        ).scalars()
+    }
+
+    patients: List[PatientQueries] = []
+    for user_id in sorted(set(saved) | set(profiles)):
+        profile = profiles.get(user_id)
+        queries = list(saved.get(user_id, []))
+        eligibility = None
+        if profile is not None:
+            queries += [c for c in profile.conditions if isinstance(c, str) and c.strip()]
+            eligibility = PatientEligibility.from_profile_data({
+                "age": profile.age,
+                "gender": profile.gender,
+                "conditions": profile.conditions,
+            })
+        # keep order, drop repeats (a condition is often also a saved search)
+        queries = list(dict.fromkeys(q.strip() for q in queries))
+        if queries:
+            patients.append(PatientQueries(user_id, tuple(queries), eligibility))
+    return patients
+
+
+def _chunks(patients: List[PatientQueries], size: int) -> Iterator[List[PatientQueries]]:
+    for start in range(0, len(patients), size):
+        yield patients[start:start + size]
+
+
+# -------------------------
+# Scoring (worker processes)
+# -------------------------
+_delta_trials: List[Dict[str, Any]] = []
+
+
+def _init_worker(trials: List[Dict[str, Any]]):
+    # the delta is shipped once per worker, not once per chunk
+    global _delta_trials
+    _delta_trials = trials
+
+
+def score_chunk(patients: List[PatientQueries]) -> List[Dict[str, Any]]:
+    """
+    Feed rows of one chunk of patients against the delta trials.
+
+    Every distinct query of the chunk is scored in one (queries x trials)
+    batch; a patient's score for a trial is their best query's score.
+    """
+    trials = _delta_trials
+    if not trials or not patients:
+        return []
+
+    queries = list(dict.fromkeys(q for p in patients for q in p.queries))
+    query_rows = {q: i for i, q in enumerate(queries)}
+    # sparse TF-IDF only: dense embeddings would cost more than the delta is worth
+    sims = score_queries(queries, trials, dense=False)
+
+    min_score = matching_settings.REMATCH_MIN_SCORE
+    per_patient = matching_settings.REMATCH_MAX_PER_PATIENT
+
+    rows: List[Dict[str, Any]] = []
+    for patient in patients:
+        sub = sims[[query_rows[q] for q in patient.queries]]  # (patient queries x trials)
+        best = sub.max(axis=0)
+        best_query = sub.argmax(axis=0)
+
+        candidates = np.flatnonzero(best >= min_score)
+        if candidates.size and patient.eligibility is not None:
+            # eligibility only for trials that scored
+            ok = eligibility_mask([trials[i] for i in candidates], patient.eligibility)
+            candidates = candidates[ok]
+        if candidates.size > per_patient:
+            top = np.argpartition(-best[candidates], per_patient - 1)[:per_patient]
+            candidates = candidates[top]
+
+        for i in candidates:
+            trial = trials[i]
+            rows.append({
+                "user_id": patient.user_id,
+                "nct_id": trial["nct_id"],
+                "matched_query": patient.queries[best_query[i]],
+                "score": round(float(best[i]), 4),
+                "title": trial.get("title"),
+                "status": trial.get("status"),
+                "location": trial.get("location"),
+                "url": trial.get("url"),
+            })
+    return rows
+
+
+# -------------------------
+# Writing (main process)
+# -------------------------
+def _write_feed(db: Session, rows: List[Dict[str, Any]], now: datetime) -> int:
+    """
+    Upsert feed rows (a trial already in a patient's feed is re-scored and
+    moves back to the top).
+    """
+    if not rows:
+        return 0
+    values = [
+        {**row, "id": uuid.uuid4(), "user_id": uuid.UUID(row["user_id"]), "created_at": now}
+        for row in rows
+    ]
+    stmt = insert(MatchFeedItem).values(values)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_match_feed_user_trial",
+        set_={
+            c: stmt.excluded[c]
+            for c in ("matched_query", "score", "title", "status", "location", "url", "created_at")
+        },
+    )
+    db.execute(stmt)
+    db.commit()
+    return len(values)
+
+
+def _prune_feed(db: Session, now: datetime) -> int:
+    cutoff = now - timedelta(days=matching_settings.REMATCH_FEED_RETENTION_DAYS)
+    result = db.execute(delete(MatchFeedItem).where(MatchFeedItem.created_at < cutoff))
+    db.commit()
+    return result.rowcount or 0
+
+
+def _score_all(
+    delta: List[Dict[str, Any]],
+    patients: List[PatientQueries],
+    workers: int,
+    chunk_size: int,
+) -> Iterator[List[Dict[str, Any]]]:
+    chunks = list(_chunks(patients, chunk_size))
+    if workers <= 1 or len(chunks) <= 1:
+        _init_worker(delta)
+        try:
+            for chunk in chunks:
+                yield score_chunk(chunk)
+        finally:
+            _init_worker([])
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(chunks)),
+        initializer=_init_worker,
+        initargs=(delta,),
+    ) as pool:
+        yield from pool.map(score_chunk, chunks)
+
+
+def run_rematch(
+    db: Session,
+    since: Optional[datetime] = None,
+    workers: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+) -> RematchReport:
+    """
+    Run one delta re-matching pass.
+
+    Args:
+        db (Session): App DB session
+        since (datetime): Override the stored watermark (start of the previous run)
+        workers (int): Scoring processes (REMATCH_WORKERS)
+        chunk_size (int): Patients per task (REMATCH_CHUNK_SIZE)
+
+    Returns:
+        RematchReport: Delta / patient / row counts and per-phase timings
+    """
+    report = RematchReport()
+    workers = workers or matching_settings.REMATCH_WORKERS
+    chunk_size = chunk_size or matching_settings.REMATCH_CHUNK_SIZE
+    total_start = time.perf_counter()
+
+    def _mark(phase: str, start: float):
+        report.timings[phase] = round(time.perf_counter() - start, 4)
+
+    # Same locking scheme as the mirror sync (trails/sync.py)
+    with db.get_bind().connect() as lock_conn:
+        locked = lock_conn.execute(
+            text("SELECT pg_try_advisory_lock(:key)"), {"key": REMATCH_ADVISORY_LOCK_KEY}
+        ).scalar()
+        lock_conn.commit()
+        if not locked:
+            log.info("run_rematch: another worker holds the re-matching lock, skipping")
+            report.skipped_locked = True
+            metrics.increment("rematch.skipped_locked")
+            return report
+
+        try:
+            # DB clock for both ends of the window, so app / DB clock skew
+            # cannot drop trials between runs
+            run_started: datetime = db.execute(select(func.now())).scalar()
+            state = db.get(TrialSyncState, REMATCH_JOB_NAME)
+            if since is None:
+                since = (
+                    state.last_run_at
+                    if state is not None and state.last_run_at is not None
+                    else run_started - timedelta(hours=matching_settings.REMATCH_INITIAL_LOOKBACK_HOURS)
+                )
+            report.since = since.isoformat()
+            report.until = run_started.isoformat()
+
+            start = time.perf_counter()
+            delta = _load_delta_trials(db, since)
+            report.delta_trials = len(delta)
+            _mark("delta", start)
+
+            if delta:
+                start = time.perf_counter()
+                patients = load_patients(db)
+                report.patients = len(patients)
+                report.queries = sum(len(p.queries) for p in patients)
+                _mark("patients", start)
+
+                # rows are written as chunks complete, so peak memory is one chunk
+                start = time.perf_counter()
+                for rows in _score_all(delta, patients, workers, chunk_size):
+                    report.feed_rows += _write_feed(db, rows, run_started)
+                _mark("score_and_write", start)
+
+            start = time.perf_counter()
+            report.pruned = _prune_feed(db, run_started)
+            _mark("prune", start)
+
+            report.timings["total"] = round(time.perf_counter() - total_start, 4)
+
+            if state is None:
+                state = TrialSyncState(name=REMATCH_JOB_NAME)
+                db.add(state)
+            state.last_run_at = run_started
+            state.last_report = report.to_dict()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            lock_conn.execute(
+                text("SELECT pg_advisory_unlock(:key)"), {"key": REMATCH_ADVISORY_LOCK_KEY}
+            )
+            lock_conn.commit()
+
+    metrics.increment("rematch.delta_trials", report.delta_trials)
+    metrics.increment("rematch.feed_rows", report.feed_rows)
+    for phase, seconds in report.timings.items():
+        metrics.set_gauge("rematch.last_phase_seconds", seconds, phase=phase)
+
+    log.info(
+        f"run_rematch: delta={report.delta_trials} patients={report.patients} "
+        f"queries={report.queries} feed_rows={report.feed_rows} pruned={report.pruned} "
+        f"window={report.since}->{report.until} timings={report.timings}"
+    )
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Re-match changed trials into the patients' new-matches feed")
+    parser.add_argument("--since", type=datetime.fromisoformat, default=None,
+                        help="Override the stored watermark (ISO timestamp with offset)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    from source.database.service import SessionLocal
+    # Every mapped class the PatientProfile / TrialMatch relationships
+    # reach, so the mappers configure outside the app
+    import source.modules.chatbot.model  # noqa: F401
+    import source.modules.symptoms.model  # noqa: F401
+    import source.modules.user.models  # noqa: F401
+
+    db = SessionLocal()
+    try:
+        report = run_rematch(db, since=args.since, workers=args.workers, chunk_size=args.chunk_size)
+        print(report.to_dict())
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,35 @@
 # source/modules/matching/router.py
 
-from fastapi import APIRouter, Depends
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
+from source.base.schemas import PaginatedListData
 from source.database.service import get_db
 from source.modules.user.auth import get_current_user_id
-from .controller import create_trial_match_entry
-from .schemas import TrialMatchRequest, TrialMatchResponse
+from .controller import (
+    acreate_trial_match_batch,
+    acreate_trial_match_entry,
+    astream_trial_match_entry,
+    encode_stream_event,
+    get_match_explanation,
+    get_match_feed,
+    get_match_history,
+)
+from .schemas import (
+    MAX_FEED_ITEMS,
+    MAX_HISTORY_PAGE_SIZE,
+    STREAM_FORMATS,
+    MatchFeedResponse,
+    TrialExplanationResponse,
+    TrialMatchBatchRequest,
+    TrialMatchBatchResponse,
+    TrialMatchHistoryItem,
+    TrialMatchRequest,
+    TrialMatchResponse,
+)
 
 router = APIRouter(prefix="/api/matching", tags=["matching"])
 
@@ -21,12 +44,131 @@ router = APIRouter(prefix="/api/matching", tags=["matching"])
         "Returns confidence scores and plain-language explanations."
     ),
 )
-def search_trials(
+async def search_trials(
     request: TrialMatchRequest,
     db: Session = Depends(get_db),
     current_user_id: str = Depends(get_current_user_id),
 ):
     """
     Search clinical trials based on user input and patient profile.
+    External sources are queried concurrently without holding a worker thread.
+    """
+    return await acreate_trial_match_entry(db=db, user_id=current_user_id, request=request)
+
+
+@router.post(
+    "/search/stream",
+    response_class=StreamingResponse,
+    summary="Search clinical trials, streaming ranked results as sources answer",
+    description=(
+        "Same search as /search, streamed as NDJSON (format=ndjson, default) or "
+        "server-sent events (format=sse). A 'trials' event with the current "
+        "ranked results is sent after each source answers, the first one usually "
+        "from the local mirror; the closing 'done' event carries the stored "
+        "match (match_id, final trials, partial, skipped_sources)."
+    ),
+)
+async def search_trials_stream(
+    request: TrialMatchRequest,
+    fmt: str = Query("ndjson", alias="format", pattern=f"^({'|'.join(STREAM_FORMATS)})$"),
+    db: Session = Depends(get_db),
+    current_user_id: str = Depends(get_current_user_id),
+):
+    """
+    Streaming variant of /search for the patient UI.
+    """
+    events = await astream_trial_match_entry(db=db, user_id=current_user_id, request=request)
+    return StreamingResponse(
+        (encode_stream_event(event, fmt) async for event in events),
+        media_type="text/event-stream" if fmt == "sse" else "application/x-ndjson",
+        # keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post(
+    "/search/batch",
+    response_model=TrialMatchBatchResponse,
+    summary="Run many trial searches in one request",
+    description=(
+        "Accepts up to 50 searches (e.g. one per diagnosis). Identical upstream "
+        "fetches are shared, all queries are scored in one pass and every "
+        "match is stored with a single bulk insert. Results are returned in "
+        "request order, each with its own match_id."
+    ),
+)
+async def search_trials_batch(
+    batch: TrialMatchBatchRequest,
+    db: Session = Depends(get_db),
+    current_user_id: str = Depends(get_current_user_id),
+):
     """
-    return create_trial_match_entry(db=db, user_id=current_user_id, request=request)
+    Batch variant of /search for care-coordination tools.
+    """
+    return await acreate_trial_match_batch(db=db, user_id=current_user_id, batch=batch)
+
+
+@router.get(
+    "/feed",
+    response_model=MatchFeedResponse,
+    summary="New trial matches for the dashboard",
+    description=(
+        "Trials added or updated since the previous nightly run that match the "
+        "patient's saved searches or profile conditions. Precomputed by the "
+        "re-matching job, so this endpoint does no scoring."
+    ),
+)
+def match_feed(
+    limit: int = Query(20, ge=1, le=MAX_FEED_ITEMS),
+    db: Session = Depends(get_db),
+    current_user_id: str = Depends(get_current_user_id),
+):
+    return get_match_feed(db=db, user_id=current_user_id, limit=limit)
+
+
+@router.get(
+    "/history",
+    response_model=PaginatedListData[TrialMatchHistoryItem],
+    summary="List past trial searches",
+    description=(
+        "The user's searches, newest first, paginated with an opaque cursor: "
+        "pass next_cursor of a page to get the next one. matched_trials is left "
+        "out unless include_trials=true, and totals are only counted with "
+        "include_total=true."
+    ),
+)
+def search_history(
+    page_size: int = Query(20, ge=1, le=MAX_HISTORY_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    include_trials: bool = Query(False),
+    include_total: bool = Query(False),
+    db: Session = Depends(get_db),
+    current_user_id: str = Depends(get_current_user_id),
+):
+    return get_match_history(
+        db=db,
+        user_id=current_user_id,
+        page_size=page_size,
+        cursor=cursor,
+        include_trials=include_trials,
+        include_total=include_total,
+    )
+
+
+@router.get(
+    "/{match_id}/explain/{nct_id}",
+    response_model=TrialExplanationResponse,
+    summary="Full explanation of one matched trial",
+    description=(
+        "Search results carry a one-line explanation and a snippet; this returns "
+        "the full plain-language explanation (text similarity, profile features, "
+        "distance) of a trial in one of the user's stored matches."
+    ),
+)
+def explain_match(
+    match_id: str,
+    nct_id: str,
+    db: Session = Depends(get_db),
+    current_user_id: str = Depends(get_current_user_id),
+):
+    return get_match_explanation(db=db, user_id=current_user_id, match_id=match_id, nct_id=nct_id)
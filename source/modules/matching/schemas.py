@@ -1,7 +1,10 @@
 # source/modules/matching/schemas.py
 
-from pydantic import BaseModel
-from typing import List, Optional
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+
+from source.base.schemas import AppBaseModel
 
 
 class TrialInfo(BaseModel):
@@ -23,6 +26,8 @@ class TrialInfo(BaseModel):
     google_maps_url: Optional[str] = None
     lat: Optional[float] = None
     lng: Optional[float] = None
+    distance_km: Optional[float] = None  # to the nearest site, when the patient location is known
+    nearest_site: Optional[str] = None
 
     # Content / explanation
     summary: Optional[str] = None
@@ -30,7 +35,13 @@ class TrialInfo(BaseModel):
 
     # AI / ranking
     confidence_score: float
+    # Short; the full text is served by GET /api/matching/{match_id}/explain/{nct_id}
     explanation: str
+    # Summary sentence that best matches the search
+    snippet: Optional[str] = None
+    # Per-feature contributions to confidence_score when the profile re-ranked it
+    # (text, diagnoses, medications, age, smoking, location)
+    score_breakdown: Optional[Dict[str, float]] = None
     ai_generated: bool = False  # True if purely from fallback / synthetic source
 
 
@@ -38,14 +49,94 @@ class TrialMatchRequest(BaseModel):
     query_text: str
     filter_status: Optional[str] = None
     filter_location_contains: Optional[str] = None
-    # The frontend still sends "confidence" | "title" | "status" | "distance"
-    # but "distance" is handled client-side; the backend treats it as confidence.
+    # "confidence" | "title" | "status" | "distance"
     sort_by: Optional[str] = "confidence"
     limit: Optional[int] = 10
 
+    # Patient location for distance ranking; when omitted, the location
+    # on the patient profile is used (if it can be resolved)
+    patient_lat: Optional[float] = Field(default=None, ge=-90, le=90)
+    patient_lng: Optional[float] = Field(default=None, ge=-180, le=180)
+    max_distance_km: Optional[float] = Field(default=None, gt=0)
+
+    # End-to-end latency budget; the server default applies when omitted.
+    # Sources not reached in time are skipped and reported on the response.
+    deadline_ms: Optional[int] = Field(default=None, gt=0, le=60000)
+
 
 class TrialMatchResponse(BaseModel):
     match_id: str
     user_id: str
     query_text: str
     matched_trials: List[TrialInfo]
+
+    # True when the deadline cut the search short; the trials are the best
+    # ranked so far and skipped_sources lists what did not contribute
+    partial: bool = False
+    skipped_sources: List[str] = Field(default_factory=list)
+
+
+class TrialExplanationResponse(BaseModel):
+    match_id: str
+    nct_id: str
+    query_text: str
+    title: Optional[str] = None
+    confidence_score: float
+    explanation: str
+    snippet: Optional[str] = None
+    score_breakdown: Optional[Dict[str, float]] = None
+    distance_km: Optional[float] = None
+    nearest_site: Optional[str] = None
+
+
+STREAM_FORMATS = ("ndjson", "sse")
+
+
+MAX_BATCH_SEARCHES = 50
+
+
+class TrialMatchBatchRequest(BaseModel):
+    # e.g. one search per diagnosis of the patient
+    searches: List[TrialMatchRequest] = Field(min_length=1, max_length=MAX_BATCH_SEARCHES)
+
+    # Budget of the whole batch (per-search deadline_ms is ignored here)
+    deadline_ms: Optional[int] = Field(default=None, gt=0, le=60000)
+
+
+class TrialMatchBatchResponse(BaseModel):
+    # One entry per search, in request order
+    results: List[TrialMatchResponse]
+
+
+MAX_FEED_ITEMS = 100
+
+
+class MatchFeedItemInfo(BaseModel):
+    nct_id: str
+    title: Optional[str] = None
+    status: Optional[str] = None
+    location: Optional[str] = None
+    url: Optional[str] = None
+
+    # The saved search or profile condition the trial matched
+    matched_query: str
+    score: float
+    created_at: datetime
+
+
+class MatchFeedResponse(BaseModel):
+    # Newest first, as written by the nightly re-matching job
+    user_id: str
+    items: List[MatchFeedItemInfo]
+
+
+MAX_HISTORY_PAGE_SIZE = 100
+
+
+class TrialMatchHistoryItem(AppBaseModel):
+    match_id: str
+    query_text: str
+    created_at: datetime
+
+    # None when the list was requested without trials (include_trials=false)
+    matched_trials: Optional[List[TrialInfo]] = None
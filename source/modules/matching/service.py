@@ -1,14 +1,37 @@
 # source/modules/matching/service.py
 
+import asyncio
+import heapq
+import json
+import math
 import re
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
 
-import requests
+import numpy as np
 from bs4 import BeautifulSoup  # still installed; not strictly needed now
 
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
+from source.cache.service import cached_get, acached_get, make_cache_key
+from source.coalesce.service import asingle_flight, single_flight
+from source.database.service import SessionLocal
+from source.httpclient.resilience import CircuitOpenError, aresilient_get, resilient_get
+from source.logger import service as logger_service
+from source.metrics import service as metrics
+from source.modules.trails.ctgov import SEARCH_FIELDS, ProtocolSection, decode_page, fields_param
+from source.modules.trails.eligibility import extract_eligibility
+from source.modules.trails.ingest import CTGOV_MAX_PAGE_SIZE, extract_sites
+from source.modules.trails.service import get_trials_by_nct_ids, search_trials_in_mirror
+from .bm25_index import get_bm25_index
+from .config import matching_settings
+from .deadline import Deadline, has_time, time_left
+from .embeddings import SOURCE_EMBEDDINGS, semantic_score_matrix, semantic_scores, semantic_search
+from .filters import SearchFilters
+from .tfidf_model import get_tfidf_model, trial_text
+
+log = logger_service.get_logger(__name__)
+
 
 
 
@@ -23,137 +46,408 @@ def build_google_maps_url(location: Optional[str]) -> Optional[str]:
 
 CTGOV_BASE_URL = "https://clinicaltrials.gov/api/v2/studies"
 
+SOURCE_LOCAL_MIRROR = "local_mirror"
+SOURCE_CTGOV = "ctgov"
+SOURCE_SEMANTIC_SCHOLAR = "semantic_scholar"
+
+# Merge priority when several sources answered
+SOURCE_PRIORITY = [SOURCE_LOCAL_MIRROR, SOURCE_CTGOV, SOURCE_SEMANTIC_SCHOLAR]
+
 
-def _extract_ctgov_location(protocol_section: Dict[str, Any]) -> Dict[str, Any]:
+def _extract_ctgov_location(protocol_section: ProtocolSection) -> Dict[str, Any]:
     """
-    Pull a single representative location (city/state/country)
-    from contactsLocationsModule if available.
+    Pull a single representative location (city/state/country) from
+    contactsLocationsModule if available, preferring a site with geoPoint
+    coordinates. All sites are returned too, for distance ranking.
     """
-    contacts = protocol_section.get("contactsLocationsModule", {}) or {}
-    locations = contacts.get("locations") or []
+    sites = extract_sites(protocol_section)
+    rep = next((s for s in sites if s["lat"] is not None), sites[0] if sites else {})
 
-    city = state = country = location_text = None
-    lat = lng = None  # CT.gov API v2 does not currently expose geo coords
+    city = rep.get("city")
+    state = rep.get("state")
+    country = rep.get("country")
 
-    if locations:
-        loc0 = locations[0] or {}
-        city = loc0.get("city")
-        state = loc0.get("state")
-        country = loc0.get("country")
-
-        parts = [p for p in [city, state, country] if p]
-        location_text = ", ".join(parts) if parts else None
+    parts = [p for p in [city, state, country] if p]
+    location_text = ", ".join(parts) if parts else None
 
     return {
         "city": city,
         "state": state,
         "country": country,
         "location": location_text,
-        "lat": lat,
-        "lng": lng,
+        "lat": rep.get("lat"),
+        "lng": rep.get("lng"),
+        "sites": sites,
+    }
+
+
+def _ctgov_params(
+    query: str,
+    limit: int,
+    filters: Optional[SearchFilters] = None
+) -> Dict[str, Any]:
+    params = {
+        "format": "json",
+        "pageSize": limit,
+        "query.term": query,
+        "fields": fields_param(SEARCH_FIELDS),
     }
+    if filters is not None:
+        params.update(filters.ctgov_params())
+    return params
+
+
+def _parse_ctgov_page(body: bytes) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Map one ClinicalTrials.gov API v2 /studies page into our trial dicts.
+
+    The body is decoded straight into typed structs (only the projected
+    fields exist), so no intermediate dict tree is built.
+
+    Returns:
+        tuple: (trials, nextPageToken or None on the last page)
+    """
+    trials: List[Dict[str, Any]] = []
+    page = decode_page(body)
+
+    for study in page.studies:
+        protocol = study.protocol_section
+
+        ident = protocol.identification_module
+        desc = protocol.description_module
+        design_mod = protocol.design_module
+        lead_sponsor = protocol.sponsor_collaborators_module.lead_sponsor
+
+        nct_id = ident.nct_id
+        title = (
+            ident.official_title
+            or ident.brief_title
+            or "Untitled clinical trial"
+        )
+
+        summary = (
+            desc.brief_summary
+            or desc.detailed_description
+            or ""
+        )
+
+        status = protocol.status_module.overall_status
+        phase = ", ".join(design_mod.phases) if design_mod.phases else None
+
+        conditions = list(protocol.conditions_module.conditions)
+
+        sponsor = lead_sponsor.name if lead_sponsor else None
+
+        loc_info = _extract_ctgov_location(protocol)
+
+        url = f"https://clinicaltrials.gov/study/{nct_id}" if nct_id else None
+        google_maps_url = build_google_maps_url(loc_info["location"])
+
+        trials.append(
+            {
+                "nct_id": nct_id,
+                "title": title,
+                "summary": summary,
+                "status": status,
+                "phase": phase,
+                "conditions": conditions,
+                "sponsor": sponsor,
+                "location": loc_info["location"],
+                "city": loc_info["city"],
+                "state": loc_info["state"],
+                "country": loc_info["country"],
+                "lat": loc_info["lat"],
+                "lng": loc_info["lng"],
+                "sites": loc_info["sites"],
+                **extract_eligibility(protocol.eligibility_module),
+                "url": url,
+                "google_maps_url": google_maps_url,
+                "ai_generated": False,
+            }
+        )
+
+    return trials, page.next_page_token
+
+
+def _ctgov_page_size(limit: int) -> int:
+    return min(max(limit, matching_settings.CTGOV_PAGE_SIZE), CTGOV_MAX_PAGE_SIZE)
+
+
+def iter_ctgov_pages(
+    query: str,
+    page_size: int,
+    filters: Optional[SearchFilters] = None,
+    deadline: Optional[Deadline] = None
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Lazily page through CT.gov search results, following nextPageToken.
+
+    A page is only requested when the consumer asks for it, and only one
+    page is held at a time. Stops after CTGOV_MAX_PAGES, on the last page,
+    or once the deadline has passed. Every page is cached on its own
+    (the page token is part of the cache key).
+    """
+    params = _ctgov_params(query, page_size, filters)
+    for _ in range(matching_settings.CTGOV_MAX_PAGES):
+        if deadline is not None and deadline.expired:
+            return
+        body = cached_get(
+            SOURCE_CTGOV, CTGOV_BASE_URL, params,
+            _ctgov_fetch(params, time_left(deadline)),
+        )
+        if body is None:
+            return
+        trials, token = _parse_ctgov_page(body)
+        yield trials
+        if not token:
+            return
+        params = {**params, "pageToken": token}
+
+
+async def aiter_ctgov_pages(
+    query: str,
+    page_size: int,
+    filters: Optional[SearchFilters] = None,
+    deadline: Optional[Deadline] = None
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Async variant of iter_ctgov_pages.
+    """
+    params = _ctgov_params(query, page_size, filters)
+    for _ in range(matching_settings.CTGOV_MAX_PAGES):
+        if deadline is not None and deadline.expired:
+            return
+        body = await acached_get(
+            SOURCE_CTGOV, CTGOV_BASE_URL, params,
+            _actgov_fetch(params, time_left(deadline)),
+        )
+        if body is None:
+            return
+        trials, token = _parse_ctgov_page(body)
+        yield trials
+        if not token:
+            return
+        params = {**params, "pageToken": token}
+
+
+def _ctgov_fetch(params: Dict[str, Any], timeout: Optional[float]):
+    # bound per page: the cache may run it later for a background refresh
+    return lambda: resilient_get(SOURCE_CTGOV, CTGOV_BASE_URL, params=params, timeout=timeout)
+
+
+def _actgov_fetch(params: Dict[str, Any], timeout: Optional[float]):
+    return lambda: aresilient_get(SOURCE_CTGOV, CTGOV_BASE_URL, params=params, timeout=timeout)
+
+
+class _CtgovTopK:
+    """
+    Best `limit` CT.gov candidates seen so far, across pages.
+
+    Candidates passing the filters go into a bounded min-heap, so memory
+    stays O(limit + page) however many pages are scanned. With the corpus
+    TF-IDF model they are ranked by its (lexical) score; without it by
+    CT.gov's own relevance order, in which the top-k is final as soon as
+    it is full.
+    """
+
+    def __init__(self, query: str, limit: int, filters: Optional[SearchFilters] = None):
+        self.query = query
+        self.limit = limit
+        self.filters = filters
+        self.model = get_tfidf_model()
+        self._heap: List[Tuple[float, int, Dict[str, Any]]] = []
+        self._seen = 0
+
+    @property
+    def full(self) -> bool:
+        return len(self._heap) >= self.limit
+
+    @property
+    def ranked(self) -> bool:
+        return self.model is not None
+
+    def add_page(self, trials: List[Dict[str, Any]]) -> bool:
+        """
+        Returns:
+            bool: True if any trial of the page entered the top-k
+        """
+        trials = _filter_trials(trials, self.filters)
+        if not trials:
+            return False
+        if self.model is not None:
+            scores = self.model.score(self.query, trials)
+        else:
+            scores = [0.0] * len(trials)
+
+        changed = False
+        for score, trial in zip(scores, trials):
+            # ties keep CT.gov's order (earlier = better)
+            item = (float(score), -self._seen, trial)
+            self._seen += 1
+            if len(self._heap) < self.limit:
+                heapq.heappush(self._heap, item)
+                changed = True
+            elif item[:2] > self._heap[0][:2]:
+                heapq.heapreplace(self._heap, item)
+                changed = True
+        return changed
+
+    def settled(self, changed: bool, refine_pages: int) -> bool:
+        """
+        Whether to stop paging: the top-k is full and can no longer change,
+        or CTGOV_REFINE_PAGES pages were scanned after it filled up.
+        """
+        if not self.full:
+            return False
+        return (
+            not self.ranked
+            or not changed
+            or refine_pages >= matching_settings.CTGOV_REFINE_PAGES
+        )
+
+    def result(self) -> List[Dict[str, Any]]:
+        return [t for _, _, t in sorted(self._heap, key=lambda item: item[:2], reverse=True)]
+
+
 
 
 def fetch_trials_from_ctgov_api(
     query: str,
-    limit: int = 5
+    limit: int = 5,
+    filters: Optional[SearchFilters] = None,
+    deadline: Optional[Deadline] = None
 ) -> List[Dict[str, Any]]:
     """
     Use ClinicalTrials.gov API v2 as the main clinical-trial source.
 
     We query by general term (query.term) so it works for conditions,
-    interventions, etc. We keep it simple and only pull one page.
+    interventions, etc. Request filters are sent as filter.overallStatus /
+    query.locn, so pages only hold trials that pass them.
+
+    Results are read lazily in large pages (CTGOV_PAGE_SIZE) until `limit`
+    candidates are collected and the top-k has settled, the results run
+    out, CTGOV_MAX_PAGES is reached or the deadline passes. Each page gets
+    the time left until the deadline as its timeout. If a later page fails,
+    the candidates collected so far are returned.
     """
-    trials: List[Dict[str, Any]] = []
+    if filters is not None and not filters.can_match_ctgov():
+        return []
 
+    top = _CtgovTopK(query, limit, filters)
+    refine_pages = 0
     try:
-        params = {
-            "format": "json",
-            "pageSize": limit,
-            "query.term": query,
-        }
-        resp = requests.get(CTGOV_BASE_URL, params=params, timeout=10)
-        if resp.status_code != 200:
-            return trials
-
-        data = resp.json()
-        studies = data.get("studies", []) or []
-
-        for study in studies:
-            protocol = study.get("protocolSection", {}) or {}
-
-            ident = protocol.get("identificationModule", {}) or {}
-            desc = protocol.get("descriptionModule", {}) or {}
-            status_mod = protocol.get("statusModule", {}) or {}
-            cond_mod = protocol.get("conditionsModule", {}) or {}
-            design_mod = protocol.get("designModule", {}) or {}
-            sponsor_mod = protocol.get("sponsorCollaboratorsModule", {}) or {}
-
-            nct_id = ident.get("nctId")
-            title = (
-                ident.get("officialTitle")
-                or ident.get("briefTitle")
-                or "Untitled clinical trial"
-            )
+        for trials in iter_ctgov_pages(query, _ctgov_page_size(limit), filters, deadline):
+            changed = top.add_page(trials)
+            if top.settled(changed, refine_pages):
+                break
+            if top.full:
+                refine_pages += 1
 
-            summary = (
-                desc.get("briefSummary")
-                or desc.get("detailedDescription")
-                or ""
-            )
+    except CircuitOpenError:
+        # Breaker open: fail fast, caller will use fallbacks.
+        pass
+    except Exception as e:
+        log.warning(f"fetch_trials_from_ctgov_api: {type(e).__name__} - {e}")
+
+    return top.result()
 
-            status = status_mod.get("overallStatus")
-            phases = design_mod.get("phases") or []
-            if isinstance(phases, list):
-                phase = ", ".join(phases) if phases else None
-            else:
-                phase = phases
-
-            conditions = cond_mod.get("conditions") or []
-
-            lead_sponsor = sponsor_mod.get("leadSponsor") or {}
-            sponsor = lead_sponsor.get("name")
-
-            loc_info = _extract_ctgov_location(protocol)
-
-            url = f"https://clinicaltrials.gov/study/{nct_id}" if nct_id else None
-            google_maps_url = build_google_maps_url(loc_info["location"])
-
-            trials.append(
-                {
-                    "nct_id": nct_id,
-                    "title": title,
-                    "summary": summary,
-                    "status": status,
-                    "phase": phase,
-                    "conditions": conditions,
-                    "sponsor": sponsor,
-                    "location": loc_info["location"],
-                    "city": loc_info["city"],
-                    "state": loc_info["state"],
-                    "country": loc_info["country"],
-                    "lat": loc_info["lat"],
-                    "lng": loc_info["lng"],
-                    "url": url,
-                    "google_maps_url": google_maps_url,
-                    "ai_generated": False,
-                }
-            )
 
-            if len(trials) >= limit:
+async def afetch_trials_from_ctgov_api(
+    query: str,
+    limit: int = 5,
+    filters: Optional[SearchFilters] = None,
+    deadline: Optional[Deadline] = None
+) -> List[Dict[str, Any]]:
+    """
+    Async variant of fetch_trials_from_ctgov_api (same paging, same mapping).
+    """
+    if filters is not None and not filters.can_match_ctgov():
+        return []
+
+    top = _CtgovTopK(query, limit, filters)
+    refine_pages = 0
+    pages = aiter_ctgov_pages(query, _ctgov_page_size(limit), filters, deadline)
+    try:
+        async for trials in pages:
+            # scoring a large page is CPU work; keep it off the event loop
+            changed = await asyncio.to_thread(top.add_page, trials)
+            if top.settled(changed, refine_pages):
                 break
+            if top.full:
+                refine_pages += 1
 
-    except Exception:
-        # We fail silently here; caller will use fallbacks.
-        return trials
+    except CircuitOpenError:
+        pass
+    except Exception as e:
+        log.warning(f"afetch_trials_from_ctgov_api: {type(e).__name__} - {e}")
+    finally:
+        await pages.aclose()
 
-    return trials
+    return top.result()
+
+
+
+SEMANTIC_SCHOLAR_URL = "https://api.semanticscholar.org/graph/v1/paper/search"
 
 
+def _semantic_scholar_params(query: str, limit: int) -> Dict[str, Any]:
+    return {
+        "query": query,
+        "limit": limit,
+        "fields": "title,abstract,url,venue,year",
+    }
+
+
+def _parse_semantic_scholar_papers(
+    data: Dict[str, Any],
+    query: str,
+    limit: int
+) -> List[Dict[str, Any]]:
+    """
+    Map Semantic Scholar papers into the same 'trial-like' structure
+    used by the rest of the system.
+    """
+    results: List[Dict[str, Any]] = []
+    for paper in data.get("data", []):
+        title = paper.get("title")
+        abstract = paper.get("abstract")
+        url_paper = paper.get("url")
+        venue = paper.get("venue")
+        year = paper.get("year")
+
+        summary = abstract or f"Research paper in {venue} ({year}) related to {query}."
+
+        results.append(
+            {
+                "nct_id": None,
+                "title": title,
+                "summary": summary,
+                "status": "NOT_AVAILABLE",
+                "phase": None,
+                "sponsor": venue,
+                "conditions": None,
+                "location": None,
+                "city": None,
+                "state": None,
+                "country": None,
+                "lat": None,
+                "lng": None,
+                "url": url_paper,
+                "google_maps_url": None,
+                "ai_generated": False,
+            }
+        )
+
+        if len(results) >= limit:
+            break
+
+    return results
+
 
 def fetch_trials_from_semantic_scholar(
     query: str,
-    limit: int = 5
+    limit: int = 5,
+    timeout: Optional[float] = None
 ) -> List[Dict[str, Any]]:
     """
     Use Semantic Scholar as a research-paper fallback. We map papers
@@ -161,51 +455,53 @@ def fetch_trials_from_semantic_scholar(
     """
     results: List[Dict[str, Any]] = []
     try:
-        url = "https://api.semanticscholar.org/graph/v1/paper/search"
-        params = {
-            "query": query,
-            "limit": limit,
-            "fields": "title,abstract,url,venue,year",
-        }
-        resp = requests.get(url, params=params, timeout=10)
-        if resp.status_code != 200:
+        params = _semantic_scholar_params(query, limit)
+        body = cached_get(
+            SOURCE_SEMANTIC_SCHOLAR, SEMANTIC_SCHOLAR_URL, params,
+            lambda: resilient_get(
+                SOURCE_SEMANTIC_SCHOLAR, SEMANTIC_SCHOLAR_URL, params=params, timeout=timeout
+            ),
+        )
+        if body is None:
             return results
 
-        data = resp.json()
-        for paper in data.get("data", []):
-            title = paper.get("title")
-            abstract = paper.get("abstract")
-            url_paper = paper.get("url")
-            venue = paper.get("venue")
-            year = paper.get("year")
-
-            summary = abstract or f"Research paper in {venue} ({year}) related to {query}."
-
-            results.append(
-                {
-                    "nct_id": None,
-                    "title": title,
-                    "summary": summary,
-                    "status": "NOT_AVAILABLE",
-                    "phase": None,
-                    "sponsor": venue,
-                    "conditions": None,
-                    "location": None,
-                    "city": None,
-                    "state": None,
-                    "country": None,
-                    "lat": None,
-                    "lng": None,
-                    "url": url_paper,
-                    "google_maps_url": None,
-                    "ai_generated": False,
-                }
-            )
+        results = _parse_semantic_scholar_papers(json.loads(body), query, limit)
 
-            if len(results) >= limit:
-                break
+    except CircuitOpenError:
+        return results
+    except Exception as e:
+        log.warning(f"fetch_trials_from_semantic_scholar: {type(e).__name__} - {e}")
+        return results
+
+    return results
+
+
+async def afetch_trials_from_semantic_scholar(
+    query: str,
+    limit: int = 5,
+    timeout: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    """
+    Async variant of fetch_trials_from_semantic_scholar.
+    """
+    results: List[Dict[str, Any]] = []
+    try:
+        params = _semantic_scholar_params(query, limit)
+        body = await acached_get(
+            SOURCE_SEMANTIC_SCHOLAR, SEMANTIC_SCHOLAR_URL, params,
+            lambda: aresilient_get(
+                SOURCE_SEMANTIC_SCHOLAR, SEMANTIC_SCHOLAR_URL, params=params, timeout=timeout
+            ),
+        )
+        if body is None:
+            return results
+
+        results = _parse_semantic_scholar_papers(json.loads(body), query, limit)
 
-    except Exception:
+    except CircuitOpenError:
+        return results
+    except Exception as e:
+        log.warning(f"afetch_trials_from_semantic_scholar: {type(e).__name__} - {e}")
         return results
 
     return results
@@ -213,6 +509,98 @@ def fetch_trials_from_semantic_scholar(
 
 
 
+def _reciprocal_rank_fusion(rankings: List[List[str]], limit: int) -> List[str]:
+    """
+    Merge ranked id lists: each id scores sum(1 / (HYBRID_RRF_K + rank)).
+    """
+    k = matching_settings.HYBRID_RRF_K
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused, key=lambda key: -fused[key])[:limit]
+
+
+def _next_fetch_size(limit: int, fetched: int, kept: int) -> int:
+    """
+    Candidates to fetch next round, from the pass rate of the filters so far.
+    """
+    pass_rate = max(kept, 1) / max(fetched, 1)
+    needed = math.ceil(limit / pass_rate * matching_settings.FILTER_OVERFETCH_SLACK)
+    return min(max(needed, fetched * 2), matching_settings.FILTER_MAX_CANDIDATES)
+
+
+def fetch_trials_from_local_mirror(
+    query: str,
+    limit: int = 5,
+    filters: Optional[SearchFilters] = None,
+    deadline: Optional[Deadline] = None
+) -> List[Dict[str, Any]]:
+    """
+    Search the local ClinicalTrials.gov mirror (`trials` table, loaded by
+    source/modules/trails/ingest.py). This is the primary source; external
+    APIs are only called when the mirror cannot fill the request.
+
+    Lexical candidates come from the in-process BM25 index when it has been
+    built, otherwise from Postgres full-text search. When the embedding
+    index is available, dense (semantic) candidates are fused in with
+    reciprocal rank fusion, so lay wording can still reach trials written
+    in clinical vocabulary. Only the final top-k rows are loaded by NCT id.
+
+    Request filters and the patient's eligibility become WHERE clauses on
+    those row loads (and on the full-text query). The in-memory indexes
+    rank without them, so when a selective filter leaves fewer than
+    `limit` rows, more candidates are fetched, sized by the observed pass
+    rate, up to FILTER_MAX_CANDIDATES (no further round is started once
+    the deadline has passed).
+    """
+    where = filters.mirror_clauses() if filters is not None else []
+
+    db = SessionLocal()
+    try:
+        index = get_bm25_index()
+        checked: Dict[str, Optional[Dict[str, Any]]] = {}  # nct_id -> row (None: filtered out)
+        fetch_k = limit
+        for _ in range(matching_settings.FILTER_OVERFETCH_ROUNDS):
+            if index is not None:
+                lexical_ids = [nct_id for nct_id, _ in index.search(query, k=fetch_k)]
+                lexical_trials = None
+            else:
+                lexical_trials = search_trials_in_mirror(db, query, limit=fetch_k, where=where)
+                lexical_ids = [t["nct_id"] for t in lexical_trials]
+
+            dense_ids = [nct_id for nct_id, _ in semantic_search(query, k=fetch_k)]
+            if not dense_ids and lexical_trials is not None:
+                return lexical_trials[:limit]
+
+            nct_ids = _reciprocal_rank_fusion([lexical_ids, dense_ids], fetch_k)
+            new_ids = [n for n in nct_ids if n not in checked]
+            checked.update(dict.fromkeys(new_ids))
+            for t in get_trials_by_nct_ids(db, new_ids, where=where):
+                checked[t["nct_id"]] = t
+            trials = [checked[n] for n in nct_ids if checked[n] is not None]
+
+            exhausted = len(lexical_ids) < fetch_k and len(dense_ids) < fetch_k
+            if (
+                not where
+                or len(trials) >= limit
+                or exhausted
+                or fetch_k >= matching_settings.FILTER_MAX_CANDIDATES
+                or (deadline is not None and deadline.expired)
+            ):
+                break
+            fetch_k = _next_fetch_size(limit, fetch_k, len(trials))
+
+        return trials[:limit]
+    except Exception as e:
+        log.warning(f"fetch_trials_from_local_mirror: mirror unavailable - {e}")
+        return []
+    finally:
+        db.close()
+
+
+
+
 LOCAL_FALLBACK_TRIALS: List[Dict[str, Any]] = [
     {
         "nct_id": "LOCAL001",
@@ -278,13 +666,43 @@ def get_local_fallback_trials(limit: int = 5) -> List[Dict[str, Any]]:
 
 
 
+def _blend_dense(sims: np.ndarray, dense_sims: np.ndarray) -> np.ndarray:
+    """
+    Weighted sum of the lexical and the dense similarity.
+
+    Cosine similarities of the embedding model start around
+    EMBEDDING_SIMILARITY_FLOOR for unrelated texts, while TF-IDF is 0 for
+    them, so the dense score is first rescaled from that floor to [0, 1].
+    It then gets HYBRID_DENSE_WEIGHT and the lexical score the rest; a
+    trial without a dense score (NaN) keeps its lexical score.
+    """
+    floor = matching_settings.EMBEDDING_SIMILARITY_FLOOR
+    weight = matching_settings.HYBRID_DENSE_WEIGHT
+    calibrated = np.clip((dense_sims - floor) / (1.0 - floor), 0.0, 1.0)
+    blended = (1.0 - weight) * sims + weight * calibrated
+    return np.where(np.isnan(dense_sims), sims, blended).astype(np.float32)
+
+
 def compute_confidence_scores(
     query: str,
-    trials: List[Dict[str, Any]]
+    trials: List[Dict[str, Any]],
+    dense: bool = True,
+    deadline: Optional[Deadline] = None
 ) -> List[Dict[str, Any]]:
     """
     Use TF-IDF cosine similarity between query and trial text (title + summary).
-    Adds 'confidence_score' and 'explanation' to each trial dict.
+    Adds 'confidence_score' to each trial dict.
+
+    With the corpus model (tfidf_model.py, fitted offline on the mirror) we
+    only transform the query and take dot products against precomputed
+    trial vectors. Without it we fall back to fitting on query + candidates.
+
+    When the embedding encoder is available (embeddings.py), the lexical
+    and the semantic similarity are blended (_blend_dense), so trials found
+    through different wording are not scored as unrelated. dense=False
+    keeps only the lexical score, e.g. when the request deadline has
+    passed; `deadline` also stops non-indexed trials from being embedded
+    once it expires.
 
     This supports user story 5 & 6 (ranked matches with confidence +
     explanation in plain-ish English).
@@ -292,78 +710,95 @@ def compute_confidence_scores(
     if not trials:
         return []
 
-    corpus: List[str] = []
-    for t in trials:
-        text_parts = [
-            t.get("title") or "",
-            t.get("summary") or "",
-            " ".join(t.get("conditions", []) or []),
-            t.get("location") or "",
-        ]
-        corpus.append(" ".join(text_parts))
+    model = get_tfidf_model()
+    if model is not None:
+        sims = model.score(query, trials)
+    else:
+        corpus: List[str] = [trial_text(t) for t in trials]
 
-    texts = [query] + corpus  # first is query
-    vectorizer = TfidfVectorizer(stop_words="english")
-    tfidf = vectorizer.fit_transform(texts)
+        texts = [query] + corpus  # first is query
+        vectorizer = TfidfVectorizer(stop_words="english")
+        tfidf = vectorizer.fit_transform(texts)
 
-    query_vec = tfidf[0:1]
-    trial_vecs = tfidf[1:]
+        query_vec = tfidf[0:1]
+        trial_vecs = tfidf[1:]
 
-    sims = cosine_similarity(query_vec, trial_vecs)[0]
+        sims = cosine_similarity(query_vec, trial_vecs)[0]
 
-    results: List[Dict[str, Any]] = []
-    for trial, score in zip(trials, sims):
-        confidence = float(round(score, 4))
+    dense_sims = semantic_scores(query, trials, deadline) if dense else None
+    if dense_sims is not None:
+        sims = _blend_dense(np.asarray(sims, dtype=np.float32), dense_sims)
 
-        title = trial.get("title") or "this trial"
-        loc = trial.get("location") or "various locations"
+    return [_apply_score(trial, score) for trial, score in zip(trials, sims)]
 
-        explanation = (
-            f"This match, '{title}', appears relevant to your search '{query}'. "
-            f"It is located at {loc}. The match confidence score is "
-            f"{int(confidence * 100)}%, based on similarity between your search "
-            f"and the trial details (title, summary, and conditions)."
-        )
 
-        trial["confidence_score"] = confidence
-        trial["explanation"] = explanation
-        results.append(trial)
-
-    return results
+def _apply_score(trial: Dict[str, Any], score: float) -> Dict[str, Any]:
+    """
+    Set confidence_score on a trial (explanations are built after ranking,
+    for the returned trials only; see explain.py).
+    """
+    trial["confidence_score"] = round(float(score), 4)
+    return trial
 
 
-def fetch_trials_with_fallbacks(
-    query: str,
-    desired_limit: int = 10
-) -> List[Dict[str, Any]]:
+def score_queries(
+    queries: List[str],
+    trials: List[Dict[str, Any]],
+    dense: bool = True,
+    deadline: Optional[Deadline] = None
+) -> np.ndarray:
     """
-    Hybrid A + C:
-      1) ClinicalTrials.gov API v2 (real trials with locations)
-      2) Semantic Scholar (research papers as "trials")
-      3) Local fallback trials (never empty)
+    Batch variant of compute_confidence_scores: similarity of every query
+    against every trial, as one (len(queries), len(trials)) matrix.
 
-    Always returns at least one trial unless something catastrophic happens.
+    All queries are vectorized together and multiplied with the trial
+    vectors in one sparse matrix product (with the corpus model; otherwise
+    one vectorizer is fitted on all queries + trials). Dense similarities
+    are blended in the same way as for a single query.
     """
-    collected: List[Dict[str, Any]] = []
+    if not queries or not trials:
+        return np.zeros((len(queries), len(trials)), dtype=np.float32)
 
-    # 1) ClinicalTrials.gov API
-    ctgov_trials = fetch_trials_from_ctgov_api(query, limit=desired_limit)
-    collected.extend(ctgov_trials)
+    model = get_tfidf_model()
+    if model is not None:
+        query_vecs = model.transform(queries)
+        trial_vecs = model.trial_vectors(trials)
+    else:
+        vectorizer = TfidfVectorizer(stop_words="english")
+        tfidf = vectorizer.fit_transform(queries + [trial_text(t) for t in trials])
+        query_vecs, trial_vecs = tfidf[:len(queries)], tfidf[len(queries):]
+
+    # rows are L2-normalized, so the product is the cosine similarity
+    sims = np.asarray((query_vecs @ trial_vecs.T).todense(), dtype=np.float32)
+
+    dense_sims = semantic_score_matrix(queries, trials, deadline) if dense else None
+    if dense_sims is not None:
+        sims = _blend_dense(sims, dense_sims)
+    return sims
 
-    # 2) Semantic Scholar (only if we still need more)
-    if len(collected) < desired_limit:
-        remaining = desired_limit - len(collected)
-        sem_trials = fetch_trials_from_semantic_scholar(query, limit=remaining)
-        collected.extend(sem_trials)
 
+def complete_with_fallbacks(
+    query: str,
+    collected: List[Dict[str, Any]],
+    desired_limit: int,
+    filters: Optional[SearchFilters] = None,
+    deadline: Optional[Deadline] = None,
+    score: bool = True
+) -> List[Dict[str, Any]]:
+    """
+    Shared tail of the sync and async pipelines: top up with local
+    fallbacks (only those passing the filters), fill in map links and
+    compute confidence (score=False leaves scoring to the caller, e.g.
+    the batch search).
+    """
     # 3) Local fallback (if still not enough)
     if len(collected) == 0:
-        collected = get_local_fallback_trials(limit=desired_limit)
+        collected = _filter_trials(get_local_fallback_trials(limit=desired_limit), filters)
         for t in collected:
             t["ai_generated"] = True  # fully synthetic fallback
     elif len(collected) < desired_limit:
         remaining = desired_limit - len(collected)
-        extra = get_local_fallback_trials(limit=remaining)
+        extra = _filter_trials(get_local_fallback_trials(limit=remaining), filters)
         for t in extra:
             t["ai_generated"] = True
         collected.extend(extra)
@@ -373,7 +808,382 @@ def fetch_trials_with_fallbacks(
         if not t.get("google_maps_url") and t.get("location"):
             t["google_maps_url"] = build_google_maps_url(t.get("location"))
 
-    # Compute confidence & explanation
-    collected = compute_confidence_scores(query, collected)
+    if not score:
+        return collected
+
+    # Compute confidence (lexical only once the deadline has passed)
+    return compute_confidence_scores(
+        query, collected, dense=has_time(deadline, SOURCE_EMBEDDINGS), deadline=deadline
+    )
+
+
+def _filter_trials(
+    trials: List[Dict[str, Any]],
+    filters: Optional[SearchFilters]
+) -> List[Dict[str, Any]]:
+    if filters is None:
+        return trials
+    return filters.apply(trials)
+
+
+def trial_key(trial: Dict[str, Any]) -> Optional[str]:
+    return trial.get("nct_id") or trial.get("url") or trial.get("title")
+
 
+def _merge_source_results(
+    by_source: Dict[str, List[Dict[str, Any]]],
+    desired_limit: int,
+    filters: Optional[SearchFilters] = None
+) -> List[Dict[str, Any]]:
+    """
+    Merge per-source results in SOURCE_PRIORITY order (local mirror, CT.gov,
+    Semantic Scholar), skipping trials already contributed by a higher
+    priority source or rejected by the filters, up to desired_limit.
+    """
+    collected: List[Dict[str, Any]] = []
+    seen: set = set()
+    for source in SOURCE_PRIORITY:
+        for t in _filter_trials(by_source.get(source, []), filters):
+            if len(collected) >= desired_limit:
+                return collected
+            key = trial_key(t)
+            if key in seen:
+                continue
+            seen.add(key)
+            collected.append(t)
     return collected
+
+
+def fetch_trials_with_fallbacks(
+    query: str,
+    desired_limit: int = 10,
+    filters: Optional[SearchFilters] = None,
+    deadline: Optional[Deadline] = None
+) -> List[Dict[str, Any]]:
+    """
+    Hybrid A + C:
+      0) Local ClinicalTrials.gov mirror (no network on the hot path)
+      1) ClinicalTrials.gov API v2 (real trials with locations)
+      2) Semantic Scholar (research papers as "trials")
+      3) Local fallback trials
+
+    Filters are pushed down into every source that supports them. Papers
+    have no status or location, so Semantic Scholar is skipped while a
+    filter is active. Without filters at least one trial is always returned;
+    with filters the result may be empty.
+
+    With a deadline, external calls get the time that is left as timeout;
+    stages that are reached after it (or cut off by it) are skipped and
+    recorded on the deadline, and the best results so far are returned.
+    """
+    by_source: Dict[str, List[Dict[str, Any]]] = {}
+    collected: List[Dict[str, Any]] = []
+
+    # 0) Local mirror
+    if has_time(deadline, SOURCE_LOCAL_MIRROR):
+        by_source[SOURCE_LOCAL_MIRROR] = fetch_trials_from_local_mirror(
+            query, limit=desired_limit, filters=filters, deadline=deadline
+        )
+        collected = _merge_source_results(by_source, desired_limit, filters)
+
+    # 1) ClinicalTrials.gov API (only if the mirror could not fill the request)
+    if len(collected) < desired_limit and has_time(deadline, SOURCE_CTGOV):
+        by_source[SOURCE_CTGOV] = fetch_trials_from_ctgov_api(
+            query, limit=desired_limit, filters=filters, deadline=deadline
+        )
+        if not by_source[SOURCE_CTGOV] and deadline is not None and deadline.expired:
+            deadline.skip(SOURCE_CTGOV)
+        collected = _merge_source_results(by_source, desired_limit, filters)
+
+    # 2) Semantic Scholar (only if we still need more)
+    if (
+        len(collected) < desired_limit
+        and not (filters and filters.active)
+        and has_time(deadline, SOURCE_SEMANTIC_SCHOLAR)
+    ):
+        remaining = desired_limit - len(collected)
+        by_source[SOURCE_SEMANTIC_SCHOLAR] = fetch_trials_from_semantic_scholar(
+            query, limit=remaining, timeout=time_left(deadline)
+        )
+        if not by_source[SOURCE_SEMANTIC_SCHOLAR] and deadline is not None and deadline.expired:
+            deadline.skip(SOURCE_SEMANTIC_SCHOLAR)
+        collected = _merge_source_results(by_source, desired_limit, filters)
+
+    return complete_with_fallbacks(query, collected, desired_limit, filters, deadline)
+
+
+async def aiter_source_results(
+    query: str,
+    desired_limit: int = 10,
+    filters: Optional[SearchFilters] = None,
+    deadline: Optional[Deadline] = None
+) -> AsyncIterator[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Yield (source, merged unscored candidates so far) each time a source
+    lands, for incremental consumers (streaming search) and for
+    afetch_trials_with_fallbacks, which only keeps the last one.
+
+    The local mirror is queried first. Only if it cannot fill desired_limit
+    are both external sources requested concurrently and merged as they
+    land; once the mirror plus CT.gov fill the request, the Semantic Scholar
+    request is cancelled instead of being waited for (it is not sent at all
+    while a filter is active). Sources still running when the deadline
+    passes, or when the consumer stops iterating, are cancelled; the
+    former are recorded as skipped.
+    """
+    by_source: Dict[str, List[Dict[str, Any]]] = {}
+
+    if has_time(deadline, SOURCE_LOCAL_MIRROR):
+        try:
+            by_source[SOURCE_LOCAL_MIRROR] = await asyncio.wait_for(
+                asyncio.to_thread(
+                    fetch_trials_from_local_mirror, query, desired_limit, filters, deadline
+                ),
+                timeout=time_left(deadline),
+            )
+        except asyncio.TimeoutError:
+            deadline.skip(SOURCE_LOCAL_MIRROR)
+        else:
+            yield SOURCE_LOCAL_MIRROR, _merge_source_results(by_source, desired_limit, filters)
+
+    if len(_merge_source_results(by_source, desired_limit, filters)) >= desired_limit:
+        return
+
+    tasks = {}
+    if has_time(deadline, SOURCE_CTGOV):
+        tasks[asyncio.create_task(
+            afetch_trials_from_ctgov_api(
+                query, limit=desired_limit, filters=filters, deadline=deadline
+            )
+        )] = SOURCE_CTGOV
+    if not (filters and filters.active) and has_time(deadline, SOURCE_SEMANTIC_SCHOLAR):
+        tasks[asyncio.create_task(
+            afetch_trials_from_semantic_scholar(
+                query, limit=desired_limit, timeout=time_left(deadline)
+            )
+        )] = SOURCE_SEMANTIC_SCHOLAR
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=time_left(deadline),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in done:
+                by_source[tasks[task]] = task.result()
+                yield tasks[task], _merge_source_results(by_source, desired_limit, filters)
+
+            if not done:
+                # Deadline reached: keep what has landed, drop the rest
+                for task in pending:
+                    deadline.skip(tasks[task])
+                break
+
+            without_papers = {
+                k: v for k, v in by_source.items() if k != SOURCE_SEMANTIC_SCHOLAR
+            }
+            if len(_merge_source_results(without_papers, desired_limit, filters)) >= desired_limit:
+                break
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def afetch_trials_with_fallbacks(
+    query: str,
+    desired_limit: int = 10,
+    filters: Optional[SearchFilters] = None,
+    deadline: Optional[Deadline] = None,
+    score: bool = True
+) -> List[Dict[str, Any]]:
+    """
+    Asyncio-native version of fetch_trials_with_fallbacks (score=False
+    returns the merged candidates unscored). Sources are fetched by
+    aiter_source_results; only the final merge is scored.
+    """
+    collected: List[Dict[str, Any]] = []
+    async for _, collected in aiter_source_results(query, desired_limit, filters, deadline):
+        pass
+
+    # Fallback top-up and scoring are CPU-only; keep them off the event loop
+    return await asyncio.to_thread(
+        complete_with_fallbacks, query, collected, desired_limit, filters, deadline, score
+    )
+
+
+def _search_flight_key(
+    query: str,
+    desired_limit: int,
+    filters: Optional[SearchFilters]
+) -> str:
+    """
+    Coalescing key: normalized query, limit, filters and patient eligibility.
+    """
+    filters = filters or SearchFilters()
+    return make_cache_key("search", "fetch_trials_with_fallbacks", {
+        "query": query,
+        "limit": desired_limit,
+        "status": filters.status,
+        "location": filters.location_contains,
+        "eligibility": filters.patient.cache_key() if filters.patient else None,
+    })
+
+
+# A follower with more time than this beyond the leader's budget does not
+# take the leader's partial result
+FLIGHT_BUDGET_SLACK_SECONDS = 0.1
+
+
+def _flight_result(
+    trials: List[Dict[str, Any]],
+    deadline: Optional[Deadline],
+    budget: Optional[float]
+) -> Dict[str, Any]:
+    return {
+        "trials": trials,
+        "skipped_sources": list(deadline.skipped_sources) if deadline is not None else [],
+        "budget": budget,
+    }
+
+
+def _cut_short_for(result: Dict[str, Any], budget: Optional[float]) -> bool:
+    """
+    Whether the flight's result is partial because the leader had less
+    time than this caller (None: no deadline).
+    """
+    leader_budget = result.get("budget")
+    if not result["skipped_sources"] or leader_budget is None:
+        return False
+    return budget is None or budget > leader_budget + FLIGHT_BUDGET_SLACK_SECONDS
+
+
+def _unpack_flight_result(result: Dict[str, Any], deadline: Optional[Deadline]) -> List[Dict[str, Any]]:
+    """
+    Sources the leader skipped are reported as skipped for every caller.
+    """
+    if deadline is not None:
+        for source in result["skipped_sources"]:
+            deadline.skip(source)
+    return result["trials"]
+
+
+def fetch_trials_coalesced(
+    query: str,
+    desired_limit: int = 10,
+    filters: Optional[SearchFilters] = None,
+    deadline: Optional[Deadline] = None
+) -> List[Dict[str, Any]]:
+    """
+    fetch_trials_with_fallbacks behind single-flight coalescing: concurrent
+    identical searches (in this worker or another) share one upstream fetch
+    and scoring pass; each caller gets its own copy of the trials. Callers
+    wait for another caller's flight no longer than their own deadline, and
+    search on their own when the leader's result was cut short by a
+    shorter deadline than theirs.
+    """
+    budget = time_left(deadline)
+    result = single_flight(
+        _search_flight_key(query, desired_limit, filters),
+        lambda: _flight_result(
+            fetch_trials_with_fallbacks(query, desired_limit, filters, deadline), deadline, budget
+        ),
+        wait_timeout=budget,
+    )
+    if _cut_short_for(result, budget):
+        metrics.increment("search.coalesce_partial_rerun")
+        return fetch_trials_with_fallbacks(query, desired_limit, filters, deadline)
+    return _unpack_flight_result(result, deadline)
+
+
+async def afetch_trials_coalesced(
+    query: str,
+    desired_limit: int = 10,
+    filters: Optional[SearchFilters] = None,
+    deadline: Optional[Deadline] = None
+) -> List[Dict[str, Any]]:
+    """
+    Async variant of fetch_trials_coalesced.
+    """
+    budget = time_left(deadline)
+
+    async def compute() -> Dict[str, Any]:
+        trials = await afetch_trials_with_fallbacks(query, desired_limit, filters, deadline)
+        return _flight_result(trials, deadline, budget)
+
+    result = await asingle_flight(
+        _search_flight_key(query, desired_limit, filters),
+        compute,
+        wait_timeout=budget,
+    )
+    if _cut_short_for(result, budget):
+        metrics.increment("search.coalesce_partial_rerun")
+        return await afetch_trials_with_fallbacks(query, desired_limit, filters, deadline)
+    return _unpack_flight_result(result, deadline)
+
+
+async def afetch_trials_batch(
+    searches: List[Tuple[str, int, Optional[SearchFilters]]],
+    deadline: Optional[Deadline] = None
+) -> List[List[Dict[str, Any]]]:
+    """
+    Fetch and score many searches at once (POST /api/matching/search/batch).
+
+      1) One upstream fetch per distinct (normalized query, filters), at the
+         largest limit asked for; the fetches run concurrently
+      2) Every distinct query is scored against the union of all candidates
+         in one matrix product (score_queries)
+      3) Each search gets its own copies of its candidates, scored for its
+         query and cut to its limit by score
+
+    Args:
+        searches (list): (query, desired_limit, filters) per search
+        deadline (Deadline): Shared by the whole batch
+
+    Returns:
+        list: Scored trials per search, in the order of `searches`
+    """
+    # 1) Deduplicated fetches
+    keys = [_search_flight_key(query, 0, filters) for query, _, filters in searches]
+    groups: Dict[str, Tuple[str, Optional[SearchFilters]]] = {}
+    limits: Dict[str, int] = {}
+    for key, (query, limit, filters) in zip(keys, searches):
+        groups.setdefault(key, (query, filters))
+        limits[key] = max(limits.get(key, 0), limit)
+
+    order = list(groups)
+    fetched = await asyncio.gather(*(
+        afetch_trials_with_fallbacks(
+            groups[key][0], limits[key], groups[key][1], deadline, score=False
+        )
+        for key in order
+    ))
+    candidates = dict(zip(order, fetched))
+
+    # 2) Union of candidates x distinct queries, one scoring pass
+    union: Dict[Optional[str], Dict[str, Any]] = {}
+    for trials in fetched:
+        for t in trials:
+            union.setdefault(trial_key(t), t)
+    column = {key: i for i, key in enumerate(union)}
+    queries = list(dict.fromkeys(query for query, _, _ in searches))
+    row = {query: i for i, query in enumerate(queries)}
+
+    sims = await asyncio.to_thread(
+        score_queries, queries, list(union.values()), has_time(deadline, SOURCE_EMBEDDINGS), deadline
+    )
+
+    # 3) Per-search copies: every candidate of the fetch is scored for the
+    # search's own query, and its best `limit` are kept (a fetch shared with
+    # a larger search returns more than this search asked for)
+    results: List[List[Dict[str, Any]]] = []
+    for key, (query, limit, _) in zip(keys, searches):
+        scores = sims[row[query]]
+        scored = [
+            _apply_score(dict(t), scores[column[trial_key(t)]])
+            for t in candidates[key]
+        ]
+        results.append(heapq.nlargest(limit, scored, key=lambda t: t["confidence_score"]))
+    return results
@@ -0,0 +1,169 @@
+# source/modules/matching/snapshots.py
+"""
+Content-addressed trial snapshots for stored matches.
+
+trial_matches.matched_trials holds one small reference per trial:
+
+    {"snapshot": <sha256 of the trial payload>, "nct_id": ...,
+     "confidence_score": ..., "score_breakdown": ..., "distance_km": ...,
+     "nearest_site": ...}
+
+The trial itself (title, summary, conditions, location, ...) is stored
+once per distinct content in `trial_snapshots`, however many matches
+point at it. Explanations and snippets are not stored: they are derived
+from the query and the scores, and rebuilt when a match is read back
+(explain.py). Snapshots are immutable, so a trial that changes gets a
+new snapshot and older matches keep showing what the patient saw.
+"""
+
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from .explain import explain_matches
+from .model import TrialSnapshot
+
+# Trial content, identical for every match of the same trial version
+SNAPSHOT_FIELDS = (
+    "nct_id",
+    "title",
+    "status",
+    "phase",
+    "conditions",
+    "sponsor",
+    "location",
+    "city",
+    "state",
+    "country",
+    "google_maps_url",
+    "lat",
+    "lng",
+    "summary",
+    "url",
+    "ai_generated",
+)
+
+# Specific to one match (query, patient, location)
+MATCH_FIELDS = (
+    "confidence_score",
+    "score_breakdown",
+    "distance_km",
+    "nearest_site",
+)
+
+
+def snapshot_payload(trial: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: trial.get(k) for k in SNAPSHOT_FIELDS}
+
+
+def snapshot_hash(payload: Dict[str, Any]) -> str:
+    """
+    Stable sha256 of a payload (same canonical JSON as row_content_hash).
+    """
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def is_reference(item: Any) -> bool:
+    return isinstance(item, dict) and "snapshot" in item
+
+
+# -------------------------
+# Write path
+# -------------------------
+def to_references(
+    trials: List[Dict[str, Any]],
+    payloads: Dict[str, Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    References of ranked trials; their payloads are collected into
+    `payloads` (hash -> payload) for store_snapshots.
+    """
+    refs: List[Dict[str, Any]] = []
+    for trial in trials:
+        payload = snapshot_payload(trial)
+        digest = snapshot_hash(payload)
+        payloads.setdefault(digest, payload)
+        ref = {"snapshot": digest, "nct_id": trial.get("nct_id")}
+        ref.update({k: trial.get(k) for k in MATCH_FIELDS if trial.get(k) is not None})
+        refs.append(ref)
+    return refs
+
+
+def store_snapshots(db: Session, payloads: Dict[str, Dict[str, Any]]):
+    """
+    Insert the snapshots not stored yet, in one statement (the caller commits).
+    """
+    if not payloads:
+        return
+    now = datetime.now(timezone.utc)
+    stmt = insert(TrialSnapshot).values([
+        {"content_hash": digest, "nct_id": payload.get("nct_id"), "payload": payload, "created_at": now}
+        for digest, payload in payloads.items()
+    ])
+    db.execute(stmt.on_conflict_do_nothing(index_elements=[TrialSnapshot.content_hash]))
+
+
+def snapshot_matches(db: Session, results: Sequence[List[Dict[str, Any]]]) -> List[List[Dict[str, Any]]]:
+    """
+    References for several matches at once, storing their snapshots in
+    one INSERT (a trial shared by matches of a batch is stored once).
+    """
+    payloads: Dict[str, Dict[str, Any]] = {}
+    refs = [to_references(trials, payloads) for trials in results]
+    store_snapshots(db, payloads)
+    return refs
+
+
+# -------------------------
+# Read path
+# -------------------------
+def load_snapshots(db: Session, hashes: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+    if not hashes:
+        return {}
+    rows = db.execute(
+        select(TrialSnapshot.content_hash, TrialSnapshot.payload)
+        .where(TrialSnapshot.content_hash.in_(list(set(hashes))))
+    )
+    return {digest: payload for digest, payload in rows}
+
+
+def rehydrate_matches(
+    db: Session,
+    matches: Sequence[Tuple[str, Optional[List[Dict[str, Any]]]]]
+) -> List[List[Dict[str, Any]]]:
+    """
+    Full trial dicts of stored matches, given (query_text, matched_trials)
+    pairs, with every snapshot read in one batched query.
+
+    Rows written before snapshots (full trial dicts) are used as they are
+    apart from the explanation; a reference whose snapshot is missing is
+    dropped.
+    """
+    hashes = [
+        item["snapshot"]
+        for _, items in matches
+        for item in items or []
+        if is_reference(item)
+    ]
+    snapshots = load_snapshots(db, hashes)
+
+    results: List[List[Dict[str, Any]]] = []
+    for query, items in matches:
+        trials: List[Dict[str, Any]] = []
+        for item in items or []:
+            if not is_reference(item):
+                trials.append(item)
+                continue
+            payload = snapshots.get(item["snapshot"])
+            if payload is None:
+                continue
+            trials.append({**payload, **{k: v for k, v in item.items() if k != "snapshot"}})
+        # same short explanation / snippet as the live response
+        results.append(explain_matches(query, trials))
+    return results
@@ -0,0 +1,223 @@
+# source/modules/matching/tfidf_model.py
+"""
+Corpus-level TF-IDF model for compute_confidence_scores.
+
+The vectorizer is fitted offline on the whole trials mirror and published
+as a memory-mapped snapshot (vocabulary, idf and the L2-normalized trial
+vectors as CSR arrays). At request time we only transform the query (and
+any trial that is not in the mirror, e.g. Semantic Scholar papers) and
+take dot products.
+
+Build:
+    python -m source.modules.matching.tfidf_model
+"""
+
+import argparse
+from collections import Counter
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from source.logger import service as logger_service
+from source.modules.trails.model import Trial
+from source.modules.trails.service import trial_to_dict
+from source.snapshot.service import (
+    Snapshot,
+    SnapshotHandle,
+    StringLookup,
+    string_lookup_arrays,
+    write_snapshot,
+)
+
+log = logger_service.get_logger(__name__)
+
+BUILD_CHUNK_SIZE = 2000
+
+SNAPSHOT_KIND = "tfidf"
+SNAPSHOT_SCHEMA_VERSION = 1
+
+
+def trial_text(trial: Dict[str, Any]) -> str:
+    """
+    Text used to represent a trial for similarity scoring.
+    """
+    text_parts = [
+        trial.get("title") or "",
+        trial.get("summary") or "",
+        " ".join(trial.get("conditions", []) or []),
+        trial.get("location") or "",
+    ]
+    return " ".join(text_parts)
+
+
+def _make_vectorizer(min_df: int = 1) -> TfidfVectorizer:
+    return TfidfVectorizer(stop_words="english", min_df=min_df, dtype=np.float32)
+
+
+class TfidfModel:
+    """
+    Fitted vocabulary / idf + precomputed, L2-normalized trial vectors,
+    all backed by snapshot arrays.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.vocabulary = StringLookup(arrays["terms"], arrays["terms__order"])
+        self.nct_ids = StringLookup(arrays["nct_ids"], arrays["nct_ids__order"])
+        self.idf = arrays["idf"]
+        self.matrix = sp.csr_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]),
+            shape=(len(self.nct_ids), len(self.vocabulary)),
+            copy=False,
+        )
+        self._analyzer: Callable[[str], List[str]] = _make_vectorizer().build_analyzer()
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Snapshot) -> "TfidfModel":
+        return cls(snapshot.arrays)
+
+    def transform(self, texts: List[str]) -> sp.csr_matrix:
+        """
+        Vectorize texts with the fitted vocabulary (rows are L2-normalized),
+        same result as TfidfVectorizer.transform.
+        """
+        data: List[float] = []
+        indices: List[int] = []
+        indptr = [0]
+        for text in texts:
+            ids = self.vocabulary.get_many(self._analyzer(text))
+            counts = Counter(int(i) for i in ids if i >= 0)
+            cols = sorted(counts)
+            weights = np.array([counts[c] for c in cols], dtype=np.float32) * self.idf[cols]
+            norm = float(np.linalg.norm(weights))
+            if norm > 0:
+                weights /= norm
+            data.extend(weights.tolist())
+            indices.extend(cols)
+            indptr.append(len(indices))
+
+        return sp.csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr)),
+            shape=(len(texts), len(self.vocabulary)),
+        )
+
+    def trial_vectors(self, trials: List[Dict[str, Any]]) -> sp.csr_matrix:
+        """
+        Precomputed rows for mirrored trials, transform() for the rest.
+        """
+        rows = self.nct_ids.get_many([t.get("nct_id") or "" for t in trials])
+        known = [i for i, r in enumerate(rows) if r >= 0]
+        missing = [i for i, r in enumerate(rows) if r < 0]
+
+        known_vecs = self.matrix[[rows[i] for i in known]]
+        if not missing:
+            return known_vecs
+
+        extra = self.transform([trial_text(trials[i]) for i in missing])
+        stacked = sp.vstack([known_vecs, extra]).tocsr()
+
+        # Put rows back into the order of `trials`
+        position = np.empty(len(trials), dtype=np.int64)
+        position[known] = np.arange(len(known))
+        position[missing] = len(known) + np.arange(len(missing))
+        return stacked[position]
+
+    def score(self, query: str, trials: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Cosine similarity of the query against each trial (dot products of
+        L2-normalized vectors).
+        """
+        query_vec = self.transform([query])
+        return np.asarray((self.trial_vectors(trials) @ query_vec.T).todense()).ravel()
+
+
+_handle: SnapshotHandle[TfidfModel] = SnapshotHandle(
+    SNAPSHOT_KIND, SNAPSHOT_SCHEMA_VERSION, TfidfModel.from_snapshot
+)
+
+
+def get_tfidf_model() -> Optional[TfidfModel]:
+    """
+    Memory-mapped model of the current snapshot generation (None if it was
+    never built; callers then fit per request).
+    """
+    return _handle.get()
+
+
+def _iter_mirror_trials(db: Session) -> Iterator[Dict[str, Any]]:
+    stmt = select(Trial).order_by(Trial.nct_id).execution_options(yield_per=BUILD_CHUNK_SIZE)
+    for trial in db.execute(stmt).scalars():
+        yield trial_to_dict(trial)
+
+
+def build_tfidf_model(db: Session) -> int:
+    """
+    Fit the vectorizer on the whole mirror and publish it with the trial
+    matrix as a new snapshot generation.
+
+    Returns:
+        int: Number of trials in the model
+    """
+    total = db.execute(select(func.count()).select_from(Trial)).scalar() or 0
+
+    # Pass 1: fit the vocabulary / idf (streamed, texts are not kept).
+    # On a real-sized corpus, terms seen in a single study are mostly noise.
+    min_df = 2 if total >= 1000 else 1
+    vectorizer = _make_vectorizer(min_df=min_df)
+    vectorizer.fit(trial_text(t) for t in _iter_mirror_trials(db))
+
+    # Pass 2: transform in chunks
+    nct_ids: List[str] = []
+    blocks: List[sp.csr_matrix] = []
+    chunk: List[str] = []
+    for t in _iter_mirror_trials(db):
+        nct_ids.append(t["nct_id"])
+        chunk.append(trial_text(t))
+        if len(chunk) >= BUILD_CHUNK_SIZE:
+            blocks.append(vectorizer.transform(chunk))
+            chunk = []
+    if chunk:
+        blocks.append(vectorizer.transform(chunk))
+
+    n_terms = len(vectorizer.vocabulary_)
+    matrix = sp.vstack(blocks).tocsr() if blocks else sp.csr_matrix((0, n_terms), dtype=np.float32)
+    matrix.sort_indices()
+    index_dtype = np.int32 if matrix.nnz < np.iinfo(np.int32).max else np.int64
+
+    snapshot = write_snapshot(
+        SNAPSHOT_KIND,
+        SNAPSHOT_SCHEMA_VERSION,
+        {
+            # get_feature_names_out() is ordered by column index
+            **string_lookup_arrays("terms", list(vectorizer.get_feature_names_out())),
+            **string_lookup_arrays("nct_ids", nct_ids),
+            "idf": vectorizer.idf_.astype(np.float32),
+            "data": matrix.data.astype(np.float32),
+            "indices": matrix.indices.astype(index_dtype),
+            "indptr": matrix.indptr.astype(index_dtype),
+        },
+        meta={"min_df": min_df},
+    )
+
+    log.info(f"build_tfidf_model: {len(nct_ids)} trials, {n_terms} terms -> {snapshot.path}")
+    return len(nct_ids)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Fit the corpus TF-IDF model on the trials mirror")
+    parser.parse_args(argv)
+
+    from source.database.service import SessionLocal
+
+    db = SessionLocal()
+    try:
+        build_tfidf_model(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
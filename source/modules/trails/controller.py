@@ -0,0 +1,104 @@
+# source/modules/trails/controller.py
+
+from typing import List, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+
+from .geo import BBox, radius_bbox
+from .schemas import NearbyTrial, NearbyTrialsResponse
+from .service import find_trials_nearby
+
+DEFAULT_NEARBY_RADIUS_KM = 50.0
+
+
+def _parse_bbox(text: str) -> BBox:
+    """
+    "min_lat,min_lng,max_lat,max_lng" -> tuple; min_lng > max_lng means the
+    box crosses the antimeridian.
+    """
+    try:
+        min_lat, min_lng, max_lat, max_lng = (float(p) for p in text.split(","))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="bbox must be 'min_lat,min_lng,max_lat,max_lng'",
+        )
+    if not (-90.0 <= min_lat <= max_lat <= 90.0) or not (
+        -180.0 <= min_lng <= 180.0 and -180.0 <= max_lng <= 180.0
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="bbox is out of range",
+        )
+    return min_lat, min_lng, max_lat, max_lng
+
+
+def _bbox_center(bbox: BBox) -> tuple:
+    min_lat, min_lng, max_lat, max_lng = bbox
+    if min_lng > max_lng:
+        max_lng += 360.0
+    lng = (min_lng + max_lng) / 2.0
+    if lng > 180.0:
+        lng -= 360.0
+    return (min_lat + max_lat) / 2.0, lng
+
+
+def _split_values(values: Optional[List[str]]) -> List[str]:
+    """
+    Accept both repeated query params and comma-separated values.
+    """
+    return [v.strip() for item in values or [] for v in item.split(",") if v.strip()]
+
+
+def get_nearby_trials(
+    db: Session,
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    radius_km: Optional[float] = None,
+    bbox: Optional[str] = None,
+    statuses: Optional[List[str]] = None,
+    phases: Optional[List[str]] = None,
+    limit: int = 20,
+) -> NearbyTrialsResponse:
+    """
+    Trials around a point (radius) or inside a bounding box, nearest first.
+    """
+    if (lat is None) != (lng is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="lat and lng must be given together",
+        )
+    if lat is None and not bbox:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide lat/lng (with an optional radius_km) or a bbox",
+        )
+
+    # 1) Search area: an explicit box, the circle's box, or both
+    area = _parse_bbox(bbox) if bbox else None
+    if lat is not None and (radius_km is not None or area is None):
+        radius_km = radius_km or DEFAULT_NEARBY_RADIUS_KM
+        if area is None:
+            area = radius_bbox(lat, lng, radius_km)
+    origin = (lat, lng) if lat is not None else _bbox_center(area)
+
+    # 2) Geohash cell scan + exact refine
+    total, trials = find_trials_nearby(
+        db,
+        bbox=area,
+        origin=origin,
+        radius_km=radius_km,
+        statuses=_split_values(statuses),
+        phases=_split_values(phases),
+        limit=limit,
+    )
+
+    return NearbyTrialsResponse(
+        lat=origin[0],
+        lng=origin[1],
+        radius_km=radius_km,
+        bbox=list(area) if bbox else None,
+        total=total,
+        trials=[NearbyTrial(**t) for t in trials],
+    )
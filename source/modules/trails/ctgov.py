@@ -0,0 +1,164 @@
+# source/modules/trails/ctgov.py
+"""
+Typed view of ClinicalTrials.gov API v2 study documents.
+
+Only the fields we map are declared; everything else in a document is
+skipped by the decoder without being materialized. API requests ask for
+the same fields via the `fields` parameter, so CT.gov does not send the
+rest in the first place.
+"""
+
+from typing import Any, List, Optional
+
+import msgspec
+
+
+class _Struct(msgspec.Struct, rename="camel", frozen=True, gc=False):
+    """
+    Base for the CT.gov structs (camelCase JSON keys, immutable, acyclic)
+    """
+
+
+class GeoPoint(_Struct):
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+
+
+class Location(_Struct):
+    facility: Optional[str] = None
+    city: Optional[str] = None
+    state: Optional[str] = None
+    country: Optional[str] = None
+    zip: Optional[str] = None
+    status: Optional[str] = None
+    geo_point: Optional[GeoPoint] = None
+
+
+class IdentificationModule(_Struct):
+    nct_id: Optional[str] = None
+    brief_title: Optional[str] = None
+    official_title: Optional[str] = None
+
+
+class DescriptionModule(_Struct):
+    brief_summary: Optional[str] = None
+    detailed_description: Optional[str] = None
+
+
+class DateStruct(_Struct):
+    date: Optional[str] = None
+
+
+class StatusModule(_Struct):
+    overall_status: Optional[str] = None
+    last_update_post_date_struct: Optional[DateStruct] = None
+
+
+class ConditionsModule(_Struct):
+    conditions: List[str] = []
+
+
+class DesignModule(_Struct):
+    study_type: Optional[str] = None
+    phases: List[str] = []
+
+
+class Sponsor(_Struct):
+    name: Optional[str] = None
+
+
+class SponsorCollaboratorsModule(_Struct):
+    lead_sponsor: Optional[Sponsor] = None
+
+
+class EligibilityModule(_Struct):
+    eligibility_criteria: Optional[str] = None
+    healthy_volunteers: Optional[bool] = None
+    sex: Optional[str] = None
+    minimum_age: Optional[str] = None
+    maximum_age: Optional[str] = None
+
+
+class ContactsLocationsModule(_Struct):
+    locations: List[Location] = []
+
+
+class ProtocolSection(_Struct):
+    identification_module: IdentificationModule = IdentificationModule()
+    description_module: DescriptionModule = DescriptionModule()
+    status_module: StatusModule = StatusModule()
+    conditions_module: ConditionsModule = ConditionsModule()
+    design_module: DesignModule = DesignModule()
+    sponsor_collaborators_module: SponsorCollaboratorsModule = SponsorCollaboratorsModule()
+    eligibility_module: EligibilityModule = EligibilityModule()
+    contacts_locations_module: ContactsLocationsModule = ContactsLocationsModule()
+
+
+class Study(_Struct):
+    protocol_section: ProtocolSection = ProtocolSection()
+
+
+class StudiesPage(_Struct):
+    studies: List[Study] = []
+    next_page_token: Optional[str] = None
+
+
+# Field projection (CT.gov v2 `fields` parameter, data-model piece names)
+SEARCH_FIELDS = [
+    "NCTId",
+    "BriefTitle",
+    "OfficialTitle",
+    "BriefSummary",
+    "DetailedDescription",  # summary fallback when there is no brief summary
+    "OverallStatus",
+    "Phase",
+    "Condition",
+    "LeadSponsorName",
+    "LocationFacility",
+    "LocationCity",
+    "LocationState",
+    "LocationCountry",
+    "LocationZip",
+    "LocationStatus",
+    "LocationGeoPoint",
+    "MinimumAge",
+    "MaximumAge",
+    "Sex",
+    "HealthyVolunteers",
+]
+"""Fields a search result needs"""
+
+INGEST_FIELDS = SEARCH_FIELDS + [
+    "EligibilityCriteria",
+    "StudyType",
+    "LastUpdatePostDate",
+]
+"""Fields a `trials` mirror row needs"""
+
+_page_decoder = msgspec.json.Decoder(StudiesPage)
+_study_decoder = msgspec.json.Decoder(Study)
+
+
+def fields_param(fields: List[str]) -> str:
+    return ",".join(fields)
+
+
+def decode_page(body: bytes) -> StudiesPage:
+    """
+    Decode a /studies response body straight into structs
+    """
+    return _page_decoder.decode(body)
+
+
+def decode_study(body: bytes) -> Study:
+    """
+    Decode a single study document (e.g. one file of a .zip export)
+    """
+    return _study_decoder.decode(body)
+
+
+def to_study(doc: Any) -> Study:
+    """
+    Convert an already-parsed study document (dict) into a Study
+    """
+    return msgspec.convert(doc, Study)
@@ -0,0 +1,113 @@
+# source/modules/trails/eligibility.py
+"""
+Structured eligibility extracted from CT.gov eligibilityModule at ingest.
+
+Ages become years (float), sex one of ALL / FEMALE / MALE, and the free
+text criteria a short sorted list of keywords per section (inclusion /
+exclusion), so candidates can be prefiltered against a patient profile
+without parsing text at query time.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+from .ctgov import EligibilityModule
+
+MAX_CRITERIA_KEYWORDS = 64
+"""Keywords kept per criteria section (most frequent first, then alphabetical)"""
+
+SEXES = ("ALL", "FEMALE", "MALE")
+
+_AGE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([a-z]+)", re.IGNORECASE)
+
+# Years per unit ("18 Years", "6 Months", "28 Days", ...)
+_AGE_UNITS = {
+    "year": 1.0,
+    "month": 1.0 / 12,
+    "week": 7.0 / 365.25,
+    "day": 1.0 / 365.25,
+    "hour": 1.0 / (365.25 * 24),
+    "minute": 1.0 / (365.25 * 24 * 60),
+}
+
+_EXCLUSION_HEADER_RE = re.compile(r"^\s*exclusion criteria\s*:?", re.IGNORECASE | re.MULTILINE)
+_INCLUSION_HEADER_RE = re.compile(r"^\s*inclusion criteria\s*:?", re.IGNORECASE | re.MULTILINE)
+_WORD_RE = re.compile(r"[a-z][a-z0-9\-]{2,}")
+
+# Boilerplate of criteria text that says nothing about the patient
+_CRITERIA_STOP_WORDS = ENGLISH_STOP_WORDS | {
+    "criteria", "inclusion", "exclusion", "patient", "patients", "participant",
+    "participants", "subject", "subjects", "study", "must", "years", "year",
+    "age", "aged", "able", "including", "include", "history", "prior", "known",
+    "current", "currently", "following", "within", "days", "weeks", "months",
+    "least", "greater", "less", "than", "per", "investigator", "opinion",
+    "willing", "written", "informed", "consent", "provide", "sign", "signed",
+}
+
+
+def parse_age_years(value: Optional[str]) -> Optional[float]:
+    """
+    "18 Years" -> 18.0, "6 Months" -> 0.5; None when missing or unparseable
+    ("N/A" means no limit).
+    """
+    if not value:
+        return None
+    match = _AGE_RE.match(value)
+    if not match:
+        return None
+    unit = match.group(2).lower().rstrip("s")
+    factor = _AGE_UNITS.get(unit)
+    if factor is None:
+        return None
+    return round(float(match.group(1)) * factor, 4)
+
+
+def normalize_sex(value: Optional[str]) -> Optional[str]:
+    value = (value or "").strip().upper()
+    return value if value in SEXES else None
+
+
+def split_criteria(text: Optional[str]) -> Tuple[str, str]:
+    """
+    Split eligibilityCriteria into (inclusion, exclusion) text. Text without
+    an "Exclusion Criteria" header is all inclusion.
+    """
+    text = text or ""
+    exclusion_at = _EXCLUSION_HEADER_RE.search(text)
+    if exclusion_at is None:
+        inclusion, exclusion = text, ""
+    else:
+        inclusion, exclusion = text[:exclusion_at.start()], text[exclusion_at.end():]
+    inclusion = _INCLUSION_HEADER_RE.sub("", inclusion, count=1)
+    return inclusion, exclusion
+
+
+def criteria_keywords(text: str, max_keywords: int = MAX_CRITERIA_KEYWORDS) -> List[str]:
+    """
+    Distinct content words of a criteria section, most frequent first.
+    """
+    counts: Dict[str, int] = {}
+    for word in _WORD_RE.findall(text.lower()):
+        word = word.strip("-")
+        if len(word) < 3 or word in _CRITERIA_STOP_WORDS:
+            continue
+        counts[word] = counts.get(word, 0) + 1
+    ranked = sorted(counts, key=lambda w: (-counts[w], w))
+    return ranked[:max_keywords]
+
+
+def extract_eligibility(module: EligibilityModule) -> Dict[str, Any]:
+    """
+    Map an eligibilityModule to the eligibility columns of a `trials` row.
+    """
+    inclusion, exclusion = split_criteria(module.eligibility_criteria)
+    return {
+        "min_age_years": parse_age_years(module.minimum_age),
+        "max_age_years": parse_age_years(module.maximum_age),
+        "sex": normalize_sex(module.sex),
+        "healthy_volunteers": module.healthy_volunteers,
+        "inclusion_keywords": criteria_keywords(inclusion),
+        "exclusion_keywords": criteria_keywords(exclusion),
+    }
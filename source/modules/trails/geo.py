@@ -0,0 +1,309 @@
+# source/modules/trails/geo.py
+"""
+Distance helpers for trial sites (vectorized with numpy) and the geohash
+grid used to index trial coordinates with a plain B-tree.
+"""
+
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .model import Trial
+
+EARTH_RADIUS_KM = 6371.0088
+
+_COORDS_RE = re.compile(r"^\s*(-?\d{1,2}(?:\.\d+)?)\s*[, ]\s*(-?\d{1,3}(?:\.\d+)?)\s*$")
+
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9  # stored on trials.geohash (~4.8m x 4.8m cells)
+GEOHASH_MAX_CELLS = 16  # cells scanned per box; the finest precision that fits is used
+
+BBox = Tuple[float, float, float, float]  # (min_lat, min_lng, max_lat, max_lng)
+
+
+def haversine_km(
+    lat: float,
+    lng: float,
+    lats: np.ndarray,
+    lngs: np.ndarray,
+) -> np.ndarray:
+    """
+    Great-circle distance (km) from one point to arrays of points.
+    """
+    lat1 = np.radians(lat)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    dlat = lat2 - lat1
+    dlng = np.radians(np.asarray(lngs, dtype=np.float64) - lng)
+    a = np.sin(dlat / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _site_label(site: Dict[str, Any]) -> Optional[str]:
+    parts = [site.get("facility"), site.get("city"), site.get("state"), site.get("country")]
+    label = ", ".join(p for p in parts if p)
+    return label or None
+
+
+def trial_sites(trial: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Sites with coordinates; falls back to the trial's representative lat/lng.
+    """
+    sites = [
+        s for s in (trial.get("sites") or [])
+        if s and s.get("lat") is not None and s.get("lng") is not None
+    ]
+    if not sites and trial.get("lat") is not None and trial.get("lng") is not None:
+        sites = [{
+            "lat": trial["lat"],
+            "lng": trial["lng"],
+            "city": trial.get("city"),
+            "state": trial.get("state"),
+            "country": trial.get("country"),
+        }]
+    return sites
+
+
+def nearest_sites(
+    lat: float,
+    lng: float,
+    trials: List[Dict[str, Any]],
+) -> List[Tuple[Optional[float], Optional[Dict[str, Any]]]]:
+    """
+    Nearest site of each trial, with all sites of all trials measured in
+    a single vectorized haversine call.
+
+    Returns:
+        list: (distance_km, site) per trial; (None, None) without coordinates
+    """
+    owners: List[int] = []
+    flat_sites: List[Dict[str, Any]] = []
+    for i, trial in enumerate(trials):
+        for site in trial_sites(trial):
+            owners.append(i)
+            flat_sites.append(site)
+
+    result: List[Tuple[Optional[float], Optional[Dict[str, Any]]]] = [(None, None)] * len(trials)
+    if not flat_sites:
+        return result
+
+    owner_arr = np.asarray(owners, dtype=np.int64)
+    dists = haversine_km(
+        lat,
+        lng,
+        np.fromiter((float(s["lat"]) for s in flat_sites), dtype=np.float64, count=len(flat_sites)),
+        np.fromiter((float(s["lng"]) for s in flat_sites), dtype=np.float64, count=len(flat_sites)),
+    )
+
+    # Sites are grouped by owner, so each trial is one contiguous segment
+    starts = np.flatnonzero(np.r_[True, owner_arr[1:] != owner_arr[:-1]])
+    seg_min = np.minimum.reduceat(dists, starts)
+    seg_len = np.diff(np.r_[starts, len(dists)])
+    is_min = dists == np.repeat(seg_min, seg_len)
+
+    for start, length, best in zip(starts.tolist(), seg_len.tolist(), seg_min.tolist()):
+        offset = int(np.argmax(is_min[start: start + length]))
+        result[owners[start]] = (best, flat_sites[start + offset])
+    return result
+
+
+def annotate_distances(lat: float, lng: float, trials: List[Dict[str, Any]]):
+    """
+    Set distance_km / nearest_site on each trial dict (None when unknown).
+    """
+    for trial, (distance, site) in zip(trials, nearest_sites(lat, lng, trials)):
+        trial["distance_km"] = round(distance, 1) if distance is not None else None
+        trial["nearest_site"] = _site_label(site) if site else None
+
+
+def parse_coordinates(text: Optional[str]) -> Optional[Tuple[float, float]]:
+    """
+    "35.22, -80.84" -> (35.22, -80.84); None for anything else.
+    """
+    if not text:
+        return None
+    match = _COORDS_RE.match(text)
+    if not match:
+        return None
+    lat, lng = float(match.group(1)), float(match.group(2))
+    if -90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0:
+        return lat, lng
+    return None
+
+
+def resolve_location(db: Session, text: Optional[str]) -> Optional[Tuple[float, float]]:
+    """
+    Coordinates for a free-text location.
+
+    Accepts "lat, lng" directly; otherwise the leading "City[, State]" part
+    is looked up among the geocoded trials in the mirror (no external
+    geocoding service on the hot path).
+    """
+    coords = parse_coordinates(text)
+    if coords or not text:
+        return coords
+
+    parts = [p.strip().lower() for p in text.split(",") if p.strip()]
+    if not parts:
+        return None
+
+    stmt = select(func.avg(Trial.latitude), func.avg(Trial.longitude)).where(
+        func.lower(Trial.city) == parts[0],
+        Trial.latitude.is_not(None),
+        Trial.longitude.is_not(None),
+    )
+    if len(parts) > 1:
+        stmt = stmt.where(
+            (func.lower(Trial.state) == parts[1]) | (func.lower(Trial.country) == parts[1])
+        )
+
+    lat, lng = db.execute(stmt).one()
+    if lat is None or lng is None:
+        return None
+    return float(lat), float(lng)
+
+
+# -------------------------
+# Geohash grid
+# -------------------------
+def _geohash_bits(precision: int) -> Tuple[int, int]:
+    """
+    (lat_bits, lng_bits) of a geohash; longitude takes the extra bit.
+    """
+    total = 5 * precision
+    return total // 2, (total + 1) // 2
+
+
+def _cell_index(value: float, lo: float, span: float, bits: int) -> int:
+    n = 1 << bits
+    return min(max(int(math.floor((value - lo) / span * n)), 0), n - 1)
+
+
+def _cell_hash(lat_idx: int, lng_idx: int, precision: int) -> str:
+    """
+    Interleave the grid indexes (longitude first) into a base32 geohash.
+    """
+    lat_bits, lng_bits = _geohash_bits(precision)
+    value = 0
+    for b in range(5 * precision):
+        if b % 2 == 0:
+            bit = (lng_idx >> (lng_bits - 1 - b // 2)) & 1
+        else:
+            bit = (lat_idx >> (lat_bits - 1 - b // 2)) & 1
+        value = (value << 1) | bit
+    return "".join(
+        GEOHASH_BASE32[(value >> (5 * (precision - 1 - c))) & 31] for c in range(precision)
+    )
+
+
+def geohash_encode(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    """
+    Standard geohash of a point.
+    """
+    lat_bits, lng_bits = _geohash_bits(precision)
+    return _cell_hash(
+        _cell_index(lat, -90.0, 180.0, lat_bits),
+        _cell_index(lng, -180.0, 360.0, lng_bits),
+        precision,
+    )
+
+
+def radius_bbox(lat: float, lng: float, radius_km: float) -> BBox:
+    """
+    Bounding box of a circle; spans all longitudes near the poles and may
+    cross the antimeridian (min_lng > max_lng).
+    """
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = lat - dlat, lat + dlat
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        return max(min_lat, -90.0), -180.0, min(max_lat, 90.0), 180.0
+
+    # Widest longitude extent of the circle (at its tangent latitude)
+    ratio = math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat))
+    if ratio >= 1.0:
+        return min_lat, -180.0, max_lat, 180.0
+    dlng = math.degrees(math.asin(ratio))
+
+    min_lng, max_lng = lng - dlng, lng + dlng
+    if min_lng < -180.0:
+        min_lng += 360.0
+    if max_lng > 180.0:
+        max_lng -= 360.0
+    return min_lat, min_lng, max_lat, max_lng
+
+
+def _split_antimeridian(bbox: BBox) -> List[BBox]:
+    min_lat, min_lng, max_lat, max_lng = bbox
+    if min_lng <= max_lng:
+        return [bbox]
+    return [(min_lat, min_lng, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lng)]
+
+
+def covering_cells(bbox: BBox, max_cells: int = GEOHASH_MAX_CELLS) -> List[str]:
+    """
+    Geohash cells covering a bounding box, at the finest precision for which
+    at most `max_cells` cells are needed (a radius query usually ends up on
+    the cell containing the centre plus its neighbours).
+    """
+    boxes = _split_antimeridian(bbox)
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_bits, lng_bits = _geohash_bits(precision)
+        spans = []
+        count = 0
+        for min_lat, min_lng, max_lat, max_lng in boxes:
+            lat_range = (
+                _cell_index(min_lat, -90.0, 180.0, lat_bits),
+                _cell_index(max_lat, -90.0, 180.0, lat_bits),
+            )
+            lng_range = (
+                _cell_index(min_lng, -180.0, 360.0, lng_bits),
+                _cell_index(max_lng, -180.0, 360.0, lng_bits),
+            )
+            spans.append((lat_range, lng_range))
+            count += (lat_range[1] - lat_range[0] + 1) * (lng_range[1] - lng_range[0] + 1)
+
+        if count <= max_cells or precision == 1:
+            return sorted({
+                _cell_hash(i, j, precision)
+                for (lat0, lat1), (lng0, lng1) in spans
+                for i in range(lat0, lat1 + 1)
+                for j in range(lng0, lng1 + 1)
+            })
+    return []
+
+
+def geohash_ranges(cells: List[str]) -> List[Tuple[str, str]]:
+    """
+    Half-open [start, end) string ranges over full-precision geohashes for a
+    set of equal-length cells; cells adjacent in geohash order are merged so
+    each range is one B-tree index scan.
+    """
+    ranges: List[Tuple[str, str]] = []
+    prev_value: Optional[int] = None
+    for cell in sorted(cells):
+        value = 0
+        for ch in cell:
+            value = value * 32 + GEOHASH_BASE32.index(ch)
+        if ranges and prev_value is not None and value == prev_value + 1:
+            ranges[-1] = (ranges[-1][0], cell + "~")
+        else:
+            ranges.append((cell, cell + "~"))  # "~" sorts after every base32 char
+        prev_value = value
+    return ranges
+
+
+def in_bbox(bbox: BBox, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """
+    Mask of points inside a bounding box (antimeridian-aware).
+    """
+    min_lat, min_lng, max_lat, max_lng = bbox
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    mask = (lats >= min_lat) & (lats <= max_lat)
+    if min_lng <= max_lng:
+        return mask & (lngs >= min_lng) & (lngs <= max_lng)
+    return mask & ((lngs >= min_lng) | (lngs <= max_lng))
@@ -0,0 +1,382 @@
+# source/modules/trails/ingest.py
+"""
+Bulk ingestion of ClinicalTrials.gov studies into the local `trials` mirror.
+
+Studies can come from:
+  - the CT.gov API v2 (/studies, paged with nextPageToken), or
+  - a downloaded export: a .zip of per-study JSON files, a .json file
+    (a single study, a list of studies or an API page with "studies"),
+    or a .ndjson / .jsonl file with one study per line.
+
+Usage:
+    python -m source.modules.trails.ingest --file ctg-studies.json.zip
+    python -m source.modules.trails.ingest --api --query "breast cancer"
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import uuid
+import zipfile
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import msgspec
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from source.httpclient.service import http_get
+from source.logger import service as logger_service
+from .ctgov import (
+    INGEST_FIELDS,
+    DateStruct,
+    GeoPoint,
+    ProtocolSection,
+    Study,
+    decode_page,
+    decode_study,
+    fields_param,
+    to_study,
+)
+from .eligibility import extract_eligibility
+from .geo import geohash_encode
+from .model import Trial
+
+log = logger_service.get_logger(__name__)
+
+CTGOV_BASE_URL = "https://clinicaltrials.gov/api/v2/studies"
+CTGOV_MAX_PAGE_SIZE = 1000
+
+DEFAULT_BATCH_SIZE = 500
+
+# Columns refreshed on conflict (everything except id / nct_id / created_at)
+UPSERT_COLUMNS = [
+    "title",
+    "brief_title",
+    "summary",
+    "status",
+    "phase",
+    "study_type",
+    "conditions",
+    "sponsor",
+    "location",
+    "city",
+    "state",
+    "country",
+    "latitude",
+    "longitude",
+    "geohash",
+    "sites",
+    "url",
+    "last_update_date",
+    "min_age_years",
+    "max_age_years",
+    "sex",
+    "healthy_volunteers",
+    "inclusion_keywords",
+    "exclusion_keywords",
+    "content_hash",
+]
+
+
+# -------------------------
+# Study -> row mapping
+# -------------------------
+def _parse_ctgov_date(value: Optional[str]) -> Optional[date]:
+    """
+    CT.gov dates are "YYYY-MM-DD" or "YYYY-MM".
+    """
+    if not value:
+        return None
+    for fmt in ("%Y-%m-%d", "%Y-%m"):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def extract_sites(protocol: ProtocolSection) -> List[Dict[str, Any]]:
+    """
+    All study locations with their geoPoint coordinates (lat / lng may be None).
+    """
+    sites: List[Dict[str, Any]] = []
+    for loc in protocol.contacts_locations_module.locations:
+        geo = loc.geo_point or GeoPoint()
+        sites.append(
+            {
+                "facility": loc.facility,
+                "city": loc.city,
+                "state": loc.state,
+                "country": loc.country,
+                "zip": loc.zip,
+                "status": loc.status,
+                "lat": geo.lat,
+                "lng": geo.lon,
+            }
+        )
+    return sites
+
+
+def study_to_row(study: Study) -> Optional[Dict[str, Any]]:
+    """
+    Map one CT.gov v2 study to a `trials` row.
+
+    Returns None for documents without an NCT id.
+    """
+    protocol = study.protocol_section
+
+    ident = protocol.identification_module
+    desc = protocol.description_module
+    status_mod = protocol.status_module
+    design_mod = protocol.design_module
+    lead_sponsor = protocol.sponsor_collaborators_module.lead_sponsor
+
+    nct_id = ident.nct_id
+    if not nct_id:
+        return None
+
+    phase = ", ".join(design_mod.phases) if design_mod.phases else None
+
+    sites = extract_sites(protocol)
+
+    # Representative location: first site, preferring one with coordinates
+    rep = next((s for s in sites if s["lat"] is not None), sites[0] if sites else {})
+    parts = [p for p in [rep.get("city"), rep.get("state"), rep.get("country")] if p]
+
+    last_update = (status_mod.last_update_post_date_struct or DateStruct()).date
+
+    row = {
+        "nct_id": nct_id,
+        "title": (
+            ident.official_title
+            or ident.brief_title
+            or "Untitled clinical trial"
+        ),
+        "brief_title": ident.brief_title,
+        "summary": desc.brief_summary or desc.detailed_description or "",
+        "status": status_mod.overall_status,
+        "phase": phase,
+        "study_type": design_mod.study_type,
+        "conditions": list(protocol.conditions_module.conditions),
+        "sponsor": lead_sponsor.name if lead_sponsor else None,
+        "location": (", ".join(parts) if parts else None),
+        "city": rep.get("city"),
+        "state": rep.get("state"),
+        "country": rep.get("country"),
+        "latitude": rep.get("lat"),
+        "longitude": rep.get("lng"),
+        "geohash": (
+            geohash_encode(rep["lat"], rep["lng"])
+            if rep.get("lat") is not None and rep.get("lng") is not None
+            else None
+        ),
+        "sites": sites,
+        "url": f"https://clinicaltrials.gov/study/{nct_id}",
+        "last_update_date": _parse_ctgov_date(last_update),
+        **extract_eligibility(protocol.eligibility_module),
+    }
+    row["content_hash"] = row_content_hash(row)
+    return row
+
+
+def row_content_hash(row: Dict[str, Any]) -> str:
+    """
+    Stable sha256 of a mapped row; unchanged studies produce the same hash,
+    so re-syncing them can be skipped. Derived columns (geohash) are left
+    out so adding one does not invalidate every stored hash.
+    """
+    payload = {k: row.get(k) for k in UPSERT_COLUMNS if k not in ("content_hash", "geohash")}
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# -------------------------
+# Study sources
+# -------------------------
+def _studies_from_document(doc: Any) -> Iterator[Study]:
+    if isinstance(doc, list):
+        for item in doc:
+            yield from _studies_from_document(item)
+    elif isinstance(doc, dict):
+        if "studies" in doc:
+            for study in doc.get("studies") or []:
+                yield to_study(study)
+        elif "protocolSection" in doc:
+            yield to_study(doc)
+
+
+def iter_studies_from_file(path: str) -> Iterator[Study]:
+    """
+    Stream studies from a local export (.zip, .json, .ndjson / .jsonl).
+
+    Per-study .json files in a .zip are decoded straight into structs;
+    other documents are parsed first, since their shape varies.
+    """
+    lower = path.lower()
+    if lower.endswith(".zip"):
+        with zipfile.ZipFile(path) as zf:
+            for name in zf.namelist():
+                if not name.lower().endswith(".json"):
+                    continue
+                with zf.open(name) as fh:
+                    raw = fh.read()
+                try:
+                    study = decode_study(raw)
+                except msgspec.ValidationError:
+                    study = None
+                if study is not None and study.protocol_section.identification_module.nct_id:
+                    yield study
+                else:
+                    yield from _studies_from_document(msgspec.json.decode(raw))
+    elif lower.endswith((".ndjson", ".jsonl")):
+        with open(path, "rb") as fh:
+            for line in fh:
+                line = line.strip()
+                if line:
+                    yield from _studies_from_document(msgspec.json.decode(line))
+    else:
+        with open(path, "rb") as fh:
+            yield from _studies_from_document(msgspec.json.decode(fh.read()))
+
+
+def iter_studies_from_api(
+    query_term: Optional[str] = None,
+    page_size: int = CTGOV_MAX_PAGE_SIZE,
+    max_pages: Optional[int] = None,
+    extra_params: Optional[Dict[str, Any]] = None,
+) -> Iterator[Study]:
+    """
+    Stream studies from the CT.gov API v2, following nextPageToken.
+
+    Only INGEST_FIELDS are requested, and each page is decoded straight
+    into structs.
+    """
+    params: Dict[str, Any] = {
+        "format": "json",
+        "pageSize": min(page_size, CTGOV_MAX_PAGE_SIZE),
+        "fields": fields_param(INGEST_FIELDS),
+    }
+    if query_term:
+        params["query.term"] = query_term
+    if extra_params:
+        params.update(extra_params)
+
+    pages = 0
+    while True:
+        resp = http_get(CTGOV_BASE_URL, params=params)
+        resp.raise_for_status()
+        page = decode_page(resp.content)
+
+        yield from page.studies
+
+        pages += 1
+        token = page.next_page_token
+        if not token or (max_pages is not None and pages >= max_pages):
+            return
+        params["pageToken"] = token
+
+
+# -------------------------
+# Upsert
+# -------------------------
+def upsert_trials(
+    db: Session,
+    rows: List[Dict[str, Any]],
+    only_if_changed: bool = False,
+) -> int:
+    """
+    Insert or update a batch of rows in one statement (keyed on nct_id).
+
+    With only_if_changed, existing rows are only rewritten when their
+    content_hash differs.
+
+    Returns:
+        int: Number of rows inserted or updated
+    """
+    if not rows:
+        return 0
+
+    now = datetime.utcnow()
+    values = [{"id": uuid.uuid4(), "created_at": now, "modified_at": now, **r} for r in rows]
+
+    stmt = insert(Trial).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Trial.nct_id],
+        set_={**{c: stmt.excluded[c] for c in UPSERT_COLUMNS}, "modified_at": now},
+        where=(
+            Trial.content_hash.is_distinct_from(stmt.excluded.content_hash)
+            if only_if_changed
+            else None
+        ),
+    )
+    result = db.execute(stmt)
+    return result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(rows)
+
+
+def ingest_studies(
+    db: Session,
+    studies: Iterable[Study],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> int:
+    """
+    Map and upsert studies in batches, committing after each batch.
+
+    Returns:
+        int: Number of rows written
+    """
+    written = 0
+    batch: Dict[str, Dict[str, Any]] = {}
+
+    for study in studies:
+        row = study_to_row(study)
+        if row is None:
+            continue
+        # one row per nct_id per statement (ON CONFLICT cannot touch a row twice)
+        batch[row["nct_id"]] = row
+        if len(batch) >= batch_size:
+            written += upsert_trials(db, list(batch.values()))
+            db.commit()
+            batch = {}
+            log.info(f"ingest_studies: {written} trials written")
+
+    if batch:
+        written += upsert_trials(db, list(batch.values()))
+        db.commit()
+
+    log.info(f"ingest_studies: done, {written} trials written")
+    return written
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Load ClinicalTrials.gov studies into the trials mirror")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--file", help="Path to a .zip / .json / .ndjson export")
+    source.add_argument("--api", action="store_true", help="Page through the CT.gov API v2")
+    parser.add_argument("--query", default=None, help="Optional query.term filter (API only)")
+    parser.add_argument("--page-size", type=int, default=CTGOV_MAX_PAGE_SIZE)
+    parser.add_argument("--max-pages", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.file and not os.path.exists(args.file):
+        parser.error(f"file not found: {args.file}")
+
+    # Imported here so the mapping / file readers stay usable without a DB
+    from source.database.service import SessionLocal
+
+    if args.file:
+        studies = iter_studies_from_file(args.file)
+    else:
+        studies = iter_studies_from_api(args.query, args.page_size, args.max_pages)
+
+    db = SessionLocal()
+    try:
+        ingest_studies(db, studies, batch_size=args.batch_size)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 from __future__ import annotations
 import uuid
-from sqlalchemy import Column, String, Text, TIMESTAMP, Float
-from sqlalchemy.dialects.postgresql import UUID
+from datetime import date, datetime
+from typing import Any
+from sqlalchemy import Column, String, Text, TIMESTAMP, Float, Date, Computed, Index, Boolean
+from sqlalchemy.dialects.postgresql import ARRAY, UUID, JSONB, TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column
 from source.database.models import BaseDbModel, TimeStampMixin
 
@@ -18,6 +20,63 @@ class Trial(BaseDbModel, TimeStampMixin):
     # New fields for geolocation
     latitude: Mapped[float] = mapped_column(Float, nullable=True)
     longitude: Mapped[float] = mapped_column(Float, nullable=True)
+    # Geohash of (latitude, longitude); "C" collation so prefix ranges use the B-tree
+    geohash: Mapped[str | None] = mapped_column(String(12, collation="C"), nullable=True)
+
+    # ClinicalTrials.gov mirror fields (filled by trails/ingest.py)
+    brief_title: Mapped[str | None] = mapped_column(Text, nullable=True)
+    summary: Mapped[str | None] = mapped_column(Text, nullable=True)
+    conditions: Mapped[Any] = mapped_column(JSONB, nullable=True)  # list of condition names
+    phase: Mapped[str | None] = mapped_column(String(100), nullable=True)
+    study_type: Mapped[str | None] = mapped_column(String(50), nullable=True)
+    sponsor: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    city: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    state: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    country: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    sites: Mapped[Any] = mapped_column(JSONB, nullable=True)  # list of {facility, city, state, country, zip, status, lat, lng}
+    last_update_date: Mapped[date | None] = mapped_column(Date, nullable=True)
+    content_hash: Mapped[str | None] = mapped_column(String(64), nullable=True)  # sha256 of the mapped row
+
+    # Structured eligibility (trails/eligibility.py); NULL = no limit / unknown
+    min_age_years: Mapped[float | None] = mapped_column(Float, nullable=True)
+    max_age_years: Mapped[float | None] = mapped_column(Float, nullable=True)
+    sex: Mapped[str | None] = mapped_column(String(8), nullable=True)  # ALL | FEMALE | MALE
+    healthy_volunteers: Mapped[bool | None] = mapped_column(Boolean, nullable=True)
+    inclusion_keywords: Mapped[list[str] | None] = mapped_column(ARRAY(Text), nullable=True)
+    exclusion_keywords: Mapped[list[str] | None] = mapped_column(ARRAY(Text), nullable=True)
+
+    # Full-text search document, maintained by Postgres
+    search_vector: Mapped[Any] = mapped_column(
+        TSVECTOR,
+        Computed(
+            "to_tsvector('english', coalesce(title, '') || ' ' || coalesce(summary, '') "
+            "|| ' ' || coalesce(conditions::text, ''))",
+            persisted=True,
+        ),
+        nullable=True,
+    )
+
+    __table_args__ = (
+        Index("ix_trials_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_trials_geohash", "geohash"),
+        # delta re-matching reads the rows changed since its last run
+        Index("ix_trials_modified_at", "modified_at"),
+    )
 
     def __repr__(self):
         return f"<Trial nct_id={self.nct_id} title='{self.title}'>"
+
+
+class TrialSyncState(BaseDbModel):
+    """
+    Watermark and last report of a mirror sync job (one row per job name).
+    """
+    __tablename__ = "trial_sync_state"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    watermark: Mapped[date | None] = mapped_column(Date, nullable=True)
+    last_run_at: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True), nullable=True)
+    last_report: Mapped[Any] = mapped_column(JSONB, nullable=True)
+
+    def __repr__(self):
+        return f"<TrialSyncState name={self.name} watermark={self.watermark}>"
@@ -0,0 +1,50 @@
+# source/modules/trails/router.py
+
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from source.database.service import get_db
+from source.modules.user.auth import get_current_user_id
+from .controller import get_nearby_trials
+from .schemas import NearbyTrialsResponse
+
+router = APIRouter(prefix="/api/trials", tags=["trials"])
+
+
+@router.get(
+    "/nearby",
+    response_model=NearbyTrialsResponse,
+    summary="Browse trials near a location",
+    description=(
+        "Trials within radius_km of lat/lng, or inside a bounding box "
+        "('min_lat,min_lng,max_lat,max_lng'), nearest first. "
+        "Optional status and phase filters (repeat or comma-separate values). "
+        "total is omitted for wide areas (a few hundred km and more)."
+    ),
+)
+def nearby_trials(
+    lat: Optional[float] = Query(default=None, ge=-90, le=90),
+    lng: Optional[float] = Query(default=None, ge=-180, le=180),
+    radius_km: Optional[float] = Query(default=None, gt=0, le=2000),
+    bbox: Optional[str] = Query(default=None),
+    status: Optional[List[str]] = Query(default=None),
+    phase: Optional[List[str]] = Query(default=None),
+    limit: int = Query(default=20, ge=1, le=200),
+    db: Session = Depends(get_db),
+    current_user_id: str = Depends(get_current_user_id),
+):
+    """
+    Geohash-indexed browse over the local trial mirror (no PostGIS needed).
+    """
+    return get_nearby_trials(
+        db,
+        lat=lat,
+        lng=lng,
+        radius_km=radius_km,
+        bbox=bbox,
+        statuses=status,
+        phases=phase,
+        limit=limit,
+    )
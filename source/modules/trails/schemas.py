@@ -0,0 +1,34 @@
+# source/modules/trails/schemas.py
+
+from pydantic import BaseModel
+from typing import List, Optional
+
+
+class NearbyTrial(BaseModel):
+    nct_id: str
+    title: Optional[str] = None
+    status: Optional[str] = None
+    phase: Optional[str] = None
+    conditions: Optional[List[str]] = None
+    sponsor: Optional[str] = None
+
+    location: Optional[str] = None
+    city: Optional[str] = None
+    state: Optional[str] = None
+    country: Optional[str] = None
+    lat: float
+    lng: float
+    distance_km: float  # from the query point (or the box centre)
+
+    url: Optional[str] = None
+
+
+class NearbyTrialsResponse(BaseModel):
+    lat: float
+    lng: float
+    radius_km: Optional[float] = None
+    bbox: Optional[List[float]] = None  # [min_lat, min_lng, max_lat, max_lng]
+    # trials in the area (None for wide areas, which are not counted);
+    # `trials` holds the nearest `limit` of them
+    total: Optional[int] = None
+    trials: List[NearbyTrial]
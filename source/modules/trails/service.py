@@ -0,0 +1,242 @@
+# source/modules/trails/service.py
+
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
+
+from .geo import BBox, covering_cells, geohash_ranges, haversine_km, in_bbox
+from .model import Trial
+
+# Columns needed to refine and render a nearby result (scalars only; the
+# conditions of the returned trials are loaded afterwards)
+_NEARBY_COLUMNS = (
+    Trial.nct_id,
+    Trial.title,
+    Trial.status,
+    Trial.phase,
+    Trial.sponsor,
+    Trial.location,
+    Trial.city,
+    Trial.state,
+    Trial.country,
+    Trial.latitude,
+    Trial.longitude,
+    Trial.url,
+)
+
+# Coarsest covering cells (geohash length) still refined exactly in numpy;
+# precision 3 cells are ~156 x 156 km, so a few hundred km around a point
+NEARBY_EXACT_MIN_PRECISION = 3
+
+# Wide areas: rows fetched per requested trial, ordered by approximate distance
+NEARBY_WIDE_CANDIDATE_FACTOR = 4
+
+
+def trial_to_dict(trial: Trial) -> Dict[str, Any]:
+    """
+    Map a mirror row into the trial dict shape used by the matching pipeline
+    (same keys as the CT.gov API mapping in matching/service.py).
+    """
+    return {
+        "nct_id": trial.nct_id,
+        "title": trial.title,
+        "summary": trial.summary or "",
+        "status": trial.status,
+        "phase": trial.phase,
+        "conditions": list(trial.conditions or []),
+        "sponsor": trial.sponsor,
+        "location": trial.location,
+        "city": trial.city,
+        "state": trial.state,
+        "country": trial.country,
+        "lat": trial.latitude,
+        "lng": trial.longitude,
+        "sites": list(trial.sites or []),
+        "min_age_years": trial.min_age_years,
+        "max_age_years": trial.max_age_years,
+        "sex": trial.sex,
+        "healthy_volunteers": trial.healthy_volunteers,
+        "inclusion_keywords": list(trial.inclusion_keywords or []),
+        "exclusion_keywords": list(trial.exclusion_keywords or []),
+        "url": trial.url or f"https://clinicaltrials.gov/study/{trial.nct_id}",
+        "google_maps_url": None,
+        "ai_generated": False,
+    }
+
+
+def search_trials_in_mirror(
+    db: Session,
+    query: str,
+    limit: int = 10,
+    where: Optional[List[ColumnElement]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Full-text search over the local mirror (title, summary, conditions),
+    ranked by ts_rank_cd on the GIN-indexed search_vector. Extra `where`
+    clauses (request filters) are applied in the same query.
+    """
+    if not query or not query.strip():
+        return []
+
+    ts_query = func.websearch_to_tsquery("english", query)
+    stmt = (
+        select(Trial)
+        .where(Trial.search_vector.op("@@")(ts_query), *(where or []))
+        .order_by(func.ts_rank_cd(Trial.search_vector, ts_query).desc())
+        .limit(limit)
+    )
+    return [trial_to_dict(t) for t in db.execute(stmt).scalars()]
+
+
+def get_trials_by_nct_ids(
+    db: Session,
+    nct_ids: List[str],
+    where: Optional[List[ColumnElement]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Load mirror rows for the given NCT ids in one query, preserving the
+    order of `nct_ids` (ids missing from the mirror, or rejected by the
+    `where` clauses, are skipped).
+    """
+    if not nct_ids:
+        return []
+
+    rows = db.execute(
+        select(Trial).where(Trial.nct_id.in_(nct_ids), *(where or []))
+    ).scalars()
+    by_id = {t.nct_id: t for t in rows}
+    return [trial_to_dict(by_id[n]) for n in nct_ids if n in by_id]
+
+
+def _nearby_filters(statuses: Optional[List[str]], phases: Optional[List[str]]) -> List[ColumnElement]:
+    clauses: List[ColumnElement] = []
+    if statuses:
+        clauses.append(func.upper(Trial.status).in_([s.upper() for s in statuses]))
+    if phases:
+        # phase holds CT.gov values joined with ", " (e.g. "PHASE2, PHASE3")
+        alternatives = "|".join(re.escape(p.upper()) for p in phases)
+        clauses.append(Trial.phase.op("~*")(f"(^|,\\s*)({alternatives})(,|$)"))
+    return clauses
+
+
+def _bbox_clause(bbox: BBox) -> ColumnElement:
+    """
+    Exact box test in SQL (antimeridian-aware, like geo.in_bbox).
+    """
+    min_lat, min_lng, max_lat, max_lng = bbox
+    lat_ok = Trial.latitude.between(min_lat, max_lat)
+    if min_lng <= max_lng:
+        return and_(lat_ok, Trial.longitude.between(min_lng, max_lng))
+    return and_(lat_ok, or_(Trial.longitude >= min_lng, Trial.longitude <= max_lng))
+
+
+def _approx_distance(origin: Tuple[float, float]) -> ColumnElement:
+    """
+    Squared equirectangular distance (degrees) from origin; orders rows
+    like the haversine distance, closely enough to pick candidates.
+    """
+    lat, lng = origin
+    dlng = func.abs(Trial.longitude - lng)
+    dlng = func.least(dlng, 360.0 - dlng)  # shorter way around the antimeridian
+    dlng = dlng * math.cos(math.radians(lat))
+    dlat = Trial.latitude - lat
+    return dlat * dlat + dlng * dlng
+
+
+def _attach_conditions(db: Session, trials: List[Dict[str, Any]]):
+    if not trials:
+        return
+    rows = db.execute(
+        select(Trial.nct_id, Trial.conditions).where(Trial.nct_id.in_([t["nct_id"] for t in trials]))
+    )
+    conditions = {nct_id: list(c or []) for nct_id, c in rows}
+    for t in trials:
+        t["conditions"] = conditions.get(t["nct_id"], [])
+
+
+def find_trials_nearby(
+    db: Session,
+    bbox: BBox,
+    origin: Tuple[float, float],
+    radius_km: Optional[float] = None,
+    statuses: Optional[List[str]] = None,
+    phases: Optional[List[str]] = None,
+    limit: int = 20,
+) -> Tuple[Optional[int], List[Dict[str, Any]]]:
+    """
+    Trials inside a bounding box (and radius, if given), nearest to `origin`
+    first.
+
+    Only the geohash cells covering the box are read (one B-tree range scan
+    per run of adjacent cells). When those cells are fine enough
+    (NEARBY_EXACT_MIN_PRECISION), every candidate is refined with the exact
+    box test / haversine distance in a single vectorized pass. For wider
+    areas the cells are too coarse to bound the rows read, so the box test,
+    an approximate distance ORDER BY and a LIMIT run in Postgres, and only
+    the nearest limit * NEARBY_WIDE_CANDIDATE_FACTOR rows are refined; the
+    trials in the area are then not counted.
+
+    Returns:
+        tuple: (number of trials in the area, or None for a wide area;
+            nearest `limit` trial dicts)
+    """
+    cells = covering_cells(bbox)
+    ranges = geohash_ranges(cells)
+    if not ranges:
+        return 0, []
+    wide = len(cells[0]) < NEARBY_EXACT_MIN_PRECISION
+
+    stmt = select(*_NEARBY_COLUMNS).where(
+        or_(*[and_(Trial.geohash >= start, Trial.geohash < end) for start, end in ranges]),
+        *_nearby_filters(statuses, phases),
+    )
+    if wide:
+        stmt = (
+            stmt.where(_bbox_clause(bbox))
+            .order_by(_approx_distance(origin))
+            .limit(limit * NEARBY_WIDE_CANDIDATE_FACTOR)
+        )
+
+    rows = db.execute(stmt).all()
+    if not rows:
+        return (None if wide else 0), []
+
+    lats = np.fromiter((r.latitude for r in rows), dtype=np.float64, count=len(rows))
+    lngs = np.fromiter((r.longitude for r in rows), dtype=np.float64, count=len(rows))
+    dists = haversine_km(origin[0], origin[1], lats, lngs)
+
+    mask = in_bbox(bbox, lats, lngs)
+    if radius_km is not None:
+        mask &= dists <= radius_km
+    idx = np.flatnonzero(mask)
+    total = None if wide else int(idx.size)
+
+    if idx.size > limit:
+        idx = idx[np.argpartition(dists[idx], limit - 1)[:limit]]
+    idx = idx[np.argsort(dists[idx], kind="stable")]
+
+    trials = []
+    for i in idx.tolist():
+        r = rows[i]
+        trials.append({
+            "nct_id": r.nct_id,
+            "title": r.title,
+            "status": r.status,
+            "phase": r.phase,
+            "sponsor": r.sponsor,
+            "location": r.location,
+            "city": r.city,
+            "state": r.state,
+            "country": r.country,
+            "lat": r.latitude,
+            "lng": r.longitude,
+            "distance_km": round(float(dists[i]), 1),
+            "url": r.url or f"https://clinicaltrials.gov/study/{r.nct_id}",
+        })
+    _attach_conditions(db, trials)
+    return total, trials
@@ -0,0 +1,249 @@
+# source/modules/trails/sync.py
+"""
+Incremental (delta) sync of the local `trials` mirror.
+
+Only studies whose LastUpdatePostDate is on or after the stored watermark
+are requested from CT.gov. Each batch is diffed against the stored
+content_hash, and only new or changed rows are upserted. A Postgres
+advisory lock makes sure only one worker / cron instance syncs at a time.
+
+Usage:
+    python -m source.modules.trails.sync
+    python -m source.modules.trails.sync --since 2025-01-01
+"""
+
+import argparse
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from source.logger import service as logger_service
+from source.metrics import service as metrics
+from .ctgov import Study
+from .ingest import iter_studies_from_api, study_to_row, upsert_trials
+from .model import Trial, TrialSyncState
+
+log = logger_service.get_logger(__name__)
+
+SYNC_JOB_NAME = "ctgov_delta"
+
+# Arbitrary constant identifying the mirror sync in pg_advisory_lock
+SYNC_ADVISORY_LOCK_KEY = 724_310_001
+
+DEFAULT_SYNC_BATCH_SIZE = 1000
+
+
+@dataclass
+class SyncReport:
+    """
+    Outcome of one delta sync run.
+    """
+    scanned: int = 0
+    changed: int = 0
+    written: int = 0
+    watermark_from: Optional[str] = None
+    watermark_to: Optional[str] = None
+    skipped_locked: bool = False
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class _PhaseTimer:
+    """
+    Accumulates wall time per phase (phases interleave while streaming).
+    """
+
+    def __init__(self, timings: Dict[str, float]):
+        self.timings = timings
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(
+                self.timings.get(name, 0.0) + time.perf_counter() - start, 4
+            )
+
+
+def _ctgov_delta_params(watermark: Optional[date]) -> Dict[str, Any]:
+    params: Dict[str, Any] = {"sort": "LastUpdatePostDate:asc"}
+    if watermark:
+        # Day granularity, so the watermark day itself is re-read; unchanged
+        # studies from that day are dropped by the content hash check.
+        params["filter.advanced"] = f"AREA[LastUpdatePostDate]RANGE[{watermark.isoformat()},MAX]"
+    return params
+
+
+def _existing_hashes(db: Session, nct_ids: List[str]) -> Dict[str, Optional[str]]:
+    rows = db.execute(
+        select(Trial.nct_id, Trial.content_hash).where(Trial.nct_id.in_(nct_ids))
+    )
+    return {nct_id: content_hash for nct_id, content_hash in rows}
+
+
+def _timed_studies(studies: Iterator[Study], timer: _PhaseTimer) -> Iterator[Study]:
+    """
+    Attribute time spent waiting for the next study (network + JSON parse)
+    to the fetch phase.
+    """
+    while True:
+        with timer.phase("fetch"):
+            study = next(studies, None)
+        if study is None:
+            return
+        yield study
+
+
+def _write_batch(
+    db: Session,
+    batch: Dict[str, Dict[str, Any]],
+    report: SyncReport,
+    timer: _PhaseTimer,
+):
+    with timer.phase("diff"):
+        existing = _existing_hashes(db, list(batch.keys()))
+        changed = [
+            row for nct_id, row in batch.items()
+            if existing.get(nct_id) != row["content_hash"]
+        ]
+    report.changed += len(changed)
+
+    with timer.phase("write"):
+        report.written += upsert_trials(db, changed, only_if_changed=True)
+        db.commit()
+
+
+def run_delta_sync(
+    db: Session,
+    since: Optional[date] = None,
+    batch_size: int = DEFAULT_SYNC_BATCH_SIZE,
+    max_pages: Optional[int] = None,
+) -> SyncReport:
+    """
+    Run one incremental sync of the trials mirror.
+
+    Args:
+        db (Session): App DB session
+        since (date): Override the stored watermark
+        batch_size (int): Rows per diff / upsert statement
+        max_pages (int): Optional cap on CT.gov pages (for smoke runs)
+
+    Returns:
+        SyncReport: Rows scanned / changed / written and per-phase timings
+    """
+    report = SyncReport()
+    timer = _PhaseTimer(report.timings)
+    total_start = time.perf_counter()
+
+    # Session-level advisory lock on a dedicated connection, so commits on
+    # the ORM session between batches cannot release it.
+    with db.get_bind().connect() as lock_conn:
+        with timer.phase("lock"):
+            locked = lock_conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": SYNC_ADVISORY_LOCK_KEY}
+            ).scalar()
+            lock_conn.commit()
+        if not locked:
+            log.info("run_delta_sync: another worker holds the sync lock, skipping")
+            report.skipped_locked = True
+            metrics.increment("trial_sync.skipped_locked")
+            return report
+
+        try:
+            state = db.get(TrialSyncState, SYNC_JOB_NAME)
+            watermark = since or (state.watermark if state else None)
+            report.watermark_from = watermark.isoformat() if watermark else None
+            new_watermark = watermark
+
+            studies = iter_studies_from_api(
+                max_pages=max_pages, extra_params=_ctgov_delta_params(watermark)
+            )
+
+            batch: Dict[str, Dict[str, Any]] = {}
+            for study in _timed_studies(studies, timer):
+                with timer.phase("map"):
+                    row = study_to_row(study)
+                if row is None:
+                    continue
+                report.scanned += 1
+                batch[row["nct_id"]] = row
+
+                updated = row["last_update_date"]
+                if updated and (new_watermark is None or updated > new_watermark):
+                    new_watermark = updated
+
+                if len(batch) >= batch_size:
+                    _write_batch(db, batch, report, timer)
+                    batch = {}
+
+            if batch:
+                _write_batch(db, batch, report, timer)
+
+            report.watermark_to = new_watermark.isoformat() if new_watermark else None
+
+            with timer.phase("state"):
+                if state is None:
+                    state = TrialSyncState(name=SYNC_JOB_NAME)
+                    db.add(state)
+                state.watermark = new_watermark
+                state.last_run_at = datetime.now(timezone.utc)
+                db.commit()
+
+            # Total last, so it (and the stored report) covers the state write
+            report.timings["total"] = round(time.perf_counter() - total_start, 4)
+            state.last_report = report.to_dict()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            lock_conn.execute(
+                text("SELECT pg_advisory_unlock(:key)"), {"key": SYNC_ADVISORY_LOCK_KEY}
+            )
+            lock_conn.commit()
+
+    metrics.increment("trial_sync.scanned", report.scanned)
+    metrics.increment("trial_sync.changed", report.changed)
+    metrics.increment("trial_sync.written", report.written)
+    for phase, seconds in report.timings.items():
+        metrics.set_gauge("trial_sync.last_phase_seconds", seconds, phase=phase)
+
+    log.info(
+        f"run_delta_sync: scanned={report.scanned} changed={report.changed} "
+        f"written={report.written} watermark={report.watermark_from}->{report.watermark_to} "
+        f"timings={report.timings}"
+    )
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Incremental sync of the trials mirror from CT.gov")
+    parser.add_argument("--since", type=date.fromisoformat, default=None,
+                        help="Override the stored watermark (YYYY-MM-DD)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_SYNC_BATCH_SIZE)
+    parser.add_argument("--max-pages", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    from source.database.service import SessionLocal
+
+    db = SessionLocal()
+    try:
+        report = run_delta_sync(
+            db, since=args.since, batch_size=args.batch_size, max_pages=args.max_pages
+        )
+        print(report.to_dict())
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
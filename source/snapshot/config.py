@@ -0,0 +1,25 @@
+"""
+Snapshot configuration
+"""
+
+from pydantic_settings import BaseSettings
+
+
+class SnapshotConfig(BaseSettings):
+    """
+    Memory-mapped search index / model snapshots
+    """
+
+    SNAPSHOT_DIR: str = ".cache/snapshots"
+    """Root directory; one sub-directory per snapshot kind (bm25, tfidf, ...)"""
+
+    SNAPSHOT_KEEP_GENERATIONS: int = 2
+    """Published generations kept on disk (older ones are deleted)"""
+
+    SNAPSHOT_CHECK_INTERVAL_SECONDS: float = 30.0
+    """How often a worker checks whether a newer generation was published"""
+
+    class Config:
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        extra = "ignore"
@@ -0,0 +1,395 @@
+"""
+Memory-mapped snapshots of search indexes and models
+
+Every uvicorn / gunicorn worker opens the same snapshot file with mmap and
+wraps its arrays as read-only numpy views, so loading only parses a small
+header and the pages are shared through the OS page cache (RSS does not
+grow with the number of workers).
+
+File layout:
+    magic (8 bytes) | header length (uint32 LE) | JSON header | arrays
+
+The header records the file format version, the snapshot kind and its
+schema version, the generation, free-form metadata and, per array, dtype,
+shape and offset. Arrays start on 64-byte boundaries.
+
+Publishing writes `<kind>/gen-<n>.snap` and then atomically replaces the
+`<kind>/CURRENT` pointer file; workers pick the new generation up on their
+next check, while requests still using the old one keep a valid mapping.
+"""
+
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Generic, List, Optional, Sequence, TypeVar
+
+import numpy as np
+
+from source.logger import service as logger_service
+from source.metrics import service as metrics
+from source.snapshot.config import SnapshotConfig
+
+log = logger_service.get_logger(__name__)
+
+snapshot_settings = SnapshotConfig()
+
+SNAPSHOT_MAGIC = b"CTMSNAP\0"
+SNAPSHOT_FORMAT_VERSION = 1
+"""Version of the container format itself (header + array layout)"""
+
+ARRAY_ALIGNMENT = 64
+CURRENT_POINTER = "CURRENT"
+
+_GENERATION_RE = re.compile(r"^gen-(\d+)\.snap$")
+
+T = TypeVar("T")
+
+
+class SnapshotError(Exception):
+    """
+    Snapshot file is missing, corrupt or of an unsupported version
+    """
+
+
+# -------------------------
+# Strings
+# -------------------------
+def encode_strings(values: Sequence[str]) -> np.ndarray:
+    """
+    Fixed-width UTF-8 bytes array (mmap-able, unlike an object array)
+    """
+    encoded = [v.encode("utf-8") for v in values]
+    width = max((len(v) for v in encoded), default=1) or 1
+    return np.array(encoded, dtype=f"S{width}")
+
+
+def string_lookup_arrays(name: str, values: Sequence[str]) -> Dict[str, np.ndarray]:
+    """
+    Arrays backing a StringLookup: the values in id order plus the
+    permutation that sorts them.
+    """
+    encoded = encode_strings(values)
+    return {name: encoded, f"{name}__order": np.argsort(encoded, kind="stable").astype(np.int64)}
+
+
+class StringLookup:
+    """
+    id <-> string mapping over snapshot arrays, without building a dict
+    (string -> id is a binary search through the stored sort order).
+    """
+
+    def __init__(self, values: np.ndarray, order: np.ndarray):
+        self.values = values
+        self.order = order
+
+    @classmethod
+    def from_snapshot(cls, snapshot: "Snapshot", name: str) -> "StringLookup":
+        return cls(snapshot.arrays[name], snapshot.arrays[f"{name}__order"])
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, i: int) -> str:
+        return self.values[i].decode("utf-8")
+
+    def get(self, key: str) -> Optional[int]:
+        ids = self.get_many([key])
+        return int(ids[0]) if ids[0] >= 0 else None
+
+    def get_many(self, keys: Sequence[str]) -> np.ndarray:
+        """
+        Ids of the given strings (-1 where missing)
+        """
+        if not keys or not len(self.values):
+            return np.full(len(keys), -1, dtype=np.int64)
+        encoded = np.array([k.encode("utf-8") for k in keys], dtype=self.values.dtype)
+        pos = np.searchsorted(self.values, encoded, sorter=self.order)
+        pos = np.minimum(pos, len(self.values) - 1)
+        ids = self.order[pos]
+        # keys longer than the stored width are truncated by the dtype above
+        found = (self.values[ids] == encoded) & np.array(
+            [len(k.encode("utf-8")) <= self.values.dtype.itemsize for k in keys]
+        )
+        return np.where(found, ids, -1)
+
+
+# -------------------------
+# Reading
+# -------------------------
+class Snapshot:
+    """
+    One opened snapshot generation; arrays are read-only views on the mmap
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            header = self._read_header()
+        except Exception:
+            self._mmap.close()
+            raise
+
+        self.kind: str = header["kind"]
+        self.schema_version: int = header["schema_version"]
+        self.generation: int = header["generation"]
+        self.created_at: str = header["created_at"]
+        self.meta: Dict[str, Any] = header.get("meta") or {}
+
+        self.arrays: Dict[str, np.ndarray] = {}
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            shape = tuple(spec["shape"])
+            count = int(np.prod(shape, dtype=np.int64))
+            if count == 0:
+                arr = np.empty(shape, dtype=dtype)
+            else:
+                arr = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=spec["offset"])
+            self.arrays[name] = arr.reshape(shape)
+
+    def _read_header(self) -> Dict[str, Any]:
+        prefix = len(SNAPSHOT_MAGIC) + 4
+        if len(self._mmap) < prefix or self._mmap[: len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise SnapshotError(f"{self.path}: not a snapshot file")
+        (header_len,) = struct.unpack("<I", self._mmap[len(SNAPSHOT_MAGIC): prefix])
+        header = json.loads(self._mmap[prefix: prefix + header_len].decode("utf-8"))
+        if header.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            raise SnapshotError(
+                f"{self.path}: format version {header.get('format_version')} "
+                f"(expected {SNAPSHOT_FORMAT_VERSION})"
+            )
+        return header
+
+    def __repr__(self):
+        return f"<Snapshot kind={self.kind} generation={self.generation} path={self.path}>"
+
+
+def _kind_dir(kind: str, root: Optional[str] = None) -> str:
+    return os.path.join(root or snapshot_settings.SNAPSHOT_DIR, kind)
+
+
+def current_snapshot_path(kind: str, root: Optional[str] = None) -> Optional[str]:
+    """
+    Path of the published generation of `kind` (None if nothing was published)
+    """
+    directory = _kind_dir(kind, root)
+    try:
+        with open(os.path.join(directory, CURRENT_POINTER), "r", encoding="utf-8") as fh:
+            name = fh.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(directory, name) if name else None
+
+
+def open_snapshot(kind: str, schema_version: int, root: Optional[str] = None) -> Optional[Snapshot]:
+    """
+    Open the published generation of `kind` (None if nothing was published)
+
+    Raises:
+        SnapshotError: The file is corrupt or was written with another
+            format / schema version
+    """
+    path = current_snapshot_path(kind, root)
+    if path is None:
+        return None
+    snapshot = Snapshot(path)
+    if snapshot.kind != kind or snapshot.schema_version != schema_version:
+        raise SnapshotError(
+            f"{path}: {snapshot.kind} v{snapshot.schema_version} "
+            f"(expected {kind} v{schema_version})"
+        )
+    return snapshot
+
+
+# -------------------------
+# Publishing
+# -------------------------
+def _generations(directory: str) -> List[int]:
+    if not os.path.isdir(directory):
+        return []
+    gens = []
+    for name in os.listdir(directory):
+        match = _GENERATION_RE.match(name)
+        if match:
+            gens.append(int(match.group(1)))
+    return sorted(gens)
+
+
+def _fsync_dir(directory: str):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _replace_durably(tmp_path: str, path: str):
+    os.replace(tmp_path, path)
+    _fsync_dir(os.path.dirname(path))
+
+
+def write_snapshot(
+    kind: str,
+    schema_version: int,
+    arrays: Dict[str, np.ndarray],
+    meta: Optional[Dict[str, Any]] = None,
+    root: Optional[str] = None,
+) -> Snapshot:
+    """
+    Write a new generation of `kind` and publish it atomically.
+
+    Args:
+        kind (str): Snapshot kind, e.g. "bm25"
+        schema_version (int): Version of the kind's array layout; readers
+            expecting another version refuse to load it
+        arrays (dict): name -> numeric or fixed-width bytes ndarray
+        meta (dict): JSON-serialisable metadata stored in the header
+
+    Returns:
+        Snapshot: The published generation, opened
+    """
+    directory = _kind_dir(kind, root)
+    os.makedirs(directory, exist_ok=True)
+
+    gens = _generations(directory)
+    generation = (gens[-1] + 1) if gens else 1
+    name = f"gen-{generation:06d}.snap"
+    path = os.path.join(directory, name)
+
+    specs: Dict[str, Dict[str, Any]] = {}
+    prepared: Dict[str, np.ndarray] = {}
+    for array_name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        if arr.dtype.hasobject:
+            raise SnapshotError(f"{kind}.{array_name}: object arrays cannot be memory-mapped")
+        prepared[array_name] = arr
+        specs[array_name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": 0}
+
+    header: Dict[str, Any] = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "kind": kind,
+        "schema_version": schema_version,
+        "generation": generation,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "meta": meta or {},
+        "arrays": specs,
+    }
+
+    # Offsets depend on the header size, which depends on the offsets'
+    # digits; reserve room by sizing the header with worst-case offsets.
+    for spec in specs.values():
+        spec["offset"] = 10 ** 15
+    reserved = len(json.dumps(header).encode("utf-8"))
+    offset = len(SNAPSHOT_MAGIC) + 4 + reserved
+    for array_name, arr in prepared.items():
+        offset += (-offset) % ARRAY_ALIGNMENT
+        specs[array_name]["offset"] = offset
+        offset += arr.nbytes
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b" " * (reserved - len(header_bytes))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(SNAPSHOT_MAGIC)
+        fh.write(struct.pack("<I", len(header_bytes)))
+        fh.write(header_bytes)
+        for array_name, arr in prepared.items():
+            fh.write(b"\0" * (specs[array_name]["offset"] - fh.tell()))
+            fh.write(arr.reshape(-1).view(np.uint8))
+        fh.flush()
+        os.fsync(fh.fileno())
+    _replace_durably(tmp_path, path)
+
+    pointer_tmp = os.path.join(directory, f"{CURRENT_POINTER}.tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as fh:
+        fh.write(name)
+        fh.flush()
+        os.fsync(fh.fileno())
+    _replace_durably(pointer_tmp, os.path.join(directory, CURRENT_POINTER))
+
+    _prune_generations(directory, keep=snapshot_settings.SNAPSHOT_KEEP_GENERATIONS)
+
+    metrics.increment("snapshot.published", kind=kind)
+    log.info(f"write_snapshot: published {kind} generation {generation} ({offset} bytes) -> {path}")
+    return Snapshot(path)
+
+
+def _prune_generations(directory: str, keep: int):
+    """
+    Delete old generations. Workers that still map one keep reading it
+    (the inode lives until the last mapping is closed).
+    """
+    for gen in _generations(directory)[: -max(keep, 1)]:
+        try:
+            os.remove(os.path.join(directory, f"gen-{gen:06d}.snap"))
+        except OSError as e:
+            log.warning(f"_prune_generations: could not remove generation {gen} - {e}")
+
+
+# -------------------------
+# Per-worker handles
+# -------------------------
+class SnapshotHandle(Generic[T]):
+    """
+    Lazily opens the published generation of a kind and wraps it with
+    `factory`. At most every SNAPSHOT_CHECK_INTERVAL_SECONDS the CURRENT
+    pointer is re-read and a newer generation swapped in; callers holding
+    the previous object keep using it until they are done.
+    """
+
+    def __init__(self, kind: str, schema_version: int, factory: Callable[[Snapshot], T]):
+        self.kind = kind
+        self.schema_version = schema_version
+        self.factory = factory
+        self._value: Optional[T] = None
+        self._path: Optional[str] = None
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[T]:
+        now = time.monotonic()
+        checked_at = self._checked_at
+        if checked_at is not None and now - checked_at < snapshot_settings.SNAPSHOT_CHECK_INTERVAL_SECONDS:
+            return self._value
+
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < snapshot_settings.SNAPSHOT_CHECK_INTERVAL_SECONDS:
+                return self._value
+            first_check = self._checked_at is None
+            self._checked_at = now
+
+            path = current_snapshot_path(self.kind)
+            if path == self._path:
+                if first_check:
+                    log.info(f"SnapshotHandle: no {self.kind} snapshot published")
+                return self._value
+
+            try:
+                start = time.perf_counter()
+                snapshot = open_snapshot(self.kind, self.schema_version)
+                value = self.factory(snapshot)
+            except Exception as e:
+                log.error(f"SnapshotHandle: could not load {self.kind} snapshot {path} - {e}")
+                return self._value
+
+            self._value, self._path = value, path
+            metrics.increment("snapshot.loaded", kind=self.kind)
+            metrics.set_gauge("snapshot.generation", snapshot.generation, kind=self.kind)
+            log.info(
+                f"SnapshotHandle: {self.kind} generation {snapshot.generation} mapped "
+                f"in {(time.perf_counter() - start) * 1000:.1f}ms"
+            )
+            return self._value
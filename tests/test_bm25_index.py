@@ -0,0 +1,111 @@
+# tests/test_bm25_index.py
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from source.modules.matching.bm25_index import (
+    BM25_B,
+    BM25_K1,
+    SNAPSHOT_KIND,
+    SNAPSHOT_SCHEMA_VERSION,
+    BM25Index,
+    build_bm25_arrays,
+    tokenize,
+)
+from source.snapshot.service import open_snapshot, write_snapshot
+
+# Zipf-like vocabulary: the first words end up as dense tf columns; "sparseword"
+# has postings gaps too wide for uint8 deltas
+VOCAB = [f"term{i}" for i in range(80)]
+WEIGHTS = [1.0 / (i + 1) for i in range(len(VOCAB))]
+QUERIES = [
+    "term0",
+    "term1 term5",
+    "term3 term40 term79",
+    "term0 term1 term2 term60",
+    "term12 term13 term14 term15 term16",
+    "term70 term0 unknownword",
+    "sparseword term2",
+    "unknownword",
+]
+
+
+def _corpus(n_docs=1500, seed=7):
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n_docs):
+        words = rng.choices(VOCAB, WEIGHTS, k=rng.randint(3, 40))
+        if i % 700 == 3:
+            words.append("sparseword")
+        docs.append((f"NCT{i:08d}", " ".join(words)))
+    return docs
+
+
+def _brute_force(docs, query, k1=BM25_K1, b=BM25_B):
+    tokenized = [Counter(tokenize(text)) for _, text in docs]
+    lengths = [sum(c.values()) for c in tokenized]
+    avgdl = sum(lengths) / len(lengths)
+    n = len(docs)
+    df = Counter(term for c in tokenized for term in c)
+    scores = {}
+    for (nct_id, _), counts, length in zip(docs, tokenized, lengths):
+        score = 0.0
+        for term in dict.fromkeys(tokenize(query)):
+            tf = counts.get(term, 0)
+            if not tf:
+                continue
+            idf = math.log1p((n - df[term] + 0.5) / (df[term] + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avgdl))
+        if score > 0:
+            scores[nct_id] = score
+    return scores
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    return _corpus()
+
+
+@pytest.fixture(scope="module")
+def index(corpus):
+    return BM25Index(build_bm25_arrays(corpus))
+
+
+def test_layout_covers_dense_and_wide_postings(index):
+    assert (index.term_dense_row >= 0).any()
+    assert (index.term_dense_row < 0).any()
+    assert (index.term_width > 1).any()
+
+
+@pytest.mark.parametrize("query", QUERIES)
+@pytest.mark.parametrize("k", [1, 10, 50])
+def test_search_matches_brute_force(corpus, index, query, k):
+    expected = _brute_force(corpus, query)
+    results = index.search(query, k=k)
+
+    assert len(results) == min(k, len(expected))
+    best = sorted(expected.values(), reverse=True)[:k]
+    assert [s for _, s in results] == pytest.approx(best, abs=1e-3)
+    for nct_id, score in results:
+        assert score == pytest.approx(expected[nct_id], abs=1e-3)
+
+
+def test_postings_decode_to_term_frequencies(corpus, index):
+    term = "sparseword"
+    docs, tfs = index.postings(index.terms.get(term))
+    expected = [(i, c[term]) for i, c in enumerate(Counter(tokenize(t)) for _, t in corpus) if term in c]
+    assert list(zip(docs.tolist(), tfs.astype(int).tolist())) == expected
+
+
+def test_snapshot_round_trip(corpus, tmp_path):
+    arrays = build_bm25_arrays(corpus)
+    write_snapshot(
+        SNAPSHOT_KIND, SNAPSHOT_SCHEMA_VERSION, arrays,
+        meta={"k1": BM25_K1, "b": BM25_B}, root=str(tmp_path),
+    )
+    mapped = BM25Index.from_snapshot(open_snapshot(SNAPSHOT_KIND, SNAPSHOT_SCHEMA_VERSION, root=str(tmp_path)))
+    in_memory = BM25Index(arrays)
+    for query in QUERIES:
+        assert mapped.search(query, k=20) == in_memory.search(query, k=20)
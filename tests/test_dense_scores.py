@@ -0,0 +1,85 @@
+# tests/test_dense_scores.py
+import numpy as np
+import pytest
+
+from source.modules.matching import embeddings
+from source.modules.matching.config import matching_settings
+from source.modules.matching.deadline import Deadline
+from source.modules.matching.embeddings import (
+    embedding_document_text,
+    semantic_score_matrix,
+    semantic_scores,
+)
+from source.modules.matching.service import _blend_dense
+
+
+class RecordingEncoder:
+    """
+    Every text maps to the same unit vector; the texts embedded are kept.
+    """
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts):
+        self.encoded.extend(texts)
+        return np.tile(np.array([1.0, 0.0], dtype=np.float32), (len(texts), 1))
+
+    def encode_query(self, query):
+        return np.array([1.0, 0.0], dtype=np.float32)
+
+
+@pytest.fixture
+def encoder(monkeypatch):
+    enc = RecordingEncoder()
+    monkeypatch.setattr(embeddings, "get_embedding_encoder", lambda: enc)
+    monkeypatch.setattr(embeddings, "get_embedding_index", lambda: None)
+    return enc
+
+
+def _trials(n):
+    return [
+        {"nct_id": f"NCT{i:08d}", "title": f"Trial {i}", "conditions": ["Asthma"], "summary": "Inhaled steroids."}
+        for i in range(n)
+    ]
+
+
+def test_blend_is_a_calibrated_weighted_sum(monkeypatch):
+    monkeypatch.setattr(matching_settings, "EMBEDDING_SIMILARITY_FLOOR", 0.2)
+    monkeypatch.setattr(matching_settings, "HYBRID_DENSE_WEIGHT", 0.4)
+    lexical = np.array([0.5, 0.5, 0.0, 0.3], dtype=np.float32)
+    dense = np.array([1.0, 0.2, 0.6, np.nan], dtype=np.float32)
+
+    blended = _blend_dense(lexical, dense)
+    assert blended.tolist() == pytest.approx([0.7, 0.3, 0.2, 0.3])
+    # an unrelated-looking dense score does not outrank a lexical match
+    assert blended[1] < lexical[1]
+
+
+def test_non_indexed_trials_use_the_index_document_text(encoder):
+    trials = _trials(2)
+    sims = semantic_scores("asthma", trials)
+    assert encoder.encoded == [
+        embedding_document_text(t["title"], t["conditions"], t["summary"]) for t in trials
+    ]
+    assert sims.tolist() == [1.0, 1.0]
+
+
+def test_encodes_are_capped_per_request(encoder, monkeypatch):
+    monkeypatch.setattr(matching_settings, "EMBEDDING_MAX_ENCODES", 3)
+    sims = semantic_scores("asthma", _trials(5))
+    assert len(encoder.encoded) == 3
+    assert sims[:3].tolist() == [1.0, 1.0, 1.0]
+    assert np.isnan(sims[3:]).all()
+
+    matrix = semantic_score_matrix(["asthma", "copd"], _trials(5))
+    assert matrix.shape == (2, 5)
+    assert np.isnan(matrix[:, 3:]).all() and not np.isnan(matrix[:, :3]).any()
+
+
+def test_nothing_is_encoded_after_the_deadline(encoder):
+    deadline = Deadline(0.0)
+    sims = semantic_scores("asthma", _trials(2), deadline)
+    assert encoder.encoded == []
+    assert np.isnan(sims).all()
+    assert deadline.skipped_sources == [embeddings.SOURCE_EMBEDDINGS]
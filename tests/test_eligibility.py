@@ -0,0 +1,92 @@
+# tests/test_eligibility.py
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from source.modules.matching.eligibility import PatientEligibility, eligibility_mask, filter_eligible
+from source.modules.trails.model import Trial
+
+TRIALS = [
+    {"nct_id": "ADULTS", "min_age_years": 18.0, "max_age_years": 65.0, "sex": "ALL"},
+    {"nct_id": "CHILDREN", "min_age_years": 0.5, "max_age_years": 17.0, "sex": "ALL"},
+    {"nct_id": "WOMEN", "min_age_years": 18.0, "max_age_years": None, "sex": "FEMALE"},
+    {"nct_id": "MEN", "min_age_years": None, "max_age_years": None, "sex": "MALE"},
+    {"nct_id": "UNKNOWN"},
+    {
+        "nct_id": "NO_DIABETES",
+        "sex": "ALL",
+        "inclusion_keywords": ["hypertension"],
+        "exclusion_keywords": ["diabetes", "insulin", "mellitus", "type"],
+    },
+    {
+        "nct_id": "DIABETES_STUDY",
+        "inclusion_keywords": ["diabetes", "mellitus", "type"],
+        "exclusion_keywords": ["diabetes", "pregnancy"],
+    },
+]
+
+
+def _eligible(patient):
+    return [t["nct_id"] for t, ok in zip(TRIALS, eligibility_mask(TRIALS, patient)) if ok]
+
+
+def test_age_limits_are_inclusive_and_unknown_limits_pass():
+    assert _eligible(PatientEligibility(age=18.0)) == [
+        "ADULTS", "WOMEN", "MEN", "UNKNOWN", "NO_DIABETES", "DIABETES_STUDY",
+    ]
+    assert _eligible(PatientEligibility(age=10.0)) == [
+        "CHILDREN", "MEN", "UNKNOWN", "NO_DIABETES", "DIABETES_STUDY",
+    ]
+    assert _eligible(PatientEligibility(age=70.0)) == [
+        "WOMEN", "MEN", "UNKNOWN", "NO_DIABETES", "DIABETES_STUDY",
+    ]
+
+
+def test_sex_matches_all_or_the_same_sex():
+    assert _eligible(PatientEligibility(sex="MALE")) == [
+        "ADULTS", "CHILDREN", "MEN", "UNKNOWN", "NO_DIABETES", "DIABETES_STUDY",
+    ]
+    assert _eligible(PatientEligibility(age=40.0, sex="FEMALE")) == [
+        "ADULTS", "WOMEN", "UNKNOWN", "NO_DIABETES", "DIABETES_STUDY",
+    ]
+
+
+def test_condition_excludes_only_when_not_also_included():
+    patient = PatientEligibility.from_profile_data({"conditions": ["Type 2 Diabetes Mellitus"]})
+    assert patient.conditions == (("diabetes", "mellitus", "type"),)
+    assert "NO_DIABETES" not in _eligible(patient)
+    assert "DIABETES_STUDY" in _eligible(patient)
+
+    # a condition is excluded only if all of its terms are
+    patient = PatientEligibility.from_profile_data({"conditions": ["Gestational diabetes"]})
+    assert "NO_DIABETES" in _eligible(patient)
+
+
+def test_from_profile_data():
+    assert PatientEligibility.from_profile_data(None) is None
+    assert PatientEligibility.from_profile_data({"gender": "prefer not to say"}) is None
+
+    patient = PatientEligibility.from_profile_data({"age": 52, "gender": "Woman", "conditions": ["", "Asthma"]})
+    assert patient == PatientEligibility(age=52, sex="FEMALE", conditions=(("asthma",),))
+    assert patient.cache_key() == [52, "FEMALE", [["asthma"]]]
+
+
+def test_filter_eligible_keeps_order():
+    assert filter_eligible(TRIALS, None) is TRIALS
+    assert filter_eligible([], PatientEligibility(age=30.0)) == []
+    kept = filter_eligible(TRIALS, PatientEligibility(age=30.0, sex="MALE"))
+    assert [t["nct_id"] for t in kept] == ["ADULTS", "MEN", "UNKNOWN", "NO_DIABETES", "DIABETES_STUDY"]
+
+
+def test_mirror_clauses_mirror_the_mask():
+    assert PatientEligibility().mirror_clauses() == []
+
+    patient = PatientEligibility(age=30.0, sex="MALE", conditions=(("diabetes",),))
+    sql = str(
+        select(Trial.nct_id).where(*patient.mirror_clauses())
+        .compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    )
+    assert "trials.min_age_years IS NULL OR trials.min_age_years <= 30.0" in sql
+    assert "trials.max_age_years IS NULL OR trials.max_age_years >= 30.0" in sql
+    assert "trials.sex IS NULL OR trials.sex IN ('ALL', 'MALE')" in sql
+    assert "trials.exclusion_keywords @> CAST(ARRAY['diabetes'] AS TEXT[])" in sql
+    assert "trials.inclusion_keywords @> CAST(ARRAY['diabetes'] AS TEXT[])" in sql
@@ -0,0 +1,100 @@
+# tests/test_geo.py
+import random
+
+import numpy as np
+import pytest
+
+from source.modules.trails.geo import (
+    GEOHASH_MAX_CELLS,
+    GEOHASH_PRECISION,
+    covering_cells,
+    geohash_encode,
+    geohash_ranges,
+    haversine_km,
+    in_bbox,
+    radius_bbox,
+)
+
+
+def _in_ranges(value, ranges):
+    return any(start <= value < end for start, end in ranges)
+
+
+def _random_points(bbox, rng, n=200):
+    min_lat, min_lng, max_lat, max_lng = bbox
+    if min_lng > max_lng:
+        max_lng += 360.0
+    for _ in range(n):
+        lng = rng.uniform(min_lng, max_lng)
+        yield rng.uniform(min_lat, max_lat), (lng - 360.0 if lng > 180.0 else lng)
+
+
+def test_geohash_encode_reference_values():
+    assert geohash_encode(42.6, -5.6, precision=5) == "ezs42"
+    assert geohash_encode(57.64911, 10.40744) == "u4pruydqq"
+    assert len(geohash_encode(0.0, 0.0)) == GEOHASH_PRECISION
+    # edges clamp into the last cell instead of overflowing
+    assert geohash_encode(90.0, 180.0) == "z" * GEOHASH_PRECISION
+    assert geohash_encode(-90.0, -180.0) == "0" * GEOHASH_PRECISION
+
+
+@pytest.mark.parametrize(
+    "bbox",
+    [
+        radius_bbox(35.2271, -80.8431, 25.0),  # Charlotte
+        radius_bbox(51.5072, -0.1276, 5.0),  # crosses the prime meridian
+        radius_bbox(-36.8485, 174.7633, 400.0),
+        (-10.0, 170.0, 10.0, -170.0),  # crosses the antimeridian
+        radius_bbox(89.5, 0.0, 100.0),  # reaches the pole
+        (-0.001, -0.001, 0.001, 0.001),
+    ],
+)
+def test_covering_cells_contain_every_point_of_the_box(bbox):
+    cells = covering_cells(bbox)
+    assert 0 < len(cells) <= GEOHASH_MAX_CELLS
+    assert len({len(c) for c in cells}) == 1
+
+    ranges = geohash_ranges(cells)
+    rng = random.Random(11)
+    for lat, lng in _random_points(bbox, rng):
+        assert in_bbox(bbox, np.array([lat]), np.array([lng]))[0]
+        assert _in_ranges(geohash_encode(lat, lng), ranges), (lat, lng)
+
+
+def test_covering_cells_use_the_finest_precision_that_fits():
+    bbox = radius_bbox(35.2271, -80.8431, 25.0)
+    cells = covering_cells(bbox)
+    finer = covering_cells(bbox, max_cells=10_000)
+    assert len(finer[0]) > len(cells[0])
+    # every finer cell lies inside one of the coarser cells
+    assert all(f[:len(cells[0])] in cells for f in finer)
+
+
+def test_geohash_ranges_merge_adjacent_cells():
+    # "9" and "b" are consecutive base32 digits; "d" is not next to "b"
+    assert geohash_ranges(["dn9", "dnb", "dnd"]) == [("dn9", "dnb~"), ("dnd", "dnd~")]
+    assert geohash_ranges(["dnd", "dn9"]) == [("dn9", "dn9~"), ("dnd", "dnd~")]
+    assert geohash_ranges([]) == []
+
+
+def test_in_bbox_handles_the_antimeridian():
+    bbox = (-10.0, 170.0, 10.0, -170.0)
+    lats = np.array([0.0, 0.0, 0.0, 20.0])
+    lngs = np.array([175.0, -175.0, 0.0, 175.0])
+    assert in_bbox(bbox, lats, lngs).tolist() == [True, True, False, False]
+
+
+def test_radius_bbox_contains_the_circle():
+    lat, lng, radius = 60.0, 25.0, 150.0
+    min_lat, min_lng, max_lat, max_lng = radius_bbox(lat, lng, radius)
+    bearings = np.linspace(0, 2 * np.pi, 360)
+    # destination points just inside the circle, one per bearing
+    d = radius / 6371.0088 * 0.999
+    lat1, lng1 = np.radians(lat), np.radians(lng)
+    lats = np.arcsin(np.sin(lat1) * np.cos(d) + np.cos(lat1) * np.sin(d) * np.cos(bearings))
+    lngs = lng1 + np.arctan2(
+        np.sin(bearings) * np.sin(d) * np.cos(lat1), np.cos(d) - np.sin(lat1) * np.sin(lats)
+    )
+    lats, lngs = np.degrees(lats), np.degrees(lngs)
+    assert np.all(haversine_km(lat, lng, lats, lngs) < radius)
+    assert in_bbox((min_lat, min_lng, max_lat, max_lng), lats, lngs).all()
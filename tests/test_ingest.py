@@ -0,0 +1,76 @@
+# tests/test_ingest.py
+from datetime import date
+
+from source.modules.trails.geo import geohash_encode
+from source.modules.trails.ingest import iter_studies_from_file, row_content_hash, study_to_row
+
+from conftest import FIXTURES
+
+
+def _rows():
+    return [study_to_row(s) for s in iter_studies_from_file(str(FIXTURES / "studies.json"))]
+
+
+def test_study_to_row_maps_columns():
+    rows = _rows()
+    assert len(rows) == 3
+    assert rows[2] is None  # no NCT id
+
+    row = rows[0]
+    assert row["nct_id"] == "NCT01000001"
+    assert row["title"] == "A Phase 2 Study of Metformin in Early Breast Cancer"
+    assert row["brief_title"] == "Metformin in Early Breast Cancer"
+    assert row["summary"] == "This study tests whether metformin slows tumour growth."
+    assert row["status"] == "RECRUITING"
+    assert row["phase"] == "PHASE2"
+    assert row["study_type"] == "INTERVENTIONAL"
+    assert row["conditions"] == ["Breast Cancer", "Obesity"]
+    assert row["sponsor"] == "Carolina Cancer Institute"
+    assert row["url"] == "https://clinicaltrials.gov/study/NCT01000001"
+    assert row["last_update_date"] == date(2026, 9, 30)
+
+    # representative location: the first site with coordinates
+    assert row["location"] == "Charlotte, North Carolina, United States"
+    assert (row["latitude"], row["longitude"]) == (35.22709, -80.84313)
+    assert row["geohash"] == geohash_encode(35.22709, -80.84313)
+    assert [s["facility"] for s in row["sites"]] == ["Mercy Clinic", "Atrium Health"]
+    assert row["sites"][0]["lat"] is None
+
+    assert row["min_age_years"] == 18.0
+    assert row["max_age_years"] == 75.0
+    assert row["sex"] == "FEMALE"
+    assert row["healthy_volunteers"] is False
+    assert "breast" in row["inclusion_keywords"]
+    assert "insulin" in row["exclusion_keywords"]
+    assert "insulin" not in row["inclusion_keywords"]
+
+
+def test_study_to_row_defaults():
+    row = _rows()[1]
+    assert row["title"] == "Sleep and Memory in Older Adults"
+    assert row["summary"] == "An observational study of sleep and memory."
+    assert row["phase"] is None
+    assert row["sponsor"] is None
+    assert row["location"] is None
+    assert row["geohash"] is None
+    assert row["sites"] == []
+    assert row["last_update_date"] is None
+    assert row["min_age_years"] == 65.0
+    assert row["max_age_years"] is None
+
+
+def test_content_hash_is_stable_without_geohash():
+    first = _rows()
+    second = _rows()
+    for a, b in zip(first[:2], second[:2]):
+        assert a["content_hash"] == b["content_hash"] == row_content_hash(a)
+
+    row = dict(first[0])
+    digest = row["content_hash"]
+    # geohash is derived, so neither dropping nor changing it moves the hash
+    assert row_content_hash({**row, "geohash": None}) == digest
+    assert row_content_hash({k: v for k, v in row.items() if k != "geohash"}) == digest
+    assert row_content_hash({**row, "geohash": "s00000000"}) == digest
+
+    assert row_content_hash({**row, "status": "COMPLETED"}) != digest
+    assert first[0]["content_hash"] != first[1]["content_hash"]
@@ -0,0 +1,118 @@
+# tests/test_match_history.py
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+
+# mappers referenced by TrialMatch relationships
+import source.modules.chatbot.model  # noqa: F401
+import source.modules.PatientProfile.model  # noqa: F401
+import source.modules.symptoms.model  # noqa: F401
+import source.modules.user.models  # noqa: F401
+from source.modules.matching.controller import (
+    _decode_history_cursor,
+    _encode_history_cursor,
+    get_match_history,
+)
+
+USER_ID = uuid.UUID("6f1c1f0e-2f53-4a53-9d5e-3a4f6f1b8c01")
+START = datetime(2026, 10, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class _Result:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def all(self):
+        return self._rows
+
+    def scalar_one(self):
+        return self._rows[0]
+
+
+class HistoryDB:
+    """
+    Evaluates the history queries over in-memory rows: the user filter,
+    the (created_at, id) keyset bound and the LIMIT are read back from the
+    compiled statement's parameters.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    def execute(self, stmt):
+        compiled = stmt.compile(dialect=postgresql.dialect())
+        self.statements.append(str(compiled))
+        params = list(compiled.params.values())
+        owner = params[0]
+        rows = [r for r in self.rows if r.user_id == owner]
+        if "count(*)" in str(compiled):
+            return _Result([len(rows)])
+
+        after = [p for p in params[1:] if isinstance(p, (datetime, uuid.UUID))]
+        if after:
+            rows = [r for r in rows if (r.created_at, r.id) < tuple(after)]
+        rows.sort(key=lambda r: (r.created_at, r.id), reverse=True)
+        return _Result(rows[:params[-1]])
+
+
+def _rows():
+    rows = []
+    for i in range(8):
+        # pairs of searches stored in the same instant, told apart by id
+        rows.append(SimpleNamespace(
+            id=uuid.UUID(int=i + 1),
+            user_id=USER_ID,
+            query_text=f"search {i}",
+            created_at=START + timedelta(minutes=i // 2),
+        ))
+    rows.append(SimpleNamespace(
+        id=uuid.UUID(int=99), user_id=uuid.uuid4(), query_text="someone else", created_at=START,
+    ))
+    return rows
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 10, 16, 9, 30, 15, 123456, tzinfo=timezone.utc)
+    match_id = uuid.uuid4()
+    cursor = _encode_history_cursor(created_at, match_id, 3)
+    assert "=" not in cursor
+    assert _decode_history_cursor(cursor) == (created_at, match_id, 3)
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "W10", "WyJ4IiwieSIsMV0"])
+def test_invalid_cursor_is_a_bad_request(cursor):
+    with pytest.raises(HTTPException) as exc:
+        _decode_history_cursor(cursor)
+    assert exc.value.status_code == 400
+
+
+def test_pages_walk_every_match_once_newest_first():
+    db = HistoryDB(_rows())
+    seen, page_numbers, cursor = [], [], None
+    while True:
+        page = get_match_history(db, str(USER_ID), page_size=3, cursor=cursor)
+        seen += [item.query_text for item in page.list_items]
+        page_numbers.append(page.page_number)
+        assert page.total_records is None and page.total_pages is None
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+
+    assert seen == [f"search {i}" for i in range(7, -1, -1)]
+    assert page_numbers == [1, 2, 3]
+    assert all("OFFSET" not in sql for sql in db.statements)
+
+
+def test_exact_last_page_has_no_cursor_and_total_is_opt_in():
+    db = HistoryDB(_rows())
+    first = get_match_history(db, str(USER_ID), page_size=4, include_total=True)
+    assert (first.total_records, first.total_pages) == (8, 2)
+    second = get_match_history(db, str(USER_ID), page_size=4, cursor=first.next_cursor)
+    assert [item.query_text for item in second.list_items] == ["search 3", "search 2", "search 1", "search 0"]
+    assert second.next_cursor is None
+    assert all(item.matched_trials is None for item in second.list_items)
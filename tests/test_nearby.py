@@ -0,0 +1,105 @@
+# tests/test_nearby.py
+import math
+import random
+from types import SimpleNamespace
+
+import numpy as np
+from sqlalchemy.dialects import postgresql
+
+from source.modules.trails.geo import geohash_encode, haversine_km, in_bbox, radius_bbox
+from source.modules.trails.service import NEARBY_WIDE_CANDIDATE_FACTOR, find_trials_nearby
+
+NORTH_AMERICA = (15.0, -130.0, 60.0, -60.0)
+
+
+def _table(n=5000, seed=3):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        lat, lng = rng.uniform(10.0, 65.0), rng.uniform(-140.0, -50.0)
+        rows.append(SimpleNamespace(
+            nct_id=f"NCT{i:08d}", title=f"Trial {i}", status="RECRUITING", phase=None,
+            sponsor=None, location=None, city=None, state=None, country=None,
+            latitude=lat, longitude=lng, url=None, geohash=geohash_encode(lat, lng),
+            conditions=["Asthma"],
+        ))
+    return rows
+
+
+class NearbyDB:
+    """
+    Runs the nearby queries over in-memory rows, the way Postgres would:
+    geohash ranges, the box test, the approximate-distance order and the
+    LIMIT are read back from the compiled statement.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+        self.rows_read = 0
+
+    def execute(self, stmt):
+        compiled = stmt.compile(dialect=postgresql.dialect())
+        sql = str(compiled)
+        self.statements.append(sql)
+        params = list(compiled.params.values())
+        if "trials.conditions" in sql:
+            wanted = set(params[0])
+            return [(r.nct_id, r.conditions) for r in self.rows if r.nct_id in wanted]
+
+        bounds = [p for p in params if isinstance(p, str)]
+        ranges = list(zip(bounds[::2], bounds[1::2]))
+        rows = [r for r in self.rows if any(a <= r.geohash < b for a, b in ranges)]
+        if "ORDER BY" in sql:
+            named = compiled.params
+            min_lat, max_lat = named["latitude_1"], named["latitude_2"]
+            min_lng, max_lng = named["longitude_1"], named["longitude_2"]
+            origin_lat, origin_lng = named["latitude_3"], named["longitude_3"]
+            rows = [r for r in rows if min_lat <= r.latitude <= max_lat and min_lng <= r.longitude <= max_lng]
+            cos_lat = math.cos(math.radians(origin_lat))
+            rows.sort(key=lambda r: (r.latitude - origin_lat) ** 2 + (cos_lat * (r.longitude - origin_lng)) ** 2)
+            rows = rows[:params[-1]]
+        self.rows_read += len(rows)
+        return SimpleNamespace(all=lambda: rows)
+
+
+def _nearest(rows, bbox, origin, limit, radius_km=None):
+    lats = np.array([r.latitude for r in rows])
+    lngs = np.array([r.longitude for r in rows])
+    dists = haversine_km(origin[0], origin[1], lats, lngs)
+    mask = in_bbox(bbox, lats, lngs)
+    if radius_km is not None:
+        mask &= dists <= radius_km
+    idx = np.flatnonzero(mask)
+    return [rows[i].nct_id for i in idx[np.argsort(dists[idx], kind="stable")][:limit]], int(idx.size)
+
+
+def test_continent_sized_bbox_does_not_read_the_whole_table():
+    rows = _table()
+    db = NearbyDB(rows)
+    origin = (37.5, -95.0)
+    total, trials = find_trials_nearby(db, NORTH_AMERICA, origin, limit=20)
+
+    assert total is None
+    assert db.rows_read == 20 * NEARBY_WIDE_CANDIDATE_FACTOR < len(rows)
+    main = db.statements[0]
+    assert "ORDER BY" in main and "LIMIT" in main
+    assert "trials.conditions" not in main
+
+    expected, _ = _nearest(rows, NORTH_AMERICA, origin, 20)
+    assert [t["nct_id"] for t in trials] == expected
+    assert all(t["conditions"] == ["Asthma"] for t in trials)
+
+
+def test_small_radius_is_refined_exactly_and_counted():
+    rows = _table()
+    db = NearbyDB(rows)
+    origin, radius = (40.0, -100.0), 150.0
+    bbox = radius_bbox(*origin, radius)
+    total, trials = find_trials_nearby(db, bbox, origin, radius_km=radius, limit=5)
+
+    expected, count = _nearest(rows, bbox, origin, 5, radius)
+    assert total == count > 5
+    assert [t["nct_id"] for t in trials] == expected
+    assert "ORDER BY" not in db.statements[0]
+    assert db.rows_read < len(rows) / 10
@@ -0,0 +1,68 @@
+# tests/test_search_coalescing.py
+import asyncio
+
+import pytest
+
+from source.coalesce.service import coalesce_settings
+from source.modules.matching import service
+from source.modules.matching.deadline import Deadline
+from source.modules.matching.service import SOURCE_CTGOV, _cut_short_for
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """
+    Fake fetch: slow, and skips CT.gov when the caller's deadline is short.
+    """
+    calls = []
+
+    async def afetch(query, desired_limit, filters, deadline):
+        calls.append(deadline)
+        await asyncio.sleep(0.05)
+        if deadline.remaining() < 1.0:
+            deadline.skip(SOURCE_CTGOV)
+            return [{"nct_id": "MIRROR"}]
+        return [{"nct_id": "MIRROR"}, {"nct_id": "CTGOV"}]
+
+    monkeypatch.setattr(service, "afetch_trials_with_fallbacks", afetch)
+    monkeypatch.setattr(coalesce_settings, "COALESCE_CROSS_WORKER", False)
+    return calls
+
+
+def _search(deadline):
+    return service.afetch_trials_coalesced("breast cancer", 10, None, deadline)
+
+
+async def _leader_then_follower(leader_deadline, follower_deadline):
+    leader = asyncio.ensure_future(_search(leader_deadline))
+    await asyncio.sleep(0)  # the leader claims the flight first
+    return await asyncio.gather(leader, _search(follower_deadline))
+
+
+def test_follower_with_a_longer_deadline_searches_on_its_own(upstream):
+    short, long = Deadline(0.2), Deadline(60.0)
+    leader, follower = asyncio.run(_leader_then_follower(short, long))
+
+    assert [t["nct_id"] for t in leader] == ["MIRROR"]
+    assert short.skipped_sources == [SOURCE_CTGOV]
+    assert [t["nct_id"] for t in follower] == ["MIRROR", "CTGOV"]
+    assert long.skipped_sources == []
+    assert len(upstream) == 2
+
+
+def test_follower_with_the_same_deadline_shares_the_flight(upstream):
+    first, second = Deadline(0.5), Deadline(0.5)
+    leader, follower = asyncio.run(_leader_then_follower(first, second))
+
+    assert leader == follower
+    assert second.skipped_sources == [SOURCE_CTGOV]
+    assert len(upstream) == 1
+
+
+def test_cut_short_for():
+    partial = {"trials": [], "skipped_sources": [SOURCE_CTGOV], "budget": 0.2}
+    assert _cut_short_for(partial, 5.0)
+    assert _cut_short_for(partial, None)
+    assert not _cut_short_for(partial, 0.25)
+    assert not _cut_short_for({**partial, "skipped_sources": []}, 5.0)
+    assert not _cut_short_for({**partial, "budget": None}, 5.0)
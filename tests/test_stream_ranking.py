@@ -0,0 +1,47 @@
+# tests/test_stream_ranking.py
+import pytest
+
+import source.modules.chatbot.model  # noqa: F401
+import source.modules.PatientProfile.model  # noqa: F401
+import source.modules.symptoms.model  # noqa: F401
+import source.modules.user.models  # noqa: F401
+from source.modules.matching import controller, service
+from source.modules.matching.controller import _IncrementalRanking
+from source.modules.matching.deadline import Deadline
+from source.modules.matching.schemas import TrialMatchRequest
+from source.modules.matching.service import compute_confidence_scores
+
+MIRROR = [
+    {"nct_id": "NCT1", "title": "Metformin in breast cancer", "summary": "Breast cancer and metformin."},
+    {"nct_id": "NCT2", "title": "Sleep in older adults", "summary": "Insomnia study."},
+]
+CTGOV = [
+    {"nct_id": "NCT3", "title": "Breast cancer exercise program", "summary": "Exercise after breast cancer."},
+    {"nct_id": "NCT4", "title": "Asthma inhalers", "summary": "Inhaled steroids for asthma."},
+]
+
+
+@pytest.fixture(autouse=True)
+def lexical_only(monkeypatch):
+    # no corpus TF-IDF snapshot, no embedding model
+    monkeypatch.setattr(controller, "get_tfidf_model", lambda: None)
+    monkeypatch.setattr(service, "get_tfidf_model", lambda: None)
+    monkeypatch.setattr(service, "semantic_scores", lambda query, trials, deadline=None: None)
+
+
+def _scores(trials):
+    return {t["nct_id"]: t["confidence_score"] for t in trials}
+
+
+def test_without_the_corpus_model_the_pool_is_scored_together():
+    request = TrialMatchRequest(query_text="breast cancer", limit=10)
+    ranking = _IncrementalRanking(request, 10, Deadline(60.0), None, None)
+
+    first = ranking.rank([dict(t) for t in MIRROR])
+    final = ranking.rank([dict(t) for t in MIRROR + CTGOV])
+
+    together = _scores(compute_confidence_scores("breast cancer", [dict(t) for t in MIRROR + CTGOV]))
+    assert _scores(final) == {k: v for k, v in together.items() if k in _scores(final)}
+    assert [t["nct_id"] for t in final] == sorted(_scores(final), key=lambda k: -together[k])
+    # the first batch alone was scored with another vocabulary
+    assert _scores(first)["NCT1"] != together["NCT1"]